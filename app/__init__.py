@@ -1,20 +1,63 @@
+import atexit
+
 import redis
 
 from app import logging, settings
 from app.bot.beer_bot import BeerBot
+from app.bot.conversation import LocalConversationStore, RedisConversationStore
+from app.bot.recorder import UpdateRecorder
+from app.bot.streams import UpdateStream
+from app.metrics import MetricsServer, QUEUE_SIZE
 from app.untappd.client import UntappdClient
-from app.untappd.scraper import UntappdScraper
+from app.untappd.scraper import AsyncUntappdScraper
 from app.untappd.api import UntappdAPI
-from app.untappd.cache import RedisCache
+from app.untappd.cache import TieredCache, LocalCache
+from app.untappd.search_index import SearchIndex
+from app.untappd.prefetch import Prefetcher
+from app.untappd.quota import QuotaManager
+from app.utils.fetch import HttpSession
+from app.utils.event_loop import EventLoopThread
 
 logging.init_log()
 
 redis_client = redis.Redis(host=settings.REDIS_URL, port=6379)  # type: ignore
 
-untapped_scrapper = UntappdScraper(timeout=10)
-untappd_api = UntappdAPI()
-untappd_cache = RedisCache(redis=redis_client)
-untapped_client = UntappdClient(scraper=untapped_scrapper, api=untappd_api, cache=redis_client)
-beer_bot = BeerBot(client=untapped_client)
+event_loop = EventLoopThread()
+http_session = HttpSession()
+untapped_scrapper = AsyncUntappdScraper(timeout=10, session=http_session)
+event_loop.add_shutdown_hook(http_session.close)
+untappd_quota = QuotaManager(redis=redis_client)
+untappd_api = UntappdAPI(session=http_session, quota=untappd_quota)
+untappd_cache = TieredCache(redis=redis_client, local=LocalCache(), index=SearchIndex(redis=redis_client))
+untapped_client = UntappdClient(
+    scraper=untapped_scrapper, api=untappd_api, cache=untappd_cache, runner=event_loop, quota=untappd_quota
+)
+prefetcher = Prefetcher(client=untapped_client, runner=event_loop)
+conversations = (
+    RedisConversationStore(redis=redis_client)
+    if settings.CONVERSATION_BACKEND == "redis"
+    else LocalConversationStore()
+)
+update_stream = UpdateStream(redis=redis_client)
+recorder = UpdateRecorder() if settings.RECORD_PATH else None
+beer_bot = BeerBot(
+    client=untapped_client,
+    prefetcher=prefetcher,
+    update_stream=update_stream,
+    conversations=conversations,
+    metrics_server=MetricsServer() if settings.METRICS_PORT else None,
+    recorder=recorder,
+)
+
+QUEUE_SIZE.set_function(lambda: event_loop.pending, queue="event_loop")
+QUEUE_SIZE.set_function(lambda: prefetcher.stats()["queue_size"], queue="prefetch")
+QUEUE_SIZE.set_function(beer_bot.dispatcher.update_queue.qsize, queue="updates")
+if settings.BOT_MODE in ("ingress", "worker"):
+    QUEUE_SIZE.set_function(update_stream.qsize, queue="stream")
+
+atexit.register(untapped_client.close)
+atexit.register(prefetcher.stop)
+if recorder is not None:
+    atexit.register(recorder.stop)
 
 __all__ = ["beer_bot"]
@@ -3,7 +3,7 @@ import sys
 import traceback
 from threading import Thread
 from requests import HTTPError
-from typing import List, TypeVar
+from typing import List, Optional, TypeVar
 
 from telegram.ext.dispatcher import run_async
 from telegram import Update, ParseMode, InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery
@@ -14,12 +14,18 @@ from telegram.ext import (
     MessageHandler,
     Filters,
     CallbackQueryHandler,
+    TypeHandler,
 )
 from telegram.utils.helpers import mention_html
 
 from app.logging import LoggerMixin
+from app.metrics import MetricsServer, timed, HANDLER_LATENCY, HANDLER_ERRORS
 from app.entities import Brewery, Beer, Contact, BeerList, BreweryShort
-from app.settings import TELEGRAM_TOKEN, admins, devs
+from app.settings import TELEGRAM_TOKEN, TELEGRAM_API_URL, BOT_MODE, WEBHOOK_URL, STREAM_MAXLEN, admins, devs
+from app.bot.conversation import ConversationStore, LocalConversationStore
+from app.bot.recorder import UpdateRecorder
+from app.bot.streams import UpdateStream, StreamWorker
+from app.bot.webhook import WebhookServer
 from app.utils.build_menu import build_menu
 from app.utils.restrict import restrict
 from app.utils.send_action import send_typing_action
@@ -30,10 +36,26 @@ TBeerBot = TypeVar("TBeerBot", bound="BeerBot")
 class BeerBot(LoggerMixin):
     """A class used as telegram bot which is chatting with users"""
 
-    def __init__(self, client) -> None:
+    def __init__(
+        self,
+        client,
+        prefetcher=None,
+        update_stream: Optional[UpdateStream] = None,
+        conversations: Optional[ConversationStore] = None,
+        metrics_server: Optional[MetricsServer] = None,
+        base_url: Optional[str] = TELEGRAM_API_URL,
+        recorder: Optional[UpdateRecorder] = None,
+    ) -> None:
         super().__init__()
         self._client = client
-        self.updater: Updater = Updater(token=TELEGRAM_TOKEN, use_context=True)
+        self._prefetcher = prefetcher
+        self._metrics_server = metrics_server
+        self._recorder = recorder
+        self._update_stream = update_stream
+        self._conversations = conversations if conversations is not None else LocalConversationStore()
+        self._webhook: Optional[WebhookServer] = None
+        self._worker: Optional[StreamWorker] = None
+        self.updater: Updater = Updater(token=TELEGRAM_TOKEN, base_url=base_url, use_context=True)
         self.dispatcher = self.updater.dispatcher
 
         # Commands
@@ -42,25 +64,76 @@ class BeerBot(LoggerMixin):
         self.select_info_handler: CallbackQueryHandler = CallbackQueryHandler(self._select_info, pattern="info")
         self.select_beer_handler: CallbackQueryHandler = CallbackQueryHandler(self._select_beer, pattern="beer")
         self.restart_handler: CommandHandler = CommandHandler("restart", self.restart)
+        self.stats_handler: CommandHandler = CommandHandler("stats", self.stats)
         self.unknown_handler: MessageHandler = MessageHandler(Filters.command, self._unknown)
 
         # Registered handlers
+        if self._recorder is not None:
+            self.dispatcher.add_handler(TypeHandler(Update, self._recorder.record), group=-1)
         self.dispatcher.add_handler(self.show_handler)
         self.dispatcher.add_handler(self.search_handler)
         self.dispatcher.add_handler(self.select_info_handler)
         self.dispatcher.add_handler(self.select_beer_handler)
         self.dispatcher.add_handler(self.restart_handler)
+        self.dispatcher.add_handler(self.stats_handler)
         self.dispatcher.add_handler(self.unknown_handler)
         self.dispatcher.add_error_handler(self.handle_error)
 
     def run(self):
-        """Public method to start a bot"""
-        self.updater.start_polling()
-        self.logger.info("Bot has been started")
+        """
+        Public method to start a bot, updates are received by long polling or by webhook according to settings.
+        In the ingress mode the webhook writes updates to the stream, and they are handled by processes
+        in the worker mode.
+        """
+        self._client.start()
+        if self._metrics_server is not None:
+            self._metrics_server.start()
+        if self._recorder is not None:
+            self._recorder.start()
+        if BOT_MODE == "webhook":
+            self._start_webhook(self.dispatcher.update_queue)
+            self._start_dispatcher()
+        elif BOT_MODE == "ingress":
+            self._start_webhook(self._get_update_stream(), max_queue=STREAM_MAXLEN)
+        elif BOT_MODE == "worker":
+            self._worker = StreamWorker(self._get_update_stream(), self.dispatcher, self.updater.bot)
+            self._start_dispatcher()
+            self._worker.start()
+        else:
+            self.updater.start_polling()
+        self.logger.info(f"Bot has been started in {BOT_MODE} mode")
+
+    def _get_update_stream(self) -> UpdateStream:
+        if self._update_stream is None:
+            raise RuntimeError(f"Update stream is required in {BOT_MODE} mode")
+        return self._update_stream
+
+    def _start_webhook(self, update_queue, **kwargs):
+        self._webhook = WebhookServer(self.updater.bot, update_queue, **kwargs)
+        if WEBHOOK_URL:
+            self._webhook.set_webhook(WEBHOOK_URL)
+        self._webhook.start()
+
+    def _start_dispatcher(self):
+        """Dispatcher thread runs the pool of `run_async` handlers, and it handles updates put to its queue"""
+        Thread(target=self.dispatcher.start, name="dispatcher", daemon=True).start()
 
     def stop_and_restart(self):
         """Gracefully stop the Updater and replace the current process with a new one"""
+        if self._webhook is not None:
+            self._webhook.stop()
+        if self._worker is not None:
+            self._worker.stop()
+        if self.dispatcher.running:
+            self.dispatcher.stop()
         self.updater.stop()
+        if self._prefetcher is not None:
+            self._prefetcher.stop()
+        if self._metrics_server is not None:
+            self._metrics_server.stop()
+        if self._recorder is not None:
+            self._recorder.stop()
+        self._client.close()
         os.execl(sys.executable, sys.executable, *sys.argv)
         self.logger.info("Bot has been restarted")
 
@@ -71,7 +144,19 @@ class BeerBot(LoggerMixin):
         Thread(target=self.stop_and_restart).start()
         update.message.reply_text("Bot is ready! 🤖")
 
+    @restrict(admins)
+    def stats(self, update: Update, context: CallbackContext) -> None:
+        """Public method to show cache statistics"""
+        stats = self._client.stats()
+        if self._prefetcher is not None:
+            stats.update({f"prefetch_{name}": value for name, value in self._prefetcher.stats().items()})
+        if self._worker is not None:
+            stats.update({f"stream_{name}": value for name, value in self._worker.stats().items()})
+        text = "\n".join(f"{name}: {round(value, 3)}" for name, value in stats.items()) or "No statistics"
+        context.bot.send_message(chat_id=update.effective_chat.id, text=text)
+
     @run_async
+    @timed(HANDLER_LATENCY, HANDLER_ERRORS, handler="list")
     @send_typing_action
     def _show_handlers(self, update: Update, context: CallbackContext) -> None:
         """Show all available commands"""
@@ -79,6 +164,7 @@ class BeerBot(LoggerMixin):
         context.bot.send_message(chat_id=update.effective_chat.id, text=text)
 
     @run_async
+    @timed(HANDLER_LATENCY, HANDLER_ERRORS, handler="unknown")
     @send_typing_action
     def _unknown(self, update: Update, context: CallbackContext) -> None:
         """Send message if command is unknown"""
@@ -88,6 +174,7 @@ class BeerBot(LoggerMixin):
         )
 
     @run_async
+    @timed(HANDLER_LATENCY, HANDLER_ERRORS, handler="search")
     @send_typing_action
     def _search_beer(self, update: Update, context: CallbackContext) -> None:
         """Search beer by name and show a result"""
@@ -103,7 +190,7 @@ class BeerBot(LoggerMixin):
             self.logger.info(f"Beer was not found {beer_name}")
             self._not_found(update, context)
 
-    @run_async
+    @timed(HANDLER_LATENCY, HANDLER_ERRORS, handler="not_found")
     @send_typing_action
     def _not_found(self, update: Update, context: CallbackContext) -> None:
         """Send message that noting was found"""
@@ -111,13 +198,13 @@ class BeerBot(LoggerMixin):
         text: str = "Nothing found"
         context.bot.send_message(chat_id=chat_id, text=text)
 
-    @run_async
+    @timed(HANDLER_LATENCY, HANDLER_ERRORS, handler="send_beer")
     @send_typing_action
     def _send_beer(self, update: Update, context: CallbackContext, beer: Beer) -> None:
         """Send prepared beer to user"""
         beer_id: str = beer.id
         text: str = self._parse_beer_to_html(beer)
-        self.put_beer_context(context, beer_id, beer)
+        self.put_beer_context(update, beer_id, beer)
         options: List[List[InlineKeyboardButton]] = [
             [
                 InlineKeyboardButton("Brewery", callback_data=f"info_{beer_id}_brewery"),
@@ -129,8 +216,10 @@ class BeerBot(LoggerMixin):
             chat_id=update.effective_chat.id, text=text, parse_mode=ParseMode.HTML, reply_markup=reply_markup,
         )
         self.logger.info(f"Beer was sent {beer_id}")
+        if self._prefetcher is not None:
+            self._prefetcher.submit(beer)
 
-    @run_async
+    @timed(HANDLER_LATENCY, HANDLER_ERRORS, handler="show_options")
     @send_typing_action
     def _show_options(self, update: Update, context: CallbackContext, beers: BeerList) -> None:
         """Send beer options to user"""
@@ -148,13 +237,14 @@ class BeerBot(LoggerMixin):
             )
 
     @run_async
+    @timed(HANDLER_LATENCY, HANDLER_ERRORS, handler="select_beer")
     @send_typing_action
     def _select_beer(self, update: Update, context: CallbackContext) -> None:
         """Handler for choosing beer from search results"""
         query: CallbackQuery = update.callback_query
         beer_id = int(query.data.replace("beer_", ""))
         try:
-            beer: Beer = self.get_beer_context(context, beer_id)
+            beer: Beer = self.get_beer_context(update, beer_id)
             if beer is None:
                 beer = self._client.get_item(beer_id, item_type="beer")
             self._send_beer(update, context, beer)
@@ -167,6 +257,7 @@ class BeerBot(LoggerMixin):
             self._not_found(update, context)
 
     @run_async
+    @timed(HANDLER_LATENCY, HANDLER_ERRORS, handler="select_info")
     @send_typing_action
     def _select_info(self, update: Update, context: CallbackContext) -> None:
         """Handler for choosing options from beer message"""
@@ -180,10 +271,10 @@ class BeerBot(LoggerMixin):
 
     def send_brewery(self, update: Update, context: CallbackContext, beer_id: int) -> None:
         try:
-            result = self.get_brewery_context(context, beer_id)
+            result = self.get_brewery_context(update, beer_id)
             if result is None:
                 result = self._client.get_brewery_by_beer(beer_id)
-                self.put_brewery_context(context, beer_id, result)
+                self.put_brewery_context(update, beer_id, result)
             text = self._parse_brewery_to_html(result)
             context.bot.send_message(chat_id=update.effective_chat.id, text=text, parse_mode=ParseMode.HTML)
             self.send_brewery_location(update, context, result)
@@ -192,7 +283,7 @@ class BeerBot(LoggerMixin):
 
     def send_similar(self, update: Update, context: CallbackContext, beer_id: int):
         try:
-            beer = self.get_beer_context(context, beer_id)
+            beer = self.get_beer_context(update, beer_id)
             similar = beer.similar
             self._show_options(update, context, similar)
         except AttributeError:
@@ -299,24 +390,33 @@ class BeerBot(LoggerMixin):
     def get_brewery_key(self, key):
         return f"brewery_{key}"
 
-    def put_beer_context(self, context: CallbackContext, key, value):
+    def put_beer_context(self, update: Update, key, value: Beer):
         beer_key = self.get_beer_key(key)
-        self.put_context_item(context, beer_key, value)
+        self.put_context_item(update, beer_key, value)
 
-    def get_beer_context(self, context: CallbackContext, key):
+    def get_beer_context(self, update: Update, key) -> Optional[Beer]:
         beer_key = self.get_beer_key(key)
-        return self.get_context_item(context, beer_key)
+        return self.get_context_item(update, beer_key, "beer")
 
-    def put_brewery_context(self, context: CallbackContext, key, value):
-        beer_key = self.get_brewery_key(key)
-        self.put_context_item(context, beer_key, value)
-
-    def get_brewery_context(self, context: CallbackContext, key):
+    def put_brewery_context(self, update: Update, key, value: Brewery):
         brewery_key = self.get_brewery_key(key)
-        return self.get_context_item(context, brewery_key)
-
-    def put_context_item(self, context: CallbackContext, key, value):
-        context.user_data[str(key)] = value
+        self.put_context_item(update, brewery_key, value)
 
-    def get_context_item(self, context: CallbackContext, key):
-        return context.user_data.get(key, None)
+    def get_brewery_context(self, update: Update, key) -> Optional[Brewery]:
+        brewery_key = self.get_brewery_key(key)
+        return self.get_context_item(update, brewery_key, "brewery")
+
+    def put_context_item(self, update: Update, key, value):
+        """
+        Only the id of the item is kept in the conversation, the item itself is in the cache.
+        Items without id, e.g. scraped breweries, can not be resolved and are not kept
+        """
+        if value is not None and value.id and update.effective_user is not None:
+            self._conversations.put(update.effective_user.id, str(key), value.id)
+
+    def get_context_item(self, update: Update, key, item_type: str):
+        """Resolve the item of the conversation by the cache"""
+        if update.effective_user is None:
+            return None
+        item_id = self._conversations.get(update.effective_user.id, str(key))
+        return self._client.get_item(item_id, item_type=item_type) if item_id is not None else None
@@ -0,0 +1,165 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from redis.exceptions import RedisError
+
+from app.logging import LoggerMixin
+from app.settings import (
+    CONVERSATION_KEY_PREFIX,
+    CONVERSATION_MAX_ITEMS,
+    CONVERSATION_MAX_USERS,
+    CONVERSATION_IDLE_TTL,
+)
+
+PUT_SCRIPT = """
+redis.call("hset", KEYS[1], ARGV[1], ARGV[2])
+redis.call("zadd", KEYS[2], ARGV[3], ARGV[1])
+local overflow = redis.call("zcard", KEYS[2]) - tonumber(ARGV[4])
+if overflow > 0 then
+    local evicted = redis.call("zrange", KEYS[2], 0, overflow - 1)
+    redis.call("zremrangebyrank", KEYS[2], 0, overflow - 1)
+    redis.call("hdel", KEYS[1], unpack(evicted))
+end
+redis.call("expire", KEYS[1], ARGV[5])
+redis.call("expire", KEYS[2], ARGV[5])
+return 1
+"""
+
+
+class ConversationStore(ABC):
+    """
+    State of conversations with users as references to entities, e.g. id of the beer shown to the user.
+    Each user keeps `max_items` least recently used references, and the whole state expires after `idle_ttl` seconds
+    without activity of the user.
+    """
+
+    @abstractmethod
+    def get(self, user_id: int, key: str) -> Optional[int]:
+        ...
+
+    @abstractmethod
+    def put(self, user_id: int, key: str, ref: int) -> None:
+        ...
+
+    @abstractmethod
+    def clear(self, user_id: int) -> None:
+        ...
+
+
+class LocalConversationStore(ConversationStore):
+    """In-process store for a single bot process, least recently active users are evicted above `max_users`"""
+
+    def __init__(
+        self,
+        max_items: int = CONVERSATION_MAX_ITEMS,
+        max_users: int = CONVERSATION_MAX_USERS,
+        idle_ttl: float = CONVERSATION_IDLE_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._max_items = max_items
+        self._max_users = max_users
+        self._idle_ttl = idle_ttl
+        self._clock = clock
+        self._users: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def get(self, user_id: int, key: str) -> Optional[int]:
+        with self._lock:
+            items = self._touch(user_id)
+            if items is None or key not in items:
+                return None
+            items.move_to_end(key)
+            return items[key]
+
+    def put(self, user_id: int, key: str, ref: int) -> None:
+        with self._lock:
+            items = self._touch(user_id)
+            if items is None:
+                items = OrderedDict()
+                self._users[user_id] = (self._clock(), items)
+                while len(self._users) > self._max_users:
+                    self._users.popitem(last=False)
+            items[key] = ref
+            items.move_to_end(key)
+            while len(items) > self._max_items:
+                items.popitem(last=False)
+
+    def clear(self, user_id: int) -> None:
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def _touch(self, user_id: int) -> Optional[OrderedDict]:
+        """Items of the active user, the idle ones are expired"""
+        now = self._clock()
+        while self._users:
+            oldest_id = next(iter(self._users))
+            if now - self._users[oldest_id][0] < self._idle_ttl:
+                break
+            del self._users[oldest_id]
+        if user_id not in self._users:
+            return None
+        _, items = self._users.pop(user_id)
+        self._users[user_id] = (now, items)
+        return items
+
+
+class RedisConversationStore(ConversationStore, LoggerMixin):
+    """
+    Store shared by bot processes and kept on restart. References of a user are a redis hash,
+    and a sorted set of access times orders them for eviction. Redis errors are logged and the state is skipped.
+    """
+
+    def __init__(
+        self,
+        redis,
+        prefix: str = CONVERSATION_KEY_PREFIX,
+        max_items: int = CONVERSATION_MAX_ITEMS,
+        idle_ttl: int = CONVERSATION_IDLE_TTL,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        super().__init__()
+        self._redis = redis
+        self._prefix = prefix
+        self._max_items = max_items
+        self._idle_ttl = idle_ttl
+        self._clock = clock
+
+    def get(self, user_id: int, key: str) -> Optional[int]:
+        items_key, lru_key = self._keys(user_id)
+        try:
+            with self._redis.pipeline(transaction=False) as pipe:
+                pipe.hget(items_key, key)
+                pipe.zadd(lru_key, {key: self._clock()}, xx=True)
+                pipe.expire(items_key, self._idle_ttl)
+                pipe.expire(lru_key, self._idle_ttl)
+                ref = pipe.execute()[0]
+        except RedisError as e:
+            self.logger.error(f"Redis error: {e}")
+            return None
+        return int(ref) if ref is not None else None
+
+    def put(self, user_id: int, key: str, ref: int) -> None:
+        try:
+            self._redis.eval(
+                PUT_SCRIPT, 2, *self._keys(user_id), key, ref, self._clock(), self._max_items, self._idle_ttl,
+            )
+        except RedisError as e:
+            self.logger.error(f"Redis error: {e}")
+
+    def clear(self, user_id: int) -> None:
+        try:
+            self._redis.delete(*self._keys(user_id))
+        except RedisError as e:
+            self.logger.error(f"Redis error: {e}")
+
+    def _keys(self, user_id: int):
+        return f"{self._prefix}:{user_id}", f"{self._prefix}:{user_id}:lru"
+
+
+__all__ = ["ConversationStore", "LocalConversationStore", "RedisConversationStore"]
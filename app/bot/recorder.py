@@ -0,0 +1,154 @@
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from queue import Queue, Full, Empty
+from typing import Optional
+
+from telegram import Update
+from telegram.ext import CallbackContext
+
+from app.logging import LoggerMixin
+from app.settings import RECORD_PATH, RECORD_SALT, RECORD_QUEUE_SIZE
+
+PERSONAL_KEYS = {
+    "last_name",
+    "username",
+    "title",
+    "phone_number",
+    "bio",
+    "description",
+    "invite_link",
+    "forward_sender_name",
+    "author_signature",
+}
+DROPPED_KEYS = {"contact", "location", "venue", "photo", "document", "voice", "video", "audio", "sticker", "caption"}
+IDENTITY_KEYS = {
+    "from",
+    "chat",
+    "user",
+    "sender_chat",
+    "forward_from",
+    "forward_from_chat",
+    "new_chat_members",
+    "left_chat_member",
+}
+
+
+class Anonymizer:
+    """
+    Ids of users and chats are replaced by keyed hashes, so the same user keeps the same pseudonym within a recording,
+    users are recognized wherever they appear.
+    Names, contacts and media are dropped, first names which telegram requires are replaced by a placeholder,
+    and texts which are not commands are replaced by a filler of their length.
+    """
+
+    def __init__(self, salt: Optional[str] = RECORD_SALT) -> None:
+        self._key = salt.encode() if salt else os.urandom(16)
+
+    def pseudonym(self, value: int) -> int:
+        pseudonym = int.from_bytes(self._digest(str(abs(value)))[:5], "big") + 1
+        return -pseudonym if value < 0 else pseudonym
+
+    def _digest(self, value: str) -> bytes:
+        return hmac.new(self._key, value.encode(), hashlib.sha256).digest()
+
+    def anonymize(self, data):
+        if isinstance(data, list):
+            return [self.anonymize(item) for item in data]
+        if not isinstance(data, dict):
+            return data
+        if "is_bot" in data:
+            return self.anonymize_identity(data)
+        return self._anonymize_fields(data)
+
+    def _anonymize_fields(self, data: dict) -> dict:
+        result = {}
+        for key, value in data.items():
+            if key in PERSONAL_KEYS or key in DROPPED_KEYS:
+                continue
+            if key in IDENTITY_KEYS and isinstance(value, list):
+                result[key] = [self.anonymize_identity(item) for item in value if isinstance(item, dict)]
+            elif key in IDENTITY_KEYS and isinstance(value, dict):
+                result[key] = self.anonymize_identity(value)
+            elif key == "first_name":
+                result[key] = "User"
+            elif key == "chat_instance":
+                result[key] = self._digest(str(value)).hex()[:16]
+            elif key == "text" and isinstance(value, str) and not value.startswith("/"):
+                result[key] = "x" * len(value)
+            else:
+                result[key] = self.anonymize(value)
+        return result
+
+    def anonymize_identity(self, identity: dict) -> dict:
+        result = self._anonymize_fields(identity)
+        if isinstance(identity.get("id"), int):
+            result["id"] = self.pseudonym(identity["id"])
+        return result
+
+
+class UpdateRecorder(LoggerMixin):
+    """
+    Writes incoming updates to a JSONL file with the seconds since the recording started, for replays of the traffic.
+    Updates wait in a bounded queue and are dropped when it is full, they are anonymized and written by a thread.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = RECORD_PATH,
+        anonymizer: Optional[Anonymizer] = None,
+        queue_size: int = RECORD_QUEUE_SIZE,
+    ) -> None:
+        super().__init__()
+        self._path = path
+        self._anonymizer = anonymizer if anonymizer is not None else Anonymizer()
+        self._queue: Queue = Queue(maxsize=queue_size)
+        self._started = time.monotonic()
+        self._thread: Optional[threading.Thread] = None
+        self._running = threading.Event()
+        self.recorded = 0
+        self.dropped = 0
+
+    def start(self) -> None:
+        self._started = time.monotonic()
+        self._running.set()
+        self._thread = threading.Thread(target=self._write, name="update-recorder", daemon=True)
+        self._thread.start()
+        self.logger.info(f"Updates are recorded to {self._path}")
+
+    def stop(self) -> None:
+        """Write the queued updates and stop the thread"""
+        if self._thread is None:
+            return
+        self._running.clear()
+        self._thread.join()
+        self._thread = None
+
+    def record(self, update: Update, context: Optional[CallbackContext] = None) -> None:
+        """Handler of all updates, it is registered before the handlers of the bot"""
+        try:
+            self._queue.put_nowait((time.monotonic() - self._started, update))
+        except Full:
+            self.dropped += 1
+
+    def _write(self) -> None:
+        with open(self._path, "a", encoding="utf-8") as output:
+            while self._running.is_set() or not self._queue.empty():
+                try:
+                    at, update = self._queue.get(timeout=0.1)
+                except Empty:
+                    continue
+                try:
+                    data = self._anonymizer.anonymize(update.to_dict())
+                    output.write(json.dumps({"at": round(at, 3), "update": data}, ensure_ascii=False) + "\n")
+                    self.recorded += 1
+                except (TypeError, ValueError) as e:
+                    self.logger.error(f"Update {update.update_id} was not recorded, error {e!r}")
+                if self._queue.empty():
+                    output.flush()
+
+
+__all__ = ["Anonymizer", "UpdateRecorder"]
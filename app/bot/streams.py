@@ -0,0 +1,304 @@
+import json
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from redis.exceptions import RedisError, ResponseError
+from telegram import Bot, Update
+from telegram.ext import CallbackContext, Dispatcher, DispatcherHandlerStop
+from telegram.utils.promise import Promise
+
+from app.logging import LoggerMixin
+from app.settings import (
+    STREAM_PREFIX,
+    STREAM_GROUP,
+    STREAM_SHARDS,
+    STREAM_MAXLEN,
+    STREAM_WORKERS,
+    STREAM_WORKER_INDEX,
+    STREAM_BATCH,
+    STREAM_BLOCK,
+    STREAM_CLAIM_IDLE,
+    STREAM_MAX_DELIVERIES,
+    STREAM_HANDLER_TIMEOUT,
+)
+
+TMessage = Tuple[bytes, Dict[bytes, bytes]]
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class UpdateStream(LoggerMixin):
+    """
+    Telegram updates sharded by chat to `shards` redis streams, so updates of a chat stay in one stream in order.
+    It has `put` and `qsize` of a queue, so the webhook server of an ingress process writes updates here
+    instead of the dispatcher queue. Acknowledged updates are deleted, so the streams hold only unhandled ones.
+    """
+
+    UPDATE_FIELD = "update"
+
+    def __init__(
+        self, redis, prefix: str = STREAM_PREFIX, shards: int = STREAM_SHARDS, maxlen: int = STREAM_MAXLEN
+    ) -> None:
+        super().__init__()
+        self._redis = redis
+        self._prefix = prefix
+        self._shards = shards
+        self._maxlen = maxlen
+
+    @property
+    def redis(self):
+        return self._redis
+
+    @property
+    def shards(self) -> int:
+        return self._shards
+
+    @property
+    def dead_key(self) -> str:
+        """Stream of updates which were not handled after all deliveries"""
+        return f"{self._prefix}:dead"
+
+    def key(self, shard: int) -> str:
+        return f"{self._prefix}:{shard}"
+
+    def shard(self, update: Update) -> int:
+        """Updates without a chat, e.g. inline queries, are sharded by the user"""
+        if update.effective_chat is not None:
+            return update.effective_chat.id % self._shards
+        if update.effective_user is not None:
+            return update.effective_user.id % self._shards
+        return 0
+
+    def put(self, update: Update) -> str:
+        fields = {UpdateStream.UPDATE_FIELD: json.dumps(update.to_dict())}
+        return _decode(self._redis.xadd(self.key(self.shard(update)), fields, maxlen=self._maxlen))
+
+    def qsize(self) -> int:
+        """Updates which are not acknowledged yet, both waiting and being handled"""
+        try:
+            with self._redis.pipeline(transaction=False) as pipe:
+                for shard in range(self._shards):
+                    pipe.xlen(self.key(shard))
+                return sum(pipe.execute())
+        except RedisError as e:
+            self.logger.error(f"Redis error: {e}")
+            return 0
+
+    def ack(self, key: str, group: str, message_id) -> None:
+        with self._redis.pipeline(transaction=True) as pipe:
+            pipe.xack(key, group, message_id)
+            pipe.xdel(key, message_id)
+            pipe.execute()
+
+    def bury(self, key: str, group: str, message_id) -> None:
+        """Move the update to the dead stream"""
+        messages = self._redis.xrange(key, message_id, message_id)
+        with self._redis.pipeline(transaction=True) as pipe:
+            for _, fields in messages:
+                pipe.xadd(self.dead_key, {**fields, b"stream": key}, maxlen=self._maxlen)
+            pipe.xack(key, group, message_id)
+            pipe.xdel(key, message_id)
+            pipe.execute()
+
+
+class StreamWorker(LoggerMixin):
+    """
+    Consumes the shards `shard % workers == index` of the update stream with a consumer group and passes updates
+    to the handlers of the dispatcher, so N worker processes share the load while every chat is handled by one of them
+    in order. Updates are handled one by one, `run_async` handlers are waited for up to `handler_timeout` ms,
+    and an update is acknowledged only when its handlers succeeded. Unacknowledged ones are redelivered before
+    new updates of the shard, either to the same consumer after a failure or restart, or claimed from another
+    consumer after `claim_idle` ms, e.g. when the number of workers changed. Updates delivered `max_deliveries`
+    times are moved to the dead stream.
+    """
+
+    def __init__(
+        self,
+        stream: UpdateStream,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        group: str = STREAM_GROUP,
+        index: int = STREAM_WORKER_INDEX,
+        workers: int = STREAM_WORKERS,
+        batch: int = STREAM_BATCH,
+        block: int = STREAM_BLOCK,
+        claim_idle: int = STREAM_CLAIM_IDLE,
+        max_deliveries: int = STREAM_MAX_DELIVERIES,
+        handler_timeout: int = STREAM_HANDLER_TIMEOUT,
+    ) -> None:
+        super().__init__()
+        self._stream = stream
+        self._redis = stream.redis
+        self._dispatcher = dispatcher
+        self._bot = bot
+        self._group = group
+        self._consumer = f"worker-{index}"
+        self._keys = [stream.key(shard) for shard in range(stream.shards) if shard % workers == index]
+        self._batch = batch
+        self._block = block
+        self._claim_idle = claim_idle
+        self._max_deliveries = max_deliveries
+        self._handler_timeout = handler_timeout
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {"handled": 0, "failed": 0, "redelivered": 0, "claimed": 0, "dead": 0}
+
+    @property
+    def keys(self) -> List[str]:
+        return list(self._keys)
+
+    def create_groups(self) -> None:
+        """Create the consumer group of every shard, existing groups are kept"""
+        for key in self._keys:
+            try:
+                self._redis.xgroup_create(key, self._group, id="0", mkstream=True)
+            except ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+
+    def start(self) -> None:
+        self.create_groups()
+        self._thread = threading.Thread(target=self._work, name="stream_worker", daemon=True)
+        self._thread.start()
+        self.logger.info(f"Worker {self._consumer} consumes {self._keys}")
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self._block / 1000 + 1)
+
+    def poll(self, block: Optional[int] = None) -> int:
+        """Handle pending updates and then new ones of shards without pending updates, returns handled number"""
+        handled = 0
+        ready = []
+        for key in self._keys:
+            done, clean = self._retry(key)
+            handled += done
+            if clean:
+                ready.append(key)
+        if not ready:
+            # every shard waits for redelivery, don't spin on it
+            self._stopped.wait((block or 0) / 1000)
+            return handled
+        response = self._redis.xreadgroup(
+            self._group, self._consumer, {key: ">" for key in ready}, count=self._batch, block=block
+        )
+        for key, messages in response or []:
+            handled += self._handle_all(_decode(key), messages)
+        return handled
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def _work(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                self.poll(block=self._block)
+            except RedisError as e:
+                self.logger.error(f"Redis error: {e}")
+                self._stopped.wait(1)
+
+    def _retry(self, key: str) -> Tuple[int, bool]:
+        """
+        Redeliver own pending and claim stuck updates one by one in order, returns handled number
+        and whether none is left. Claiming an update counts its delivery, so the ones after a failed update
+        are not claimed until it is handled or buried.
+        """
+        pending = self._redis.xpending_range(key, self._group, "-", "+", self._batch)
+        handled = 0
+        for entry in pending:
+            if entry["consumer"] is not None and _decode(entry["consumer"]) != self._consumer:
+                if entry["time_since_delivered"] < self._claim_idle:
+                    # the shard is still handled by another worker, wait until it gives up
+                    return handled, False
+                self._count("claimed")
+            if entry["times_delivered"] >= self._max_deliveries:
+                self._bury(key, entry["message_id"])
+                continue
+            self._count("redelivered")
+            messages = self._redis.xclaim(key, self._group, self._consumer, 0, [entry["message_id"]])
+            if self._handle_all(key, messages) < len(messages):
+                return handled, False
+            handled += len(messages)
+        return handled, len(pending) < self._batch
+
+    def _handle_all(self, key: str, messages: List[TMessage]) -> int:
+        """Stop at the first failed update, the next ones wait for its redelivery to keep the order"""
+        handled = 0
+        for message_id, fields in messages:
+            if not fields:
+                # deleted from the stream while it was pending
+                self._ack(key, message_id)
+            elif not self._handle(key, message_id, fields):
+                break
+            handled += 1
+        return handled
+
+    def _handle(self, key: str, message_id, fields: Dict[bytes, bytes]) -> bool:
+        try:
+            data = json.loads(fields[UpdateStream.UPDATE_FIELD.encode()])
+            self._dispatch(Update.de_json(data, self._bot))
+        except Exception as e:
+            self.logger.error(f"Failed handling update {_decode(message_id)} of {key}, error {e!r}")
+            self._count("failed")
+            return False
+        self._ack(key, message_id)
+        self._count("handled")
+        return True
+
+    def _dispatch(self, update: Update) -> None:
+        """
+        Pass the update to the first matching handler of every group like the dispatcher does,
+        but `run_async` handlers are waited for, and errors are raised after the error handlers got them
+        """
+        context = None
+        for group in self._dispatcher.groups:
+            try:
+                for handler in self._dispatcher.handlers[group]:
+                    check = handler.check_update(update)
+                    if check is None or check is False:
+                        continue
+                    if context is None and self._dispatcher.use_context:
+                        context = CallbackContext.from_update(update, self._dispatcher)
+                    result = handler.handle_update(update, self._dispatcher, check, context)
+                    if isinstance(result, Promise):
+                        self._wait(result)
+                    break
+            except DispatcherHandlerStop:
+                return
+            except Exception as e:
+                self._dispatch_error(update, e)
+                raise
+
+    def _dispatch_error(self, update: Update, error: Exception) -> None:
+        try:
+            self._dispatcher.dispatch_error(update, error)
+        except Exception as e:
+            # the error handler of the bot raises the error again
+            if e is not error:
+                self.logger.error(f"Error handler failed, error {e!r}")
+
+    def _wait(self, promise: Promise) -> None:
+        if not promise.done.wait(self._handler_timeout / 1000):
+            raise TimeoutError(f"Handler is not done in {self._handler_timeout} ms")
+        if promise.exception is not None:
+            raise promise.exception
+
+    def _ack(self, key: str, message_id) -> None:
+        self._stream.ack(key, self._group, message_id)
+
+    def _bury(self, key: str, message_id) -> None:
+        self._stream.bury(key, self._group, message_id)
+        self._count("dead")
+        self.logger.error(f"Update {_decode(message_id)} of {key} was moved to {self._stream.dead_key}")
+
+    def _count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += value
+
+
+__all__ = ["UpdateStream", "StreamWorker"]
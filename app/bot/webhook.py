@@ -0,0 +1,115 @@
+import asyncio
+import hmac
+from queue import Queue
+from typing import Optional, Union
+
+from aiohttp import web
+from telegram import Bot, Update
+
+from app.bot.streams import UpdateStream
+from app.logging import LoggerMixin
+from app.settings import (
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_QUEUE_SIZE,
+    WEBHOOK_MAX_CONNECTIONS,
+)
+from app.utils.event_loop import EventLoopThread
+
+
+class WebhookServer(LoggerMixin):
+    """
+    Local aiohttp endpoint receiving telegram updates instead of long polling.
+    Requests must carry the secret token registered with the webhook. Updates are put to the dispatcher queue
+    or to the update stream of workers, and while `max_queue` updates are waiting there, new ones are refused
+    with 503 so telegram retries them later.
+    """
+
+    SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+    def __init__(
+        self,
+        bot: Bot,
+        update_queue: Union[Queue, UpdateStream],
+        path: str = WEBHOOK_PATH,
+        secret: Optional[str] = WEBHOOK_SECRET,
+        host: str = WEBHOOK_HOST,
+        port: int = WEBHOOK_PORT,
+        max_queue: int = WEBHOOK_QUEUE_SIZE,
+        runner: Optional[EventLoopThread] = None,
+    ) -> None:
+        super().__init__()
+        self._bot = bot
+        self._queue = update_queue
+        self._path = path
+        self._secret = secret
+        self._host = host
+        self._port = port
+        self._max_queue = max_queue
+        self._runner = runner if runner is not None else EventLoopThread(name="webhook")
+        self._app_runner: Optional[web.AppRunner] = None
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self._path, self.handle_update)
+        app.router.add_get("/health", self.handle_health)
+        return app
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        """Validate the update and put it to the dispatcher queue, the update stream is written in the executor"""
+        if self._secret and not hmac.compare_digest(request.headers.get(self.SECRET_HEADER, ""), self._secret):
+            self.logger.warning(f"Webhook request from {request.remote} with a wrong secret token")
+            return web.Response(status=403)
+        loop = asyncio.get_event_loop()
+        queue_size = await loop.run_in_executor(None, self._queue.qsize)
+        if queue_size >= self._max_queue:
+            self.logger.warning(f"Update queue is full, {queue_size} updates are waiting")
+            return web.Response(status=503, headers={"Retry-After": "1"})
+        try:
+            update = Update.de_json(await request.json(), self._bot)
+        except (ValueError, KeyError, TypeError) as e:
+            self.logger.error(f"Can't parse update: {e!r}")
+            update = None
+        if update is None:
+            return web.Response(status=400)
+        await loop.run_in_executor(None, self._queue.put, update)
+        return web.Response()
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        """Health check for a load balancer, fails while the update queue is full"""
+        queue_size = await asyncio.get_event_loop().run_in_executor(None, self._queue.qsize)
+        status = 503 if queue_size >= self._max_queue else 200
+        return web.json_response({"queue_size": queue_size}, status=status)
+
+    def set_webhook(self, url: str, max_connections: int = WEBHOOK_MAX_CONNECTIONS) -> bool:
+        """Register public base url of the endpoint and its secret token with telegram"""
+        data = {"url": f"{url.rstrip('/')}{self._path}", "max_connections": max_connections}
+        if self._secret:
+            data["secret_token"] = self._secret
+        result = self._bot.request.post(f"{self._bot.base_url}/setWebhook", data)
+        self.logger.info(f"Webhook was set to {data['url']}: {result}")
+        return bool(result)
+
+    def start(self) -> None:
+        """Start serving in the loop thread of the server"""
+        if not self._secret:
+            self.logger.warning("WEBHOOK_SECRET is not set, webhook accepts updates from anyone who knows its url")
+        self._runner.run(self._start())
+        self.logger.info(f"Webhook is listening on {self._host}:{self._port}{self._path}")
+
+    def stop(self) -> None:
+        if self._app_runner is not None:
+            self._runner.run(self._app_runner.cleanup())
+            self._app_runner = None
+        self._runner.stop()
+
+    async def _start(self) -> None:
+        self._app_runner = web.AppRunner(self.make_app())
+        await self._app_runner.setup()
+        site = web.TCPSite(self._app_runner, self._host, self._port)
+        await site.start()
+
+
+__all__ = ["WebhookServer"]
@@ -1,10 +1,45 @@
+import sys
 from typing import List, Union, Literal, Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 
 TNumber = Union[float, int]
 TSearchType = Union[Literal["beer"], Literal["brewery"]]
 
 
+def slotted(cls):
+    """
+    Recreate the dataclass with `__slots__` instead of per-instance `__dict__`, as `dataclass(slots=True)`
+    of python 3.10 does. Defaults are kept by the generated `__init__`, so they are removed from the class.
+    """
+    base_slots = {name for base in cls.__mro__[1:] for name in getattr(base, "__slots__", ())}
+    field_names = tuple(field.name for field in fields(cls) if field.name not in base_slots)
+    cls_dict = dict(cls.__dict__)
+    cls_dict["__slots__"] = field_names
+    for name in field_names:
+        cls_dict.pop(name, None)
+    cls_dict.pop("__dict__", None)
+    cls_dict.pop("__weakref__", None)
+    cls_dict["__getstate__"] = _getstate
+    cls_dict["__setstate__"] = _setstate
+    return type(cls)(cls.__name__, cls.__bases__, cls_dict)
+
+
+def _getstate(self):
+    return [getattr(self, field.name) for field in fields(self)]
+
+
+def _setstate(self, state):
+    # object.__setattr__ works for frozen dataclasses as well
+    for field, value in zip(fields(self), state):
+        object.__setattr__(self, field.name, value)
+
+
+def intern(value):
+    """Share a single copy of repeated strings, e.g. styles and countries, between entities"""
+    return sys.intern(value) if type(value) is str else value
+
+
+@slotted
 @dataclass(frozen=True)
 class SearchItem:
     id: int
@@ -14,6 +49,7 @@ class SearchItem:
 SearchResult = List[SearchItem]
 
 
+@slotted
 @dataclass
 class Contact:
     twitter: Optional[str] = ""
@@ -21,18 +57,24 @@ class Contact:
     url: Optional[str] = ""
 
 
+@slotted
 @dataclass
 class Location:
     lat: Optional[float] = None
     lng: Optional[float] = None
 
 
+@slotted
 @dataclass()
 class BreweryShort:
     id: int
     name: str
 
+    def __post_init__(self):
+        self.name = intern(self.name)
+
 
+@slotted
 @dataclass()
 class Brewery(BreweryShort):
     brewery_type: str
@@ -43,6 +85,11 @@ class Brewery(BreweryShort):
     rating: float
     raters: int
 
+    def __post_init__(self):
+        BreweryShort.__post_init__(self)
+        self.brewery_type = intern(self.brewery_type)
+        self.country = intern(self.country)
+
     def set_location(self, location: dict):
         self.location = Location(**location)
 
@@ -50,6 +97,7 @@ class Brewery(BreweryShort):
         self.contact = Contact(**contact)
 
 
+@slotted
 @dataclass(frozen=True)
 class Similar:
     id: int
@@ -59,6 +107,7 @@ class Similar:
 SimilarList = List[Similar]
 
 
+@slotted
 @dataclass()
 class Beer:
     id: str
@@ -72,6 +121,9 @@ class Beer:
     brewery: Optional[BreweryShort]
     similar: SimilarList
 
+    def __post_init__(self):
+        self.style = intern(self.style)
+
     def set_brewery(self, brewery: dict):
         self.brewery = BreweryShort(**brewery)
 
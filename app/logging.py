@@ -1,23 +1,149 @@
+import atexit
 import logging
+import random
+import reprlib
+from logging.handlers import QueueHandler, QueueListener
+from queue import Queue, Full
+from typing import Callable, Dict, Optional
 
+from app.settings import LOG_LEVEL, LOG_QUEUE_SIZE, LOG_SAMPLE_RATE, LOG_MAX_LENGTH, LOG_SKIP_CONTEXT, log_levels
 
-def init_log():
-    logging.basicConfig(
-        level=logging.ERROR, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    )
+LOG_FORMAT = "%(asctime)s %(process)s %(levelname)s %(name)s %(message)s"
+
+_listener: Optional[QueueListener] = None
+_component_levels: Dict[str, str] = {}
+
+
+class TruncatingFormatter(logging.Formatter):
+    """Message and arguments of records longer than `max_length` characters are cut, e.g. raw API responses"""
+
+    def __init__(self, fmt: str = LOG_FORMAT, max_length: int = LOG_MAX_LENGTH) -> None:
+        super().__init__(fmt)
+        self._max_length = max_length
+        self._repr = reprlib.Repr()
+        self._repr.maxlevel = 3
+        self._repr.maxstring = max_length
+
+    def format(self, record: logging.LogRecord) -> str:
+        if isinstance(record.args, tuple) and record.args:
+            record.args = tuple(self.truncate(arg) for arg in record.args)
+        elif not record.args:
+            record.msg = self.truncate(record.msg)
+        return super().format(record)
+
+    def truncate(self, value):
+        if isinstance(value, (int, float)):
+            return value
+        # containers, e.g. parsed API responses, are rendered partly instead of rendering them whole
+        text = self._repr.repr(value) if isinstance(value, (dict, list, tuple, set)) else str(value)
+        if len(text) <= self._max_length:
+            return text
+        return f"{text[: self._max_length]}... ({len(text)} chars)"
+
+
+class SamplingFilter(logging.Filter):
+    """Passes `rate` part of records at `level` and below, more important records always pass"""
+
+    def __init__(self, rate: float = LOG_SAMPLE_RATE, level: int = logging.DEBUG, rng: Callable = random.random):
+        super().__init__()
+        self._rate = rate
+        self._level = level
+        self._rng = rng
+        self.sampled_out = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self._level or self._rate >= 1 or self._rng() < self._rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Puts records to a bounded queue and drops them when it is full, so logging never blocks the caller.
+    Records are not formatted here, it is done by the listener thread.
+    """
+
+    def __init__(self, queue: Queue) -> None:
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+
+class BlockingStopQueueListener(QueueListener):
+    """Stop waits for a place in the full queue, the base listener fails to stop then"""
+
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+
+def init_log(
+    level: str = LOG_LEVEL,
+    levels: Dict[str, str] = log_levels,
+    queue_size: int = LOG_QUEUE_SIZE,
+    sample_rate: float = LOG_SAMPLE_RATE,
+    max_length: int = LOG_MAX_LENGTH,
+    handler: Optional[logging.Handler] = None,
+    skip_context: bool = LOG_SKIP_CONTEXT,
+) -> QueueListener:
+    """
+    Records of `app` loggers go through a queue to a listener thread, which formats and writes them.
+    `levels` override the level of components by logger name, e.g. {"app.untappd.api": "DEBUG"}.
+    With `skip_context` records don't collect source location, thread and process name, which the format
+    doesn't use, see "Optimization" of logging. It changes records of every logger in the process, so it is opt-in.
+    """
+    global _listener, _component_levels
+    logging.basicConfig(level=logging.ERROR, format=LOG_FORMAT)
+    if skip_context:
+        logging._srcfile = None  # type: ignore
+        logging.logThreads = False
+        logging.logMultiprocessing = False
+    stop_log()
+    handler = handler if handler is not None else logging.StreamHandler()
+    handler.setFormatter(TruncatingFormatter(max_length=max_length))
+    queue: Queue = Queue(maxsize=queue_size)
+    queue_handler = NonBlockingQueueHandler(queue)
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+
+    logger = logging.getLogger("app")
+    logger.handlers = [queue_handler]
+    logger.setLevel(level.upper())
+    logger.propagate = False
+    for name in _component_levels:
+        logging.getLogger(name).setLevel(logging.NOTSET)
+    for name, component_level in levels.items():
+        logging.getLogger(name).setLevel(component_level.upper())
+    _component_levels = dict(levels)
+
+    _listener = BlockingStopQueueListener(queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.unregister(stop_log)
+    atexit.register(stop_log)
+    return _listener
+
+
+def stop_log() -> None:
+    """Write the queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
 
 
 class LoggerMixin:
+    """Logger of the component is named by its class, e.g. `app.untappd.api.UntappdAPI`"""
+
     def __init__(self, name=None):
-        logger_name = name if name else __name__
+        logger_name = name if name else f"{type(self).__module__}.{type(self).__name__}"
         self.logger = logging.getLogger(logger_name)
-        self.logger.setLevel(logging.DEBUG)
-        handler = logging.StreamHandler()
-        formatter = logging.Formatter("%(asctime)s %(process)s %(levelname)s %(name)s %(message)s")
-        handler.setFormatter(formatter)
-        self.logger.handlers = []
-        self.logger.addHandler(handler)
-        self.logger.propagate = False
 
 
-__all__ = ["init_log", "LoggerMixin"]
+__all__ = ["init_log", "stop_log", "LoggerMixin", "TruncatingFormatter", "SamplingFilter", "NonBlockingQueueHandler"]
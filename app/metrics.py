@@ -0,0 +1,335 @@
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from functools import wraps
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+from app.logging import LoggerMixin
+from app.settings import METRICS_HOST, METRICS_PORT
+from app.utils.event_loop import EventLoopThread
+
+TLabels = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(ABC):
+    """Metric with children by values of `labels`, children may be kept by callers to skip the lookup"""
+
+    TYPE = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._children: Dict[TLabels, object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels: str):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._create_child())
+        return child
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._expose_child(key, child))
+        return lines
+
+    @abstractmethod
+    def _create_child(self):
+        ...
+
+    @abstractmethod
+    def _expose_child(self, key: TLabels, child) -> List[str]:
+        ...
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1) -> None:
+        with self._lock:
+            self.value += value
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def inc(self, value: float = 1, **labels: str) -> None:
+        self.labels(**labels).inc(value)
+
+    def _create_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def _expose_child(self, key: TLabels, child: _CounterChild) -> List[str]:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(child.value)}"]
+
+
+class _GaugeChild:
+    __slots__ = ("value", "function")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """The value is taken from `function` on every scrape, e.g. the size of a queue"""
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+
+class Gauge(Metric):
+    TYPE = "gauge"
+
+    def set_function(self, function: Callable[[], float], **labels: str) -> None:
+        self.labels(**labels).set_function(function)
+
+    def _create_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def _expose_child(self, key: TLabels, child: _GaugeChild) -> List[str]:
+        try:
+            value = child.get()
+        except Exception:
+            value = math.nan
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"]
+
+
+class _HistogramChild:
+    __slots__ = ("_bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]) -> None:
+        self._bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self._bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self) -> "_Timer":
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("_child", "_started")
+
+    def __init__(self, child: _HistogramChild) -> None:
+        self._child = child
+        self._started = 0.0
+
+    def __enter__(self) -> "_Timer":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._child.observe(time.perf_counter() - self._started)
+
+
+class Histogram(Metric):
+    """Cumulative buckets of observed values, `le` bounds are in seconds for latencies"""
+
+    TYPE = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, documentation, labels)
+        self._bounds = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: str) -> None:
+        self.labels(**labels).observe(value)
+
+    def _create_child(self) -> _HistogramChild:
+        return _HistogramChild(self._bounds)
+
+    def _expose_child(self, key: TLabels, child: _HistogramChild) -> List[str]:
+        with child._lock:
+            counts, total = list(child.counts), child.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self._bounds + (math.inf,), counts):
+            cumulative += count
+            le = f'le="{_format_value(float(bound))}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+        labels = _format_labels(self.label_names, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labels))
+
+    def histogram(
+        self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def expose(self) -> str:
+        """Metrics in the prometheus text format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.expose()) + "\n"
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is registered already")
+            self._metrics[metric.name] = metric
+        return metric
+
+
+def timed(histogram: Histogram, errors: Optional[Counter] = None, **labels: str) -> Callable:
+    """Observe the time of every call of the function, failed calls are counted by `errors` as well"""
+
+    def decorator(func: Callable) -> Callable:
+        child = histogram.labels(**labels)
+        error_child = errors.labels(**labels) if errors is not None else None
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                if error_child is not None:
+                    error_child.inc()
+                raise
+            finally:
+                child.observe(time.perf_counter() - started)
+
+        return wrapper
+
+    return decorator
+
+
+def key_type(key: str) -> str:
+    """Type of the cached item by its key, e.g. `beer` for `beer_1`"""
+    return key.split("_", 1)[0]
+
+
+class MetricsServer(LoggerMixin):
+    """Local endpoint serving the registry to prometheus"""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(
+        self,
+        registry: Optional[Registry] = None,
+        host: str = METRICS_HOST,
+        port: int = METRICS_PORT,
+        runner: Optional[EventLoopThread] = None,
+    ) -> None:
+        super().__init__()
+        self._registry = registry if registry is not None else REGISTRY
+        self._host = host
+        self._port = port
+        self._runner = runner if runner is not None else EventLoopThread(name="metrics")
+        self._app_runner: Optional[web.AppRunner] = None
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        return app
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        response = web.Response(body=self._registry.expose().encode())
+        response.headers["Content-Type"] = MetricsServer.CONTENT_TYPE
+        return response
+
+    def start(self) -> None:
+        self._runner.run(self._start())
+        self.logger.info(f"Metrics are served on {self._host}:{self._port}/metrics")
+
+    def stop(self) -> None:
+        if self._app_runner is not None:
+            self._runner.run(self._app_runner.cleanup())
+            self._app_runner = None
+        self._runner.stop()
+
+    async def _start(self) -> None:
+        self._app_runner = web.AppRunner(self.make_app())
+        await self._app_runner.setup()
+        site = web.TCPSite(self._app_runner, self._host, self._port)
+        await site.start()
+
+
+REGISTRY = Registry()
+
+HANDLER_LATENCY = REGISTRY.histogram("beer_bot_handler_seconds", "Time of bot handlers", ["handler"])
+HANDLER_ERRORS = REGISTRY.counter("beer_bot_handler_errors_total", "Failed bot handlers", ["handler"])
+ACTION_LATENCY = REGISTRY.histogram(
+    "untappd_action_seconds", "Time of client actions including hedging and fallbacks", ["action"]
+)
+BACKEND_LATENCY = REGISTRY.histogram("untappd_backend_seconds", "Time of calls to backends", ["backend", "outcome"])
+BACKEND_EVENTS = REGISTRY.counter(
+    "untappd_backend_events_total", "Hedged calls, hedge wins and fallbacks to the next backend", ["event"]
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "untappd_cache_requests_total", "Cache lookups by level, key type and result", ["level", "key_type", "result"]
+)
+QUEUE_SIZE = REGISTRY.gauge("beer_bot_queue_size", "Items waiting or in flight in queues", ["queue"])
+
+__all__ = [
+    "Registry",
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "MetricsServer",
+    "timed",
+    "key_type",
+    "REGISTRY",
+    "HANDLER_LATENCY",
+    "HANDLER_ERRORS",
+    "ACTION_LATENCY",
+    "BACKEND_LATENCY",
+    "BACKEND_EVENTS",
+    "CACHE_REQUESTS",
+    "QUEUE_SIZE",
+]
@@ -7,15 +7,222 @@ load_dotenv(dotenv_path=env_path)
 
 UNTAPPD_ID = os.getenv("UNTAPPD_ID")
 UNTAPPD_TOKEN = os.getenv("UNTAPPD_TOKEN")
+UNTAPPD_CONCURRENCY = int(os.getenv("UNTAPPD_CONCURRENCY", 5))
+UNTAPPD_URL = os.getenv("UNTAPPD_URL", "https://untappd.com")
+UNTAPPD_API_URL = os.getenv("UNTAPPD_API_URL", "https://api.untappd.com/v4")
+UNTAPPD_QUOTA_KEY = os.getenv("UNTAPPD_QUOTA_KEY", "untappd_quota")
+UNTAPPD_QUOTA_LIMIT = int(os.getenv("UNTAPPD_QUOTA_LIMIT", 100))
+UNTAPPD_QUOTA_PERIOD = int(os.getenv("UNTAPPD_QUOTA_PERIOD", 60 * 60))
+UNTAPPD_QUOTA_RESERVE = float(os.getenv("UNTAPPD_QUOTA_RESERVE", 0.2))
+UNTAPPD_QUOTA_MIN_REMAINING = int(os.getenv("UNTAPPD_QUOTA_MIN_REMAINING", 2))
+
+BACKEND_HEDGE_DELAY = float(os.getenv("BACKEND_HEDGE_DELAY", 1))
+BACKEND_HEDGE_MIN_DELAY = float(os.getenv("BACKEND_HEDGE_MIN_DELAY", 0.05))
+BACKEND_LATENCY_WINDOW = int(os.getenv("BACKEND_LATENCY_WINDOW", 100))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", 0.5))
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", 20))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", 5))
+BREAKER_OPEN_TIMEOUT = float(os.getenv("BREAKER_OPEN_TIMEOUT", 30))
+BREAKER_SLOW_CALL = float(os.getenv("BREAKER_SLOW_CALL", 5))
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 10))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 3))
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", 100))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", 20))
+HTTP_DNS_TTL = int(os.getenv("HTTP_DNS_TTL", 300))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", 30))
+
+ASYNC_TIMEOUT = float(os.getenv("ASYNC_TIMEOUT", 15))
+ASYNC_MAX_PENDING = int(os.getenv("ASYNC_MAX_PENDING", 64))
+
+SINGLE_FLIGHT_LOCK_TTL = float(os.getenv("SINGLE_FLIGHT_LOCK_TTL", 10))
+SINGLE_FLIGHT_TIMEOUT = float(os.getenv("SINGLE_FLIGHT_TIMEOUT", 20))
+SINGLE_FLIGHT_POLL_INTERVAL = float(os.getenv("SINGLE_FLIGHT_POLL_INTERVAL", 0.05))
+
+SCRAPER_HTML_PARSER = os.getenv("SCRAPER_HTML_PARSER", "lxml")
+SCRAPER_RESTRICT_PARSING = os.getenv("SCRAPER_RESTRICT_PARSING", "1") == "1"
+SCRAPER_CONCURRENCY = int(os.getenv("SCRAPER_CONCURRENCY", 4))
+SCRAPER_RATE_LIMIT = float(os.getenv("SCRAPER_RATE_LIMIT", 2))
+
+CRAWLER_DOWNLOAD_DELAY = float(os.getenv("CRAWLER_DOWNLOAD_DELAY", 1))
+CRAWLER_MAX_PAGES = int(os.getenv("CRAWLER_MAX_PAGES", 4))
+CRAWLER_PAGE_SIZE = int(os.getenv("CRAWLER_PAGE_SIZE", 25))
+CRAWLER_STATE_TTL = int(os.getenv("CRAWLER_STATE_TTL", 30 * 24 * 60 * 60))
+
+PREFETCH_QUEUE_SIZE = int(os.getenv("PREFETCH_QUEUE_SIZE", 100))
+PREFETCH_RATE = float(os.getenv("PREFETCH_RATE", 0.5))
+PREFETCH_BURST = int(os.getenv("PREFETCH_BURST", 10))
+PREFETCH_MAX_PENDING = int(os.getenv("PREFETCH_MAX_PENDING", 16))
+PREFETCH_SIMILAR_LIMIT = int(os.getenv("PREFETCH_SIMILAR_LIMIT", 5))
 
 REDIS_URL = os.getenv("REDIS_URL")
 REDIS_PASSWORD = os.getenv("REDIS_PASSWORD")
 
+CACHE_LOCAL_SIZE = int(os.getenv("CACHE_LOCAL_SIZE", 1024))
+CACHE_LOCAL_TTL = float(os.getenv("CACHE_LOCAL_TTL", 60))
+CACHE_INVALIDATION_CHANNEL = os.getenv("CACHE_INVALIDATION_CHANNEL", "cache_invalidation")
+CACHE_TTL = {
+    "beer": int(os.getenv("CACHE_TTL_BEER", 24 * 60 * 60)),
+    "brewery": int(os.getenv("CACHE_TTL_BREWERY", 7 * 24 * 60 * 60)),
+    "search": int(os.getenv("CACHE_TTL_SEARCH", 60 * 60)),
+    "default": int(os.getenv("CACHE_TTL_DEFAULT", 24 * 60 * 60)),
+}
+CACHE_STALE_TTL = int(os.getenv("CACHE_STALE_TTL", 60 * 60))
+CACHE_NEGATIVE_TTL = int(os.getenv("CACHE_NEGATIVE_TTL", 2 * 60))
+CACHE_REFRESH_WORKERS = int(os.getenv("CACHE_REFRESH_WORKERS", 2))
+CACHE_COMPRESS_THRESHOLD = int(os.getenv("CACHE_COMPRESS_THRESHOLD", 1024))
+
+SEARCH_INDEX_KEY = os.getenv("SEARCH_INDEX_KEY", "search_index")
+SEARCH_INDEX_FUZZY_THRESHOLD = float(os.getenv("SEARCH_INDEX_FUZZY_THRESHOLD", 0.4))
+SEARCH_LOCAL_LIMIT = int(os.getenv("SEARCH_LOCAL_LIMIT", 1))
+SEARCH_LOCAL_MIN_SCORE = float(os.getenv("SEARCH_LOCAL_MIN_SCORE", 0.8))
+
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")  # nosec
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 256))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", 40))
+
+STREAM_PREFIX = os.getenv("STREAM_PREFIX", "updates")
+STREAM_GROUP = os.getenv("STREAM_GROUP", "beer_bot")
+STREAM_SHARDS = int(os.getenv("STREAM_SHARDS", 8))
+STREAM_MAXLEN = int(os.getenv("STREAM_MAXLEN", 100000))
+STREAM_WORKERS = int(os.getenv("STREAM_WORKERS", 1))
+STREAM_WORKER_INDEX = int(os.getenv("STREAM_WORKER_INDEX", 0))
+STREAM_BATCH = int(os.getenv("STREAM_BATCH", 10))
+STREAM_BLOCK = int(os.getenv("STREAM_BLOCK", 1000))
+STREAM_CLAIM_IDLE = int(os.getenv("STREAM_CLAIM_IDLE", 60 * 1000))
+STREAM_MAX_DELIVERIES = int(os.getenv("STREAM_MAX_DELIVERIES", 5))
+STREAM_HANDLER_TIMEOUT = int(os.getenv("STREAM_HANDLER_TIMEOUT", 30 * 1000))
+
+CONVERSATION_BACKEND = os.getenv("CONVERSATION_BACKEND", "redis")
+CONVERSATION_KEY_PREFIX = os.getenv("CONVERSATION_KEY_PREFIX", "conversation")
+CONVERSATION_MAX_ITEMS = int(os.getenv("CONVERSATION_MAX_ITEMS", 50))
+CONVERSATION_MAX_USERS = int(os.getenv("CONVERSATION_MAX_USERS", 10000))
+CONVERSATION_IDLE_TTL = int(os.getenv("CONVERSATION_IDLE_TTL", 24 * 60 * 60))
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_LEVELS = os.getenv("LOG_LEVELS")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 1))
+LOG_MAX_LENGTH = int(os.getenv("LOG_MAX_LENGTH", 1000))
+LOG_SKIP_CONTEXT = os.getenv("LOG_SKIP_CONTEXT", "0") == "1"
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9102))
+
+RECORD_PATH = os.getenv("RECORD_PATH")
+RECORD_SALT = os.getenv("RECORD_SALT")
+RECORD_QUEUE_SIZE = int(os.getenv("RECORD_QUEUE_SIZE", 10000))
+
 ADMINS = os.getenv("ADMINS")
 DEVS = os.getenv("DEVS")
 
 admins = ADMINS.split(",") if ADMINS else []
 devs = list(map(lambda x: int(x), DEVS)) if DEVS else []
+log_levels = dict(item.split("=", 1) for item in LOG_LEVELS.split(",")) if LOG_LEVELS else {}
 
-__all__ = ["TELEGRAM_TOKEN", "UNTAPPD_ID", "UNTAPPD_TOKEN", "admins", "devs", "REDIS_URL", "REDIS_PASSWORD"]
+__all__ = [
+    "TELEGRAM_TOKEN",
+    "TELEGRAM_API_URL",
+    "BOT_MODE",
+    "WEBHOOK_HOST",
+    "WEBHOOK_PORT",
+    "WEBHOOK_PATH",
+    "WEBHOOK_URL",
+    "WEBHOOK_SECRET",
+    "WEBHOOK_QUEUE_SIZE",
+    "WEBHOOK_MAX_CONNECTIONS",
+    "STREAM_PREFIX",
+    "STREAM_GROUP",
+    "STREAM_SHARDS",
+    "STREAM_MAXLEN",
+    "STREAM_WORKERS",
+    "STREAM_WORKER_INDEX",
+    "STREAM_BATCH",
+    "STREAM_BLOCK",
+    "STREAM_CLAIM_IDLE",
+    "STREAM_MAX_DELIVERIES",
+    "STREAM_HANDLER_TIMEOUT",
+    "CONVERSATION_BACKEND",
+    "CONVERSATION_KEY_PREFIX",
+    "CONVERSATION_MAX_ITEMS",
+    "CONVERSATION_MAX_USERS",
+    "CONVERSATION_IDLE_TTL",
+    "UNTAPPD_ID",
+    "UNTAPPD_TOKEN",
+    "UNTAPPD_CONCURRENCY",
+    "UNTAPPD_URL",
+    "UNTAPPD_API_URL",
+    "UNTAPPD_QUOTA_KEY",
+    "UNTAPPD_QUOTA_LIMIT",
+    "UNTAPPD_QUOTA_PERIOD",
+    "UNTAPPD_QUOTA_RESERVE",
+    "UNTAPPD_QUOTA_MIN_REMAINING",
+    "BACKEND_HEDGE_DELAY",
+    "BACKEND_HEDGE_MIN_DELAY",
+    "BACKEND_LATENCY_WINDOW",
+    "BREAKER_ERROR_RATE",
+    "BREAKER_WINDOW",
+    "BREAKER_MIN_CALLS",
+    "BREAKER_OPEN_TIMEOUT",
+    "BREAKER_SLOW_CALL",
+    "HTTP_TIMEOUT",
+    "HTTP_CONNECT_TIMEOUT",
+    "HTTP_POOL_LIMIT",
+    "HTTP_POOL_LIMIT_PER_HOST",
+    "HTTP_DNS_TTL",
+    "HTTP_KEEPALIVE_TIMEOUT",
+    "ASYNC_TIMEOUT",
+    "ASYNC_MAX_PENDING",
+    "SINGLE_FLIGHT_LOCK_TTL",
+    "SINGLE_FLIGHT_TIMEOUT",
+    "SINGLE_FLIGHT_POLL_INTERVAL",
+    "SCRAPER_HTML_PARSER",
+    "SCRAPER_RESTRICT_PARSING",
+    "SCRAPER_CONCURRENCY",
+    "SCRAPER_RATE_LIMIT",
+    "CRAWLER_DOWNLOAD_DELAY",
+    "CRAWLER_MAX_PAGES",
+    "CRAWLER_PAGE_SIZE",
+    "CRAWLER_STATE_TTL",
+    "PREFETCH_QUEUE_SIZE",
+    "PREFETCH_RATE",
+    "PREFETCH_BURST",
+    "PREFETCH_MAX_PENDING",
+    "PREFETCH_SIMILAR_LIMIT",
+    "LOG_LEVEL",
+    "LOG_LEVELS",
+    "LOG_QUEUE_SIZE",
+    "LOG_SAMPLE_RATE",
+    "LOG_MAX_LENGTH",
+    "LOG_SKIP_CONTEXT",
+    "METRICS_HOST",
+    "METRICS_PORT",
+    "RECORD_PATH",
+    "RECORD_SALT",
+    "RECORD_QUEUE_SIZE",
+    "admins",
+    "devs",
+    "log_levels",
+    "REDIS_URL",
+    "REDIS_PASSWORD",
+    "CACHE_LOCAL_SIZE",
+    "CACHE_LOCAL_TTL",
+    "CACHE_INVALIDATION_CHANNEL",
+    "CACHE_TTL",
+    "CACHE_STALE_TTL",
+    "CACHE_NEGATIVE_TTL",
+    "CACHE_REFRESH_WORKERS",
+    "CACHE_COMPRESS_THRESHOLD",
+    "SEARCH_INDEX_KEY",
+    "SEARCH_INDEX_FUZZY_THRESHOLD",
+    "SEARCH_LOCAL_LIMIT",
+    "SEARCH_LOCAL_MIN_SCORE",
+]
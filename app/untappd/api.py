@@ -1,84 +1,153 @@
-from typing import Optional, List
+import asyncio
+from typing import Optional, List, Callable, Awaitable, Iterable, TypeVar
+
+from aiohttp import ClientResponseError
 
 from app.logging import LoggerMixin
-from app.settings import UNTAPPD_ID, UNTAPPD_TOKEN
-from app.utils.fetch import async_get
+from app.settings import UNTAPPD_ID, UNTAPPD_TOKEN, UNTAPPD_CONCURRENCY, UNTAPPD_API_URL
+from app.utils.fetch import async_get, HttpSession
 from app.entities import BreweryShort, Contact, Location, Beer, Similar, SimilarList, Brewery, BeerList
+from .quota import QuotaManager
+
+T = TypeVar("T")
 
 
 class UntappdAPI(LoggerMixin):
     """ API client for Untappd.com """
 
-    base_url = "https://api.untappd.com/v4"
     client_id = UNTAPPD_ID
     client_token = UNTAPPD_TOKEN
     auth_params = f"client_id={client_id}&client_secret={client_token}"
 
-    async def search_beer(self, query, limit: int = 1) -> List[Optional[Beer]]:
-        url = f"{UntappdAPI.base_url}/search/beer?q={query}&{UntappdAPI.auth_params}"
-        response = await async_get(url)
+    def __init__(
+        self,
+        session: Optional[HttpSession] = None,
+        concurrency: int = UNTAPPD_CONCURRENCY,
+        quota: Optional[QuotaManager] = None,
+        base_url: str = UNTAPPD_API_URL,
+    ) -> None:
+        """
+        Init api client with a shared http session and a cap of detail requests running at once.
+        Rate limit headers of every response are reported to `quota`.
+        """
+        super().__init__()
+        self.base_url = base_url
+        self._session = session
+        self._concurrency = max(concurrency, 1)
+        self._quota = quota
+
+    async def close(self) -> None:
+        """Close pooled connections of the http session"""
+        if self._session is not None:
+            await self._session.close()
+
+    async def search_beer(self, query, limit: int = 1) -> List[Beer]:
+        url = f"{self.base_url}/search/beer?q={query}&{UntappdAPI.auth_params}"
+        response = await self._get(url)
         beers = await self._parse_beer_search(response, limit=limit)
         return beers
 
-    async def search_brewery(self, query):
-        url = f"{UntappdAPI.base_url}/search/brewery?q={query}&{UntappdAPI.auth_params}"
-        response = await async_get(url)
-        breweries = self._parse_brewery_search(response, limit=1)
+    async def search_brewery(self, query) -> List[Brewery]:
+        url = f"{self.base_url}/search/brewery?q={query}&{UntappdAPI.auth_params}"
+        response = await self._get(url)
+        breweries = await self._parse_brewery_search(response, limit=1)
         return breweries
 
     async def get_beer(self, beer_id) -> Optional[Beer]:
-        url = f"{UntappdAPI.base_url}/beer/info/{beer_id}?{UntappdAPI.auth_params}"
-        response = await async_get(url)
+        url = f"{self.base_url}/beer/info/{beer_id}?{UntappdAPI.auth_params}"
+        response = await self._get(url, missing_ok=True)
+        if response is None:
+            return None
         raw_beer = response["response"]["beer"]
         beer = self._parse_beer(raw_beer)
         return beer
 
-    async def get_brewery(self, brewery_id: int) -> Brewery:
-        url = f"{UntappdAPI.base_url}/brewery/info/{brewery_id}?{UntappdAPI.auth_params}"
-        response = await async_get(url)
+    async def get_brewery(self, brewery_id: int) -> Optional[Brewery]:
+        url = f"{self.base_url}/brewery/info/{brewery_id}?{UntappdAPI.auth_params}"
+        response = await self._get(url, missing_ok=True)
+        if response is None:
+            return None
         raw_brewery = response["response"]["brewery"]
         brewery = self._parse_brewery(raw_brewery)
         return brewery
 
+    async def get_beers(self, beer_ids: Iterable) -> List[Beer]:
+        """Fetch beers concurrently, beers which can not be fetched are skipped"""
+        return await self._fetch_all(self.get_beer, beer_ids)
+
+    async def get_breweries(self, brewery_ids: Iterable) -> List[Brewery]:
+        """Fetch breweries concurrently, breweries which can not be fetched are skipped"""
+        return await self._fetch_all(self.get_brewery, brewery_ids)
+
     async def get_brewery_by_beer(self, beer_id: int) -> Brewery:
         beer = await self.get_beer(beer_id)
         brewery_id = beer.brewery.id if isinstance(beer, Beer) and isinstance(beer.brewery, BreweryShort) else 0
         brewery = await self.get_brewery(brewery_id)
         return brewery
 
-    async def _parse_beer_search(self, response, limit: int = 3) -> List[Optional[Beer]]:
-        result = []
+    async def _get(self, url: str, missing_ok: bool = False):
+        """Parsed json of the response, None if the item of a `missing_ok` request does not exist"""
+        try:
+            return await async_get(url, session=self._session, on_response=self._observe)
+        except ClientResponseError as e:
+            if missing_ok and e.status == 404:
+                return None
+            raise
+
+    def _observe(self, response) -> None:
+        """Quota is corrected in the executor, so its redis call doesn't block requests of the event loop"""
+        if self._quota is not None:
+            loop = asyncio.get_event_loop()
+            loop.run_in_executor(None, self._quota.observe, response.status, response.headers.copy())
+
+    async def _parse_beer_search(self, response, limit: int = 3) -> List[Beer]:
         try:
-            self.logger.info(f"Try to parse response {response}")
+            self.logger.debug("Try to parse response %s", response)
             beers = response["response"]["beers"]["items"]
-            for beer in beers[0:limit]:
-                beer_id = beer["beer"]["bid"]
-                item = await self.get_beer(beer_id)
-                result.append(item)
-            self.logger.info(f"Successfully parse response {response}")
-            return result
-        except AttributeError as e:
+            beer_ids = [beer["beer"]["bid"] for beer in beers[0:limit]]
+        except (AttributeError, KeyError, TypeError) as e:
             self.logger.error(f"Can not parse response, error {e}")
             return []
+        result = await self._fetch_all(self.get_beer, beer_ids)
+        self.logger.debug("Successfully parse response %s", response)
+        return result
 
-    async def _parse_brewery_search(self, response, limit: int = 3):
-        result = []
+    async def _parse_brewery_search(self, response, limit: int = 3) -> List[Brewery]:
         try:
-            self.logger.info(f"Try to parse response {response}")
+            self.logger.debug("Try to parse response %s", response)
             breweries = response["response"]["brewery"]["items"]
-            for brewery in breweries[0:limit]:
-                brewery_id = brewery["brewery_id"]
-                item = self.get_brewery(brewery_id)
-                result.append(item)
-            self.logger.info(f"Successfully parse response {response}")
-            return result
-        except AttributeError as e:
+            brewery_ids = [brewery["brewery"]["brewery_id"] for brewery in breweries[0:limit]]
+        except (AttributeError, KeyError, TypeError) as e:
             self.logger.error(f"Can not parse response, error {e}")
             return []
+        result = await self._fetch_all(self.get_brewery, brewery_ids)
+        self.logger.debug("Successfully parse response %s", response)
+        return result
+
+    async def _fetch_all(self, fetch: Callable[..., Awaitable[Optional[T]]], item_ids: Iterable) -> List[T]:
+        """
+        Fetch details for every id concurrently, at most `concurrency` requests at once.
+        Results keep the order of `item_ids`, items which failed or were not parsed are skipped.
+        """
+        semaphore = asyncio.Semaphore(self._concurrency)
+
+        async def fetch_one(item_id):
+            async with semaphore:
+                return await fetch(item_id)
+
+        item_ids = list(item_ids)
+        responses = await asyncio.gather(*(fetch_one(item_id) for item_id in item_ids), return_exceptions=True)
+        result = []
+        for item_id, item in zip(item_ids, responses):
+            if isinstance(item, BaseException):
+                self.logger.error(f"Can not fetch item {item_id}, error {item!r}")
+            elif item is not None:
+                result.append(item)
+        return result
 
     def _parse_beer(self, raw_beer) -> Optional[Beer]:
         try:
-            self.logger.info(f"Try to parse response {raw_beer}")
+            self.logger.debug("Try to parse response %s", raw_beer)
             brewery = self._parse_beer_brewery(raw_beer["brewery"])
             similar = self._parse_similar(raw_beer["similar"]["items"])
             result = Beer(
@@ -93,7 +162,7 @@ class UntappdAPI(LoggerMixin):
                 brewery=brewery,
                 similar=similar,
             )
-            self.logger.info(f"Successfully parse response {result}")
+            self.logger.debug("Successfully parse response %s", result)
             return result
         except AttributeError as e:
             self.logger.error(f"Can not parse response, error {e}")
@@ -101,9 +170,9 @@ class UntappdAPI(LoggerMixin):
 
     def _parse_beer_brewery(self, raw_brewery) -> Optional[BreweryShort]:
         try:
-            self.logger.info(f"Try to parse beer brewery {raw_brewery}")
+            self.logger.debug("Try to parse beer brewery %s", raw_brewery)
             result = BreweryShort(id=raw_brewery["brewery_id"], name=raw_brewery["brewery_name"])
-            self.logger.info(f"Successfully parse beer brewery {result}")
+            self.logger.debug("Successfully parse beer brewery %s", result)
             return result
         except AttributeError as e:
             self.logger.error(f"Can not parse beer brewery, error: {e}")
@@ -113,10 +182,9 @@ class UntappdAPI(LoggerMixin):
         result = []
         try:
             for s in similar:
-                self.logger.info(f"Try to parse beer similar {s}")
                 item = Similar(id=s["beer"]["bid"], name=s["beer"]["beer_name"])
                 result.append(item)
-            self.logger.info(f"Successfully parse similar beers {result}")
+            self.logger.debug("Successfully parse similar beers %s", result)
             return result
         except AttributeError as error:
             self.logger.error(f"Can not parse response, error: {error}")
@@ -124,7 +192,7 @@ class UntappdAPI(LoggerMixin):
 
     def _parse_brewery(self, raw_brewery):
         try:
-            self.logger.info(f"Try to parse brewery {raw_brewery}")
+            self.logger.debug("Try to parse brewery %s", raw_brewery)
             raw_contact = raw_brewery["contact"]
             raw_location = raw_brewery["location"]
             result = Brewery(
@@ -140,7 +208,7 @@ class UntappdAPI(LoggerMixin):
                 raters=raw_brewery["rating"]["count"],
                 description=raw_brewery["brewery_description"],
             )
-            self.logger.info(f"Successfully parse brewery {result}")
+            self.logger.debug("Successfully parse brewery %s", result)
             return result
         except AttributeError as error:
             self.logger.error(f"Can not parse response, error {error}")
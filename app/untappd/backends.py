@@ -0,0 +1,240 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from app.logging import LoggerMixin
+from app.metrics import BACKEND_LATENCY, BACKEND_EVENTS
+from app.settings import (
+    BACKEND_HEDGE_DELAY,
+    BACKEND_HEDGE_MIN_DELAY,
+    BACKEND_LATENCY_WINDOW,
+    BREAKER_ERROR_RATE,
+    BREAKER_WINDOW,
+    BREAKER_MIN_CALLS,
+    BREAKER_OPEN_TIMEOUT,
+    BREAKER_SLOW_CALL,
+)
+
+TCall = Tuple[str, Callable[[], Awaitable]]
+
+NO_RESULT = object()
+
+
+class BackendsUnavailableError(RuntimeError):
+    """Raised when circuits of all backends are open"""
+
+
+class CircuitBreaker:
+    """
+    Opens when at least `error_rate` of the last `window` calls failed or took longer than `slow_call` seconds.
+    After `open_timeout` seconds a single probe call is allowed, its success closes the circuit again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        error_rate: float = BREAKER_ERROR_RATE,
+        window: int = BREAKER_WINDOW,
+        min_calls: int = BREAKER_MIN_CALLS,
+        open_timeout: float = BREAKER_OPEN_TIMEOUT,
+        slow_call: float = BREAKER_SLOW_CALL,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._error_rate = error_rate
+        self._min_calls = min_calls
+        self._open_timeout = open_timeout
+        self._slow_call = slow_call
+        self._clock = clock
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._state = CircuitBreaker.CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def available(self) -> bool:
+        """Whether a call would be allowed now, the state is not changed"""
+        with self._lock:
+            if self._state == CircuitBreaker.OPEN:
+                return self._clock() - self._opened_at >= self._open_timeout
+            return not (self._state == CircuitBreaker.HALF_OPEN and self._probing)
+
+    def allow(self) -> bool:
+        """Whether the call may be performed, the first call after `open_timeout` becomes the probe"""
+        with self._lock:
+            if self._state == CircuitBreaker.OPEN and self._clock() - self._opened_at >= self._open_timeout:
+                self._state = CircuitBreaker.HALF_OPEN
+                self._probing = False
+            if self._state == CircuitBreaker.HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+                return True
+            return self._state == CircuitBreaker.CLOSED
+
+    def record(self, success: bool, latency: float) -> None:
+        success = success and latency < self._slow_call
+        with self._lock:
+            if self._state == CircuitBreaker.HALF_OPEN:
+                self._probing = False
+                if success:
+                    self._state = CircuitBreaker.CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self._min_calls and failures / len(self._outcomes) >= self._error_rate:
+                self._open()
+
+    def abandon(self, elapsed: float) -> None:
+        """Cancelled call is counted as failed only if it was slow already, otherwise it has no outcome"""
+        if elapsed >= self._slow_call:
+            self.record(False, elapsed)
+            return
+        with self._lock:
+            self._probing = False
+
+    def _open(self) -> None:
+        self._state = CircuitBreaker.OPEN
+        self._opened_at = self._clock()
+        self._outcomes.clear()
+
+
+class LatencyTracker:
+    """Latencies of the last `window` successful calls"""
+
+    def __init__(self, window: int = BACKEND_LATENCY_WINDOW, min_samples: int = 10) -> None:
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._min_samples = min_samples
+
+    def add(self, latency: float) -> None:
+        self._latencies.append(latency)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """Latency not exceeded by `percent` of calls, None until there are enough samples"""
+        latencies = sorted(self._latencies)
+        if len(latencies) < self._min_samples:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percent / 100))]
+
+
+class BackendSelector(LoggerMixin):
+    """
+    Performs a call with the first available of backends ordered by preference, e.g. the API and the scraper.
+    Each backend has a circuit breaker, and backends with open circuits are skipped.
+    If a hedged call is not answered within p95 latency of the backend, the same call is sent to the next backend
+    as well, the first successful answer wins and the other call is cancelled.
+    A failed call or an empty result falls back to the next backend right away.
+    """
+
+    def __init__(
+        self,
+        names: Sequence[str] = ("api", "scraper"),
+        hedge_delay: float = BACKEND_HEDGE_DELAY,
+        min_delay: float = BACKEND_HEDGE_MIN_DELAY,
+        breaker_factory: Callable[[], CircuitBreaker] = CircuitBreaker,
+    ) -> None:
+        super().__init__()
+        self._hedge_delay = hedge_delay
+        self._min_delay = min_delay
+        self._breakers: Dict[str, CircuitBreaker] = {name: breaker_factory() for name in names}
+        self._latencies: Dict[str, LatencyTracker] = {name: LatencyTracker() for name in names}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {"hedged": 0, "hedge_wins": 0, "fallbacks": 0}
+
+    def available(self, name: str) -> bool:
+        return self._breakers[name].available()
+
+    def hedge_delay(self, name: str) -> float:
+        """Time to wait for the backend before hedging, p95 of its latency once it is known"""
+        p95 = self._latencies[name].percentile(95)
+        return self._hedge_delay if p95 is None else max(self._min_delay, p95)
+
+    async def call(self, calls: List[TCall], hedge: bool = True):
+        """
+        Result of the first successful call, an empty result is returned only if no other backend is left.
+        The last error is raised if all of them failed.
+        """
+        candidates = [(name, call) for name, call in calls if self._breakers[name].allow()]
+        if not candidates:
+            raise BackendsUnavailableError(f"Circuits of {[name for name, _ in calls]} are open")
+        loop = asyncio.get_event_loop()
+        running: Dict[asyncio.Future, Tuple[str, float]] = {}
+        error: Optional[BaseException] = None
+        empty = NO_RESULT
+
+        def launch() -> str:
+            name, call = candidates.pop(0)
+            running[asyncio.ensure_future(call())] = (name, loop.time())
+            return name
+
+        primary = launch()
+        try:
+            while running:
+                timeout = self.hedge_delay(primary) if hedge and candidates and len(running) == 1 else None
+                done, _ = await asyncio.wait(list(running), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.logger.info(f"Backend {primary} is slow, hedge with {candidates[0][0]}")
+                    self._count("hedged")
+                    launch()
+                    continue
+                for future in done:
+                    name, started = running.pop(future)
+                    exception = future.exception()
+                    self._record(name, exception is None, loop.time() - started)
+                    if exception is not None:
+                        error = exception
+                        self.logger.error(f"Backend {name} failed, error {error!r}")
+                    elif future.result() or not (running or candidates):
+                        if name != primary:
+                            self._count("hedge_wins")
+                        return future.result()
+                    else:
+                        empty = future.result()
+                if not running and candidates:
+                    self._count("fallbacks")
+                    launch()
+        finally:
+            for future, (name, started) in running.items():
+                future.cancel()
+                self._breakers[name].abandon(loop.time() - started)
+                BACKEND_LATENCY.observe(loop.time() - started, backend=name, outcome="cancelled")
+            for name, _ in candidates:
+                self._breakers[name].abandon(0.0)
+        if empty is not NO_RESULT:
+            return empty
+        raise error if error is not None else BackendsUnavailableError("No backend answered")
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            result: Dict[str, float] = dict(self._stats)
+        for name, breaker in self._breakers.items():
+            result[f"{name}_open"] = int(breaker.state != CircuitBreaker.CLOSED)
+            p95 = self._latencies[name].percentile(95)
+            if p95 is not None:
+                result[f"{name}_p95"] = p95
+        return result
+
+    def _record(self, name: str, success: bool, latency: float) -> None:
+        self._breakers[name].record(success, latency)
+        BACKEND_LATENCY.observe(latency, backend=name, outcome="ok" if success else "error")
+        if success:
+            self._latencies[name].add(latency)
+
+    def _count(self, name: str) -> None:
+        BACKEND_EVENTS.inc(event=name)
+        with self._lock:
+            self._stats[name] += 1
+
+
+__all__ = ["BackendSelector", "BackendsUnavailableError", "CircuitBreaker", "LatencyTracker"]
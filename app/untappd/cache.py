@@ -1,77 +1,746 @@
 import json
+import threading
+import time
+import unicodedata
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from uuid import uuid4
+
+import msgpack
 from redis.exceptions import RedisError
 from dataclasses import asdict
 
 from app.logging import LoggerMixin
-from app.entities import Beer, Brewery
+from app.metrics import CACHE_REQUESTS, key_type
+from app.entities import Beer, Brewery, BreweryShort, Similar, Contact, Location
+from app.settings import (
+    CACHE_LOCAL_SIZE,
+    CACHE_LOCAL_TTL,
+    CACHE_INVALIDATION_CHANNEL,
+    CACHE_TTL,
+    CACHE_STALE_TTL,
+    CACHE_NEGATIVE_TTL,
+    CACHE_REFRESH_WORKERS,
+    CACHE_COMPRESS_THRESHOLD,
+)
+from .search_index import SearchIndex
+
+NOT_FOUND = object()
+"""Cached marker of an item which does not exist upstream"""
+
+NEGATIVE_VALUE = b"null"
+
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class Codec(ABC):
+    """Base class of entity serialization formats, `version` is the first byte of every encoded value"""
+
+    version: int = 0
+    headerless: bool = False
+
+    @abstractmethod
+    def encode(self, value) -> bytes:
+        ...
+
+    @abstractmethod
+    def decode(self, entity_type: str, payload: bytes):
+        ...
+
+
+class JsonCodec(Codec):
+    """Legacy format: json of the whole dataclass, the opening brace serves as its version byte"""
+
+    version = ord("{")
+    headerless = True
+
+    def encode(self, value) -> bytes:
+        return json.dumps(asdict(value)).encode()
+
+    def decode(self, entity_type: str, payload: bytes):
+        if entity_type == "beer":
+            return self.decode_beer(payload)
+        return self.decode_brewery(payload)
+
+    @staticmethod
+    def decode_beer(payload: bytes) -> Beer:
+        """Preparing beer entity for bot"""
+        beer = json.loads(payload)
+        brewery = beer["brewery"]
+        similar = beer["similar"]
+        result = Beer(**beer)
+        result.set_brewery(brewery)
+        result.set_similar(similar)
+        return result
+
+    @staticmethod
+    def decode_brewery(payload: bytes) -> Brewery:
+        """Preparing brewery entity for bot"""
+        brewery = json.loads(payload)
+        location = brewery["location"]
+        contact = brewery["contact"]
+        result = Brewery(**brewery)
+        result.set_location(location)
+        result.set_contact(contact)
+        return result
+
+
+class MsgpackCodec(Codec):
+    """Compact format: msgpack array of entity fields in the order of the schema below, without field names"""
+
+    version = 1
+
+    def encode(self, value) -> bytes:
+        if isinstance(value, Beer):
+            return msgpack.packb(self._beer_to_tuple(value), use_bin_type=True)
+        return msgpack.packb(self._brewery_to_tuple(value), use_bin_type=True)
+
+    def decode(self, entity_type: str, payload: bytes):
+        fields = msgpack.unpackb(payload, raw=False)
+        if entity_type == "beer":
+            return self._beer_from_tuple(fields)
+        return self._brewery_from_tuple(fields)
+
+    @staticmethod
+    def _beer_to_tuple(beer: Beer) -> tuple:
+        brewery = (beer.brewery.id, beer.brewery.name) if beer.brewery is not None else None
+        similar = [(item.id, item.name) for item in beer.similar]
+        return (
+            beer.id,
+            beer.name,
+            beer.style,
+            beer.abv,
+            beer.ibu,
+            beer.rating,
+            beer.raters,
+            beer.description,
+            brewery,
+            similar,
+        )
+
+    @staticmethod
+    def _beer_from_tuple(fields: list) -> Beer:
+        beer_id, name, style, abv, ibu, rating, raters, description, brewery, similar = fields
+        return Beer(
+            id=beer_id,
+            name=name,
+            style=style,
+            abv=abv,
+            ibu=ibu,
+            rating=rating,
+            raters=raters,
+            description=description,
+            brewery=BreweryShort(*brewery) if brewery is not None else None,
+            similar=[Similar(*item) for item in similar],
+        )
+
+    @staticmethod
+    def _brewery_to_tuple(brewery: Brewery) -> tuple:
+        contact = (brewery.contact.twitter, brewery.contact.facebook, brewery.contact.url)
+        location = (brewery.location.lat, brewery.location.lng)
+        return (
+            brewery.id,
+            brewery.name,
+            brewery.brewery_type,
+            brewery.country,
+            brewery.description,
+            contact,
+            location,
+            brewery.rating,
+            brewery.raters,
+        )
+
+    @staticmethod
+    def _brewery_from_tuple(fields: list) -> Brewery:
+        brewery_id, name, brewery_type, country, description, contact, location, rating, raters = fields
+        return Brewery(
+            id=brewery_id,
+            name=name,
+            brewery_type=brewery_type,
+            country=country,
+            description=description,
+            contact=Contact(*contact),
+            location=Location(*location),
+            rating=rating,
+            raters=raters,
+        )
+
+
+class VersionedCodec:
+    """
+    Writes values with the given codec and reads values of every known codec by their version byte.
+    Payloads longer than `compress_threshold` bytes are compressed with zlib, which is marked by the high bit
+    of the version byte. Values of headerless codecs are stored as is.
+    """
+
+    COMPRESSED = 0x80
+
+    def __init__(self, codec: Codec, compress_threshold: int = CACHE_COMPRESS_THRESHOLD, readers=None) -> None:
+        self._codec = codec
+        self._compress_threshold = compress_threshold
+        readers = readers if readers is not None else [JsonCodec(), MsgpackCodec()]
+        self._readers: Dict[int, Codec] = {reader.version: reader for reader in readers}
+        self._readers[codec.version] = codec
+
+    def encode(self, value) -> bytes:
+        payload = self._codec.encode(value)
+        if self._codec.headerless:
+            return payload
+        version = self._codec.version
+        if 0 < self._compress_threshold < len(payload):
+            payload = zlib.compress(payload)
+            version |= VersionedCodec.COMPRESSED
+        return bytes((version,)) + payload
+
+    def decode(self, entity_type: str, data: bytes):
+        version = data[0]
+        reader = self._readers.get(version)
+        if reader is not None and reader.headerless:
+            return reader.decode(entity_type, data)
+        payload = data[1:]
+        if version & VersionedCodec.COMPRESSED:
+            version &= ~VersionedCodec.COMPRESSED
+            reader = self._readers.get(version)
+            payload = zlib.decompress(payload)
+        if reader is None:
+            raise ValueError(f"Unknown cache format version {version}")
+        return reader.decode(entity_type, payload)
 
 
 class RedisCache(LoggerMixin):
-    def __init__(self, redis):
+    """
+    Entities cache in redis. Every key lives for the ttl of its entity type plus a stale window.
+    During the stale window the item is still served while a single background refresh updates it.
+    Items which were not found upstream are cached for a short time as NOT_FOUND.
+    Beers and breweries written to the cache are added to the local search `index` if it is given,
+    they expire there together with their keys and are removed when they are not found anymore.
+    """
+
+    def __init__(
+        self,
+        redis,
+        ttl: Optional[Dict[str, int]] = None,
+        stale_ttl: int = CACHE_STALE_TTL,
+        negative_ttl: int = CACHE_NEGATIVE_TTL,
+        refresh_workers: int = CACHE_REFRESH_WORKERS,
+        codec: Optional[VersionedCodec] = None,
+        index: Optional[SearchIndex] = None,
+    ):
         super().__init__()
         self._cache = redis
+        self._index = index
+        self._codec = codec if codec is not None else VersionedCodec(MsgpackCodec())
+        self._ttl = ttl if ttl is not None else CACHE_TTL
+        self._stale_ttl = stale_ttl
+        self._negative_ttl = negative_ttl
+        self._refresh_workers = refresh_workers
+        self._refresher: Optional[ThreadPoolExecutor] = None
+        self._refreshing: Set[str] = set()
+        self._refresh_lock = threading.Lock()
 
-    def get_from_cache(self, key: str):
-        """Get item from redis cache and prepare it for bot"""
-        self.logger.info(f"Check redis cache {key}")
+    def get_from_cache(self, key: str, refresh: Optional[Callable[[], None]] = None):
+        """
+        Get item from redis cache and prepare it for bot.
+        If the item is stale it is returned as is and `refresh` is scheduled to update it in background.
+        """
+        self.logger.debug("Check redis cache %s", key)
         result = None
         try:
-            response = self._cache.get(key)
-            if response is not None:
+            pipeline = self._cache.pipeline(transaction=False)
+            pipeline.get(key)
+            pipeline.ttl(key)
+            response, ttl = pipeline.execute()
+            if response == NEGATIVE_VALUE:
+                result = NOT_FOUND
+            elif response is not None:
                 result = self.prepare_response(key, response)
+                if refresh is not None and self.is_stale(ttl):
+                    self.refresh(key, refresh)
+            CACHE_REQUESTS.inc(level="redis", key_type=key_type(key), result="miss" if result is None else "hit")
         except RedisError as e:
             result = None
+            CACHE_REQUESTS.inc(level="redis", key_type=key_type(key), result="error")
             self.logger.error(f"Can't connect to redis cache: {e}")
         finally:
             return result
 
     def set_to_cache(self, key: str, value):
-        """Set entity item to redis cache"""
+        """Set entity item to redis cache, None is cached as not found item"""
+        if value is None or value is NOT_FOUND:
+            return self.set_not_found(key)
+        result: bool = False
+        try:
+            cache_value = self._codec.encode(value)
+            result = self._cache.set(key, cache_value, ex=self.get_ttl(key) + self._stale_ttl)
+            self.logger.debug("Set redis cache %s %s %s", key, value, result)
+            if result and self._index is not None:
+                self._index.add(key, value, ttl=self.get_ttl(key) + self._stale_ttl)
+        except RedisError as e:
+            self.logger.error(f"Redis error: {e}")
+        finally:
+            return result
+
+    def get_many(
+        self, keys: List[str], refresh: Optional[Callable[[str], None]] = None
+    ) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        Get items from redis cache in one round trip.
+        Returns found items by key, including NOT_FOUND ones, and keys which are missing in the cache.
+        Stale items are returned as well and `refresh` is scheduled for each of their keys.
+        """
+        found: Dict[str, Any] = {}
+        if not keys:
+            return found, []
+        self.logger.debug("Check redis cache %s", keys)
+        try:
+            pipeline = self._cache.pipeline(transaction=False)
+            pipeline.mget(keys)
+            for key in keys:
+                pipeline.ttl(key)
+            responses, *ttls = pipeline.execute()
+        except RedisError as e:
+            self.logger.error(f"Can't connect to redis cache: {e}")
+            self._count_requests("redis", keys, "error")
+            return found, list(keys)
+        for key, response, ttl in zip(keys, responses, ttls):
+            if response == NEGATIVE_VALUE:
+                found[key] = NOT_FOUND
+            elif response is not None:
+                result = self.prepare_response(key, response)
+                if result is None:
+                    continue
+                found[key] = result
+                if refresh is not None and self.is_stale(ttl):
+                    self.refresh(key, partial(refresh, key))
+        missed = [key for key in keys if key not in found]
+        self._count_requests("redis", found, "hit")
+        self._count_requests("redis", missed, "miss")
+        return found, missed
+
+    @staticmethod
+    def _count_requests(level: str, keys, result: str) -> None:
+        counts: Dict[str, int] = {}
+        for key in keys:
+            counts[key_type(key)] = counts.get(key_type(key), 0) + 1
+        for item_type, count in counts.items():
+            CACHE_REQUESTS.inc(count, level=level, key_type=item_type, result=result)
+
+    def set_many(self, items: Dict[str, Any]) -> bool:
+        """Set entity items to redis cache in one round trip, None is cached as not found item"""
+        if not items:
+            return True
+        result: bool = False
+        try:
+            pipeline = self._cache.pipeline(transaction=False)
+            for key, value in items.items():
+                if value is None or value is NOT_FOUND:
+                    pipeline.set(key, NEGATIVE_VALUE, ex=self._negative_ttl)
+                else:
+                    pipeline.set(key, self._codec.encode(value), ex=self.get_ttl(key) + self._stale_ttl)
+            result = all(pipeline.execute())
+            self.logger.debug("Set redis cache %s %s", list(items), result)
+            if result and self._index is not None:
+                for key, value in items.items():
+                    if value is None or value is NOT_FOUND:
+                        self._index.remove(key)
+                    else:
+                        self._index.add(key, value, ttl=self.get_ttl(key) + self._stale_ttl)
+        except RedisError as e:
+            self.logger.error(f"Redis error: {e}")
+        finally:
+            return result
+
+    def encode(self, value) -> bytes:
+        """Entity as it is stored in redis"""
+        return self._codec.encode(value)
+
+    def touch(self, key: str) -> bool:
+        """Prolong time to live of item which is known to be up to date"""
+        result: bool = False
+        try:
+            result = bool(self._cache.expire(key, self.get_ttl(key) + self._stale_ttl))
+            if result and self._index is not None:
+                self._index.touch(key, self.get_ttl(key) + self._stale_ttl)
+        except RedisError as e:
+            self.logger.error(f"Redis error: {e}")
+        finally:
+            return result
+
+    def fresh_keys(self, keys: List[str]) -> Set[str]:
+        """Keys of items which are cached and are not stale yet"""
+        if not keys:
+            return set()
+        try:
+            pipeline = self._cache.pipeline(transaction=False)
+            for key in keys:
+                pipeline.ttl(key)
+            ttls = pipeline.execute()
+        except RedisError as e:
+            self.logger.error(f"Redis error: {e}")
+            return set()
+        return {key for key, ttl in zip(keys, ttls) if ttl is not None and ttl > self._stale_ttl}
+
+    def set_not_found(self, key: str) -> bool:
+        """Remember for a short time that item does not exist"""
+        result: bool = False
+        try:
+            result = self._cache.set(key, NEGATIVE_VALUE, ex=self._negative_ttl)
+            self.logger.info("Set redis negative cache %s %s", key, result)
+            if result and self._index is not None:
+                self._index.remove(key)
+        except RedisError as e:
+            self.logger.error(f"Redis error: {e}")
+        finally:
+            return result
+
+    def get_ttl(self, key: str) -> int:
+        """Fresh time to live of item by its entity type"""
+        entity_type = key.split("_", 1)[0]
+        return self._ttl.get(entity_type, self._ttl["default"])
+
+    def is_stale(self, ttl: Optional[int]) -> bool:
+        """Items without expiry were written before ttl was introduced and are stale as well"""
+        return ttl is not None and (ttl == -1 or 0 <= ttl <= self._stale_ttl)
+
+    def refresh(self, key: str, refresh: Callable[[], None]) -> bool:
+        """Schedule background refresh of the key unless it is already refreshing in any process"""
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+        try:
+            locked = self._cache.set(f"refresh_{key}", 1, nx=True, ex=self._stale_ttl)
+        except RedisError as e:
+            self.logger.error(f"Redis error: {e}")
+            locked = False
+        if not locked:
+            with self._refresh_lock:
+                self._refreshing.discard(key)
+            return False
+        if self._refresher is None:
+            self._refresher = ThreadPoolExecutor(self._refresh_workers, thread_name_prefix="cache-refresh")
+        self._refresher.submit(self._refresh, key, refresh)
+        return True
+
+    def stop(self) -> None:
+        """Stop background refreshes"""
+        if self._refresher is not None:
+            self._refresher.shutdown(wait=False)
+            self._refresher = None
+
+    def _refresh(self, key: str, refresh: Callable[[], None]) -> None:
+        self.logger.info("Refresh stale redis cache %s", key)
+        try:
+            refresh()
+        except Exception as e:
+            self.logger.error(f"Can't refresh redis cache {key}: {e!r}")
+        finally:
+            with self._refresh_lock:
+                self._refreshing.discard(key)
+            try:
+                self._cache.delete(f"refresh_{key}")
+            except RedisError as e:
+                self.logger.error(f"Redis error: {e}")
+
+    def get_search_result(self, query: str, search_type: str) -> Optional[List[int]]:
+        """Get ordered ids of items found by the query earlier"""
+        key = self.get_search_key(query, search_type)
+        self.logger.debug("Check redis search cache %s", key)
+        result = None
+        try:
+            response = self._cache.get(key)
+            if response is not None:
+                result = json.loads(response)
+            CACHE_REQUESTS.inc(level="redis", key_type="search", result="miss" if result is None else "hit")
+        except RedisError as e:
+            CACHE_REQUESTS.inc(level="redis", key_type="search", result="error")
+            self.logger.error(f"Can't connect to redis cache: {e}")
+        except ValueError as e:
+            self.logger.error(f"Can't parse redis search response: {e!r}")
+        finally:
+            return result
+
+    def set_search_result(self, query: str, search_type: str, item_ids: List[int]) -> bool:
+        """Set ordered ids of items found by the query"""
+        key = self.get_search_key(query, search_type)
+        result: bool = False
+        try:
+            result = self._cache.set(key, json.dumps(item_ids), ex=self.get_ttl(key))
+            self.logger.debug("Set redis search cache %s %s %s", key, item_ids, result)
+        except RedisError as e:
+            self.logger.error(f"Redis error: {e}")
+        finally:
+            return result
+
+    def search_index(self, query: str, search_type: str, limit: int, min_score: float = 0.0) -> List[Tuple[int, float]]:
+        """Ids and match scores of cached items found by the local search index"""
+        if self._index is None:
+            return []
+        return self._index.search(query, search_type, limit, min_score)
+
+    def load_index(self) -> None:
+        """Load persisted local search index in background"""
+        if self._index is not None:
+            threading.Thread(target=self._index.load, name="search-index-load", daemon=True).start()
+
+    def acquire_lock(self, key: str, ttl: float) -> Optional[str]:
+        """Acquire short lock of the key shared by all processes, returns token of the lock owner"""
+        token = uuid4().hex
+        try:
+            if self._cache.set(f"lock_{key}", token, nx=True, px=int(ttl * 1000)):
+                return token
+            return None
+        except RedisError as e:
+            self.logger.error(f"Redis error: {e}")
+            return token
+
+    def release_lock(self, key: str, token: str) -> bool:
+        """Release the lock if it is still owned by the token"""
+        result: bool = False
+        try:
+            result = bool(self._cache.eval(RELEASE_LOCK_SCRIPT, 1, f"lock_{key}", token))
+        except RedisError as e:
+            self.logger.error(f"Redis error: {e}")
+        finally:
+            return result
+
+    @staticmethod
+    def get_search_key(query: str, search_type: str) -> str:
+        return f"search_{search_type}_{RedisCache.normalize_query(query)}"
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """Queries differing only in case, unicode form or whitespaces share the same result"""
+        return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+    def delete_from_cache(self, key: str) -> bool:
+        """Delete item from redis cache"""
         result: bool = False
         try:
-            cache_value = json.dumps(asdict(value))
-            result = self._cache.set(key, cache_value)
-            self.logger.info(f"Set redis cache {key} {value} {result}")
+            result = bool(self._cache.delete(key))
+            self.logger.info("Delete redis cache %s %s", key, result)
+            if self._index is not None:
+                self._index.remove(key)
         except RedisError as e:
             self.logger.error(f"Redis error: {e}")
         finally:
             return result
 
     def prepare_response(self, key, response):
-        self.logger.info(f"Try to parse redis response {response}")
+        self.logger.debug("Try to parse redis response %s", response)
         result = None
         try:
             if key.startswith("beer"):
-                result = self.prepare_beer(response)
+                result = self._codec.decode("beer", response)
             elif key.startswith("brewery"):
-                result = self.prepare_brewery(response)
+                result = self._codec.decode("brewery", response)
             else:
                 result = response
-            self.logger.info(f"Parse redis response successfully {result}")
-        except AttributeError as e:
-            self.logger("Can't parse redis response")
+            self.logger.debug("Parse redis response successfully %s", result)
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            self.logger.error(f"Can't parse redis response: {e!r}")
         finally:
             return result
 
-    def prepare_beer(self, response) -> Beer:
-        """Preparing beer entity for bot"""
-        beer = json.loads(response)
-        brewery = beer["brewery"]
-        similar = beer["similar"]
-        result = Beer(**beer)
-        result.set_brewery(brewery)
-        result.set_similar(similar)
+
+class LocalCache:
+    """Thread safe in-process LRU cache, entries are evicted by size and by time to live"""
+
+    def __init__(
+        self, max_size: int = CACHE_LOCAL_SIZE, ttl: float = CACHE_LOCAL_TTL, clock: Callable = time.monotonic
+    ) -> None:
+        self._max_size = max_size
+        self._ttl = ttl
+        self._clock = clock
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= self._clock():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key: str, value) -> None:
+        if self._max_size <= 0:
+            return
+        with self._lock:
+            self._items[key] = (self._clock() + self._ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self._max_size:
+                self._items.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+class TieredCache(RedisCache):
+    """
+    Redis cache with in-process LRU cache of ready entities in front of it.
+    Writes go through both levels and invalidations are broadcast to other processes via redis pub/sub.
+    """
+
+    def __init__(
+        self,
+        redis,
+        local: LocalCache,
+        channel: str = CACHE_INVALIDATION_CHANNEL,
+        index: Optional[SearchIndex] = None,
+    ):
+        super().__init__(redis, index=index)
+        self._local = local
+        self._channel = channel
+        self._origin = uuid4().hex
+        self._listener = None
+        self._stats_lock = threading.Lock()
+        self._stats: Dict[str, int] = {"local_hits": 0, "redis_hits": 0, "misses": 0}
+
+    def get_from_cache(self, key: str, refresh: Optional[Callable[[], None]] = None):
+        """Get item from local cache, then from redis cache"""
+        result = self._local.get(key)
+        if result is not None:
+            self._count("local_hits")
+            CACHE_REQUESTS.inc(level="local", key_type=key_type(key), result="hit")
+            return result
+        CACHE_REQUESTS.inc(level="local", key_type=key_type(key), result="miss")
+        result = super().get_from_cache(key, refresh)
+        if result is not None:
+            self._count("redis_hits")
+            self._local.set(key, result)
+        else:
+            self._count("misses")
         return result
 
-    def prepare_brewery(self, response) -> Brewery:
-        """Preparing brewery entity for bot"""
-        brewery = json.loads(response)
-        location = brewery["location"]
-        contact = brewery["contact"]
-        result = Brewery(**brewery)
-        result.set_location(location)
-        result.set_contact(contact)
+    def get_many(
+        self, keys: List[str], refresh: Optional[Callable[[str], None]] = None
+    ) -> Tuple[Dict[str, Any], List[str]]:
+        """Get items from local cache, then the rest of them from redis cache in one round trip"""
+        found: Dict[str, Any] = {}
+        remote_keys = []
+        for key in keys:
+            result = self._local.get(key)
+            if result is not None:
+                found[key] = result
+            else:
+                remote_keys.append(key)
+        self._count("local_hits", len(found))
+        self._count_requests("local", found, "hit")
+        self._count_requests("local", remote_keys, "miss")
+        if remote_keys:
+            remote, missed = super().get_many(remote_keys, refresh)
+            for key, result in remote.items():
+                self._local.set(key, result)
+            found.update(remote)
+            self._count("redis_hits", len(remote))
+            self._count("misses", len(missed))
+        return found, [key for key in keys if key not in found]
+
+    def set_many(self, items: Dict[str, Any]) -> bool:
+        """Set entity items to both levels and evict them from local caches of other processes"""
+        result = super().set_many(items)
+        for key, value in items.items():
+            self._local.set(key, NOT_FOUND if value is None else value)
+        self._publish(*items)
         return result
 
+    def set_to_cache(self, key: str, value):
+        """Set entity item to both levels and evict it from local caches of other processes"""
+        result = super().set_to_cache(key, value)
+        self._local.set(key, NOT_FOUND if value is None else value)
+        self._publish(key)
+        return result
+
+    def delete_from_cache(self, key: str) -> bool:
+        """Delete item from both levels in every process"""
+        result = super().delete_from_cache(key)
+        self._local.delete(key)
+        self._publish(key)
+        return result
+
+    def listen(self) -> None:
+        """Start background thread receiving invalidations from other processes"""
+        if self._listener is not None:
+            return
+        try:
+            pubsub = self._cache.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self._channel: self._on_invalidate})
+            self._listener = pubsub.run_in_thread(sleep_time=1, daemon=True)
+            self.logger.info("Listen cache invalidations on %s", self._channel)
+        except RedisError as e:
+            self.logger.error(f"Can't subscribe to cache invalidations: {e}")
+
+    def stop(self) -> None:
+        """Stop background refreshes and invalidation listener"""
+        super().stop()
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    def stats(self) -> Dict[str, float]:
+        """Hit counters and ratios of local and redis levels"""
+        with self._stats_lock:
+            result: Dict[str, float] = dict(self._stats)
+        total = result["local_hits"] + result["redis_hits"] + result["misses"]
+        redis_lookups = result["redis_hits"] + result["misses"]
+        result["local_size"] = len(self._local)
+        result["local_hit_ratio"] = result["local_hits"] / total if total else 0.0
+        result["redis_hit_ratio"] = result["redis_hits"] / redis_lookups if redis_lookups else 0.0
+        return result
+
+    def _count(self, name: str, value: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[name] += value
+
+    def _publish(self, *keys: str) -> None:
+        try:
+            pipeline = self._cache.pipeline(transaction=False)
+            for key in keys:
+                pipeline.publish(self._channel, f"{self._origin}:{key}")
+            pipeline.execute()
+        except RedisError as e:
+            self.logger.error(f"Can't publish cache invalidation {keys}: {e}")
+
+    def _on_invalidate(self, message) -> None:
+        data = message["data"]
+        data = data.decode() if isinstance(data, bytes) else str(data)
+        origin, _, key = data.partition(":")
+        if origin != self._origin:
+            self._local.delete(key)
+            if self._index is not None:
+                self._index.refresh(key)
+            self.logger.info("Local cache invalidated %s", key)
+
 
-__all__ = ["RedisCache"]
+__all__ = [
+    "RedisCache",
+    "LocalCache",
+    "TieredCache",
+    "NOT_FOUND",
+    "Codec",
+    "JsonCodec",
+    "MsgpackCodec",
+    "VersionedCodec",
+]
@@ -1,65 +1,239 @@
-from typing import TypeVar, Literal
-
 import asyncio
+from functools import partial
+from typing import Dict, List, TypeVar, Literal, Optional, Union
+
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from aiohttp import ClientError
 from aiohttp.web import HTTPException
 
-from app.entities import Brewery
+from app.entities import Beer, Brewery, BreweryShort
 from app.logging import LoggerMixin
-from .scraper import UntappdScraper
+from app.metrics import ACTION_LATENCY
+from app.settings import SEARCH_LOCAL_LIMIT, SEARCH_LOCAL_MIN_SCORE
+from app.utils.event_loop import EventLoopThread, LoopOverloadedError
+from .scraper import UntappdScraper, AsyncUntappdScraper
 from .api import UntappdAPI
+from .cache import NOT_FOUND
+from .single_flight import SingleFlight
+from .quota import QuotaManager
+from .backends import BackendSelector, BackendsUnavailableError, TCall
 
 TUntappdClient = TypeVar("TUntappdClient", bound="UntappdClient")
 TItem = Literal["beer", "brewery"]
+BATCH_ACTIONS = {"beer": "get_beers", "brewery": "get_breweries"}
+SEARCH_ACTIONS = {"search_beer": "get_beer", "search_brewery": "get_brewery"}
+SEARCH_LIMIT = 1
+"""Number of items found by upstream search, the API gives the best match only"""
+
+FAILED = object()
+"""Result of an action which was not performed, unlike None it does not mean that the item does not exist"""
 
 
 class UntappdClient(LoggerMixin):
     """A facade class used for untappd"""
 
-    def __init__(self, api: UntappdAPI, scraper: UntappdScraper, cache):
+    def __init__(
+        self,
+        api: UntappdAPI,
+        scraper: Union[UntappdScraper, AsyncUntappdScraper],
+        cache,
+        runner: EventLoopThread,
+        single_flight: Optional[SingleFlight] = None,
+        quota: Optional[QuotaManager] = None,
+        backends: Optional[BackendSelector] = None,
+    ):
         super().__init__()
         self._api = api
         self._scraper = scraper
         self._cache = cache
+        self._runner = runner
+        self._single_flight = single_flight if single_flight is not None else SingleFlight(cache)
+        self._quota = quota
+        self._backends = backends if backends is not None else BackendSelector()
 
-    def perform_action(self, action_name, default_result, *args, **kwargs):
-        """Get item by api of by scraping"""
+    def perform_action(self, action_name, default_result, *args, cost: int = 1, background: bool = False, **kwargs):
+        """
+        Get item by api or by scraping.
+        The API is skipped when its circuit is open or its quota for `cost` calls is not granted,
+        `background` calls are not granted the quota reserved for interactive ones.
+        Interactive calls are hedged with the scraper when the API is slower than usual.
+        """
         api_action = getattr(self._api, action_name)
-        scrapper_action = getattr(self._scraper, action_name)
+        calls: List[TCall] = []
+        if not self._backends.available("api"):
+            self.logger.info("Untappd API circuit is open, %s is scraped", action_name)
+        elif self._quota is not None and not self._quota.acquire(cost, background):
+            self.logger.info("Untappd API quota is low, %s is scraped", action_name)
+        else:
+            calls.append(("api", lambda: api_action(*args, **kwargs)))
+        calls.append(("scraper", lambda: self._scrape(action_name, *args, **kwargs)))
         result = default_result
         try:
-            result = asyncio.new_event_loop().run_until_complete(api_action(*args, **kwargs))
-        except HTTPException:
-            result = scrapper_action(*args, **kwargs)
+            with ACTION_LATENCY.labels(action=action_name).time():
+                result = self._runner.run(self._backends.call(calls, hedge=not background))
+        except (FutureTimeoutError, LoopOverloadedError, BackendsUnavailableError) as e:
+            self.logger.error(f"Action {action_name} was not performed, error {e!r}")
+        except (HTTPException, ClientError, asyncio.TimeoutError) as e:
+            self.logger.error(f"Action {action_name} failed, error {e!r}")
         finally:
             return result
 
+    async def _scrape(self, action_name, *args, **kwargs):
+        """Perform action by the scraper, found search items are fetched to give the same entities as the API"""
+        result = await self._scrape_action(action_name, *args, **kwargs)
+        if action_name in SEARCH_ACTIONS:
+            fetch = SEARCH_ACTIONS[action_name]
+            items = await asyncio.gather(*(self._scrape_action(fetch, item.id) for item in result[:SEARCH_LIMIT]))
+            result = [item for item in items if item is not None]
+        return result
+
+    async def _scrape_action(self, action_name, *args, **kwargs):
+        action = getattr(self._scraper, action_name)
+        if asyncio.iscoroutinefunction(action):
+            return await action(*args, **kwargs)
+        return await asyncio.get_event_loop().run_in_executor(None, partial(action, *args, **kwargs))
+
+    def stats(self) -> dict:
+        """Cache and request coalescing statistics for monitoring"""
+        result = self._cache.stats() if hasattr(self._cache, "stats") else {}
+        result.update({f"single_flight_{name}": value for name, value in self._single_flight.stats().items()})
+        if self._quota is not None:
+            result.update({f"quota_{name}": value for name, value in self._quota.stats().items()})
+        result.update({f"backend_{name}": value for name, value in self._backends.stats().items()})
+        return result
+
+    def start(self):
+        """Start background listeners of the client"""
+        if hasattr(self._cache, "listen"):
+            self._cache.listen()
+        if hasattr(self._cache, "load_index"):
+            self._cache.load_index()
+
+    def close(self):
+        """Stop the event loop used for requests and release its connections"""
+        self._runner.stop()
+        if hasattr(self._cache, "stop"):
+            self._cache.stop()
+
     def search_item(self, query: str, search_type: TItem):
-        """Performs searching items by name"""
-        return self.perform_action(f"search_{search_type}", [], query)
+        """
+        Performs searching items by name with checking cache of previous searches
+        and the local search index of cached items before going upstream
+        """
+        item_ids = self._cache.get_search_result(query, search_type)
+        if item_ids is not None:
+            self.logger.info("Search %s %s was found in cache", search_type, query)
+            return self.get_items(item_ids, search_type)
+
+        local_items = self.search_local(query, search_type)
+        if local_items:
+            self.logger.info("Search %s %s was found in local index", search_type, query)
+            return local_items
+
+        result = self.perform_action(f"search_{search_type}", [], query, cost=2)
+        items = [item for item in result if isinstance(item, (Beer, Brewery))]
+        for item in items:
+            self._cache.set_to_cache(f"{search_type}_{item.id}", item)
+        if items:
+            self._cache.set_search_result(query, search_type, [item.id for item in items])
+        return items
+
+    def search_local(self, query: str, search_type: TItem):
+        """Search cached items whose names match the query well enough to skip the upstream search"""
+        if not hasattr(self._cache, "search_index"):
+            return []
+        hits = self._cache.search_index(query, search_type, SEARCH_LOCAL_LIMIT, SEARCH_LOCAL_MIN_SCORE)
+        return self.get_items([item_id for item_id, _ in hits], search_type)
 
     def get_item(self, item_id: int, item_type: TItem):
         """Performs getting items by id with checking cache"""
         result = None
         try:
             key = f"{item_type}_{item_id}"
-            result = self._cache.get_from_cache(key)
-            if result is None:
-                result = self.get_from_api(item_id, item_type)
+            result = self._cache.get_from_cache(key, refresh=lambda: self.refresh_item(item_id, item_type))
+            if result is NOT_FOUND:
+                result = None
+            elif result is None:
+                result = self._single_flight.do(
+                    key, lambda: self.get_from_api(item_id, item_type), lookup=lambda: self._cache.get_from_cache(key)
+                )
+                result = None if result is NOT_FOUND else result
         except HTTPException:
             self.logger.error(f"Can't get {item_type} {item_id}")
         finally:
             return result
 
-    def get_brewery_by_beer(self, beer_id: int) -> Brewery:
-        return self.perform_action("get_brewery_by_beer", None, beer_id)
+    def get_items(self, item_ids: List[int], item_type: TItem, background: bool = False) -> list:
+        """
+        Performs getting items by ids with one cache round trip,
+        items missing in the cache are fetched upstream in one batch. Items which were not found are skipped.
+        """
+        ids_by_key = {f"{item_type}_{item_id}": item_id for item_id in item_ids}
+        found, missed = self._cache.get_many(
+            list(ids_by_key), refresh=lambda key: self.refresh_item(ids_by_key[key], item_type)
+        )
+        if missed:
+            found.update(
+                self._single_flight.do_many(
+                    missed,
+                    lambda keys: self.fetch_items([ids_by_key[key] for key in keys], item_type, background),
+                    lookup=lambda keys: self._cache.get_many(keys)[0],
+                )
+            )
+        items = [found.get(key) for key in ids_by_key]
+        return [item for item in items if item is not None and item is not NOT_FOUND]
+
+    def fetch_items(
+        self, item_ids: List[int], item_type: TItem, background: bool = False
+    ) -> Dict[str, Union[Beer, Brewery]]:
+        """Get items from API in one batch with setting cache, returns the found items by their cache keys"""
+        self.logger.info("Try to get %s from api %s", item_type, item_ids)
+        fetched = self.perform_action(
+            BATCH_ACTIONS[item_type], [], item_ids, cost=len(item_ids), background=background,
+        )
+        fetched_items: Dict[str, Union[Beer, Brewery]] = {f"{item_type}_{item.id}": item for item in fetched}
+        self._cache.set_many(fetched_items)
+        return fetched_items
+
+    def missing_items(self, item_ids: List[int], item_type: TItem) -> List[int]:
+        """Ids of items which are not cached yet"""
+        ids_by_key = {f"{item_type}_{item_id}": item_id for item_id in item_ids}
+        _, missed = self._cache.get_many(list(ids_by_key))
+        return [ids_by_key[key] for key in missed]
+
+    def get_brewery_by_beer(self, beer_id: int) -> Optional[Brewery]:
+        """
+        Performs getting brewery of the beer, both of them are usually cached after the beer was shown.
+        Scraped beers have no brewery id, their brewery is found by the beer and cached by its own id
+        """
+        beer = self.get_item(beer_id, "beer")
+        if beer is None:
+            return None
+        if isinstance(beer.brewery, BreweryShort) and beer.brewery.id:
+            return self.get_item(beer.brewery.id, "brewery")
+        brewery = self.perform_action("get_brewery_by_beer", None, beer_id, cost=2)
+        if brewery is not None and brewery.id:
+            self._cache.set_to_cache(f"brewery_{brewery.id}", brewery)
+        return brewery
 
     def get_from_api(self, item_id: int, item_type: TItem):
-        """Get item from API with setting cache"""
-        self.logger.info(f"Try to get {item_type} from api {item_id}")
-        result = self.perform_action(f"get_{item_type}", None, item_id)
+        """
+        Get item from API with setting cache.
+        Items which were not found are cached as such, failed requests are not cached and give None.
+        """
+        self.logger.info("Try to get %s from api %s", item_type, item_id)
+        result = self.perform_action(f"get_{item_type}", FAILED, item_id)
+        if result is FAILED:
+            return None
         key = f"{item_type}_{item_id}"
         self._cache.set_to_cache(key, result)
         return result
 
+    def refresh_item(self, item_id: int, item_type: TItem):
+        """Update cached item from API, the cached item is kept if it can not be fetched"""
+        result = self.perform_action(f"get_{item_type}", None, item_id, background=True)
+        if result is not None:
+            self._cache.set_to_cache(f"{item_type}_{item_id}", result)
+
 
 __all__ = ["UntappdClient", "TUntappdClient"]
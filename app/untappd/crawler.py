@@ -1,30 +1,224 @@
+import argparse
+import hashlib
+import json
 from operator import itemgetter
+from typing import Dict, Iterator, List, Optional, Union
+from urllib.parse import quote_plus, urlparse
+
+import redis
 import scrapy
 from scrapy.crawler import CrawlerProcess
+from scrapy.http import Response
+
+from app.entities import Beer, Brewery
+from app.logging import LoggerMixin
+from app.settings import (
+    REDIS_URL,
+    UNTAPPD_URL,
+    CRAWLER_DOWNLOAD_DELAY,
+    CRAWLER_MAX_PAGES,
+    CRAWLER_PAGE_SIZE,
+    CRAWLER_STATE_TTL,
+)
+from app.untappd.cache import TieredCache, LocalCache
+from app.untappd.search_index import SearchIndex
+from app.untappd.scraper import UntappdPageParser
+
+
+class CrawlState(LoggerMixin):
+    """
+    Validators and digests of crawled pages kept in redis, so a recrawl can skip unchanged pages.
+    State of every page is a key of its own which expires after `ttl` seconds unless the page is crawled again.
+    """
+
+    prefix = "crawl_pages"
+
+    def __init__(self, redis_client, ttl: int = CRAWLER_STATE_TTL) -> None:
+        super().__init__()
+        self._redis = redis_client
+        self._ttl = ttl
+
+    def key(self, url: str) -> str:
+        return f"{CrawlState.prefix}:{url}"
+
+    def get(self, url: str) -> Dict[str, str]:
+        try:
+            value = self._redis.get(self.key(url))
+            return json.loads(value) if value else {}
+        except (redis.RedisError, ValueError) as e:
+            self.logger.error(f"Can't read crawl state of {url}: {e!r}")
+            return {}
+
+    def set(self, url: str, state: Dict[str, str]) -> None:
+        try:
+            self._redis.set(self.key(url), json.dumps(state), ex=self._ttl)
+        except redis.RedisError as e:
+            self.logger.error(f"Can't write crawl state of {url}: {e!r}")
+
+    def clear(self) -> None:
+        for key in self._redis.scan_iter(match=f"{CrawlState.prefix}:*", count=1000):
+            self._redis.delete(key)
 
 
 class UntappdSpider(scrapy.Spider):
-    """Crawler for untappd"""
+    """
+    Catalog crawler for untappd which loads beers and breweries to the bot cache.
+    It pages through search results, follows every found beer or brewery and the beer list of every brewery.
+    Recrawls are incremental: items which are cached and not stale yet are not requested, and paging of a query
+    stops at a search page of such items only. Other pages are requested with validators of the previous crawl,
+    and pages which were not modified, or whose entity did not change, are not written again.
+    """
 
     name = "untappd"
-    allowed_domains = ["untappd.com"]
+    handle_httpstatus_list = [304]
+    custom_settings = {
+        "USER_AGENT": "BakhusBot",
+        "ROBOTSTXT_OBEY": True,
+        "DOWNLOAD_DELAY": CRAWLER_DOWNLOAD_DELAY,
+        "AUTOTHROTTLE_ENABLED": True,
+        "ITEM_PIPELINES": {"app.untappd.crawler.RedisCachePipeline": 300},
+    }
 
-    def __init__(self, options=None, **kwargs):
+    def __init__(self, options=None, redis_client=None, **kwargs):
         super(UntappdSpider, self).__init__(**kwargs)
         query, search_type, sort = itemgetter("query", "type", "sort")(options)
-        self.start_urls = [f"https://untappd.com/search?q={query}&type={search_type}&sort={sort}"]
+        self.queries: List[str] = query if isinstance(query, list) else [query]
+        self.search_type = search_type
+        self.sort = sort
+        self.max_pages = options.get("pages", CRAWLER_MAX_PAGES)
+        self.page_size = options.get("page_size", CRAWLER_PAGE_SIZE)
+        self.incremental = options.get("incremental", True)
+        self.base_url = options.get("url", UNTAPPD_URL).rstrip("/")
+        self.allowed_domains = [urlparse(self.base_url).hostname]
+        self.page_parser = UntappdPageParser()
+        redis_client = redis_client if redis_client is not None else redis.Redis(host=REDIS_URL, port=6379)
+        # writes are published to local caches and search indexes of running bots, nothing is cached locally here
+        self.cache = TieredCache(
+            redis=redis_client, local=LocalCache(max_size=0), index=SearchIndex(redis=redis_client)
+        )
+        self.state = CrawlState(redis_client)
+        self.crawl_stats: Dict[str, int] = {"written": 0, "unchanged": 0, "not_modified": 0, "fresh": 0}
 
-    def parse(self, response):
-        self.log("Saved file %s" % response)
+    def search_url(self, query: str, offset: int = 0) -> str:
+        return f"{self.base_url}/search?q={quote_plus(query)}&type={self.search_type}&sort={self.sort}&offset={offset}"
 
+    def start_requests(self) -> Iterator[scrapy.Request]:
+        for query in self.queries:
+            yield scrapy.Request(self.search_url(query), callback=self.parse, cb_kwargs={"query": query, "page": 0})
 
-# check settings
-crawler_process = CrawlerProcess(settings={"FEED_FORMAT": "json", "FEED_URI": "items.json"})
+    def parse(self, response: Response, query: str = "", page: int = 0):
+        """Search page: follow every result which is not fresh in the cache and the next page"""
+        items = self.page_parser._parse_search_page(response.body)
+        item_ids = self.stale_ids(self.search_type, [item.id for item in items])
+        for item_id in item_ids:
+            if self.search_type == "beer":
+                yield self.detail_request(f"{self.base_url}/beer/{item_id}", self.parse_beer, item_id)
+            else:
+                yield self.detail_request(f"{self.base_url}/brewery/{item_id}", self.parse_brewery, item_id)
+        if items and not item_ids:
+            self.logger.info(f"Search page {page} of {query} is cached already, stop paging")
+            return
+        if len(items) >= self.page_size and page + 1 < self.max_pages:
+            url = self.search_url(query, offset=(page + 1) * self.page_size)
+            yield scrapy.Request(url, callback=self.parse, cb_kwargs={"query": query, "page": page + 1})
 
-if __name__ == "__main__":
-    default_options = {"query": "test", "type": "beer", "sort": "all"}
+    def parse_beer_list(self, response: Response):
+        """Beer list of brewery: follow every beer which is not fresh in the cache"""
+        items = self.page_parser._parse_search_page(response.body)
+        for item_id in self.stale_ids("beer", [item.id for item in items]):
+            yield self.detail_request(f"{self.base_url}/beer/{item_id}", self.parse_beer, item_id)
+
+    def stale_ids(self, item_type: str, item_ids: List[int]) -> List[int]:
+        """Ids of items which are missing in the cache or stale, all of them for a full crawl"""
+        if not self.incremental:
+            return item_ids
+        fresh = self.cache.fresh_keys([f"{item_type}_{item_id}" for item_id in item_ids])
+        self.crawl_stats["fresh"] += len(fresh)
+        return [item_id for item_id in item_ids if f"{item_type}_{item_id}" not in fresh]
+
+    def parse_beer(self, response: Response, item_id: int):
+        beer = self.page_parser._parse_beer_page(item_id, response.body) if response.status != 304 else None
+        yield from self.entity_item(response, f"beer_{item_id}", beer)
 
-    crawler_process.crawl(UntappdSpider, options=default_options)
+    def parse_brewery(self, response: Response, item_id: int):
+        brewery = self.page_parser._parse_brewery_page(item_id, response.body) if response.status != 304 else None
+        yield from self.entity_item(response, f"brewery_{item_id}", brewery)
+        beer_list_url = response.url.rstrip("/") + "/beer"
+        yield scrapy.Request(beer_list_url, callback=self.parse_beer_list)
+
+    def detail_request(self, url: str, callback, item_id: int) -> scrapy.Request:
+        """Request of entity page with validators of the previous crawl"""
+        headers = {}
+        if self.incremental:
+            state = self.state.get(url)
+            if state.get("etag"):
+                headers["If-None-Match"] = state["etag"]
+            if state.get("last_modified"):
+                headers["If-Modified-Since"] = state["last_modified"]
+        return scrapy.Request(url, callback=callback, headers=headers, cb_kwargs={"item_id": item_id})
+
+    def entity_item(self, response: Response, key: str, entity: Optional[Union[Beer, Brewery]]):
+        """Yield entity for the cache unless the page or the entity is the same as on the previous crawl"""
+        url = response.request.url
+        if response.status == 304:
+            self.crawl_stats["not_modified"] += 1
+            self.cache.touch(key)
+            return
+        if entity is None:
+            return
+        digest = hashlib.sha1(self.cache.encode(entity)).hexdigest()  # nosec
+        state = self.state.get(url) if self.incremental else {}
+        new_state = {
+            "etag": response.headers.get("ETag", b"").decode(),
+            "last_modified": response.headers.get("Last-Modified", b"").decode(),
+            "digest": digest,
+        }
+        self.state.set(url, new_state)
+        if state.get("digest") == digest:
+            self.crawl_stats["unchanged"] += 1
+            self.cache.touch(key)
+            return
+        yield {"key": key, "entity": entity}
+
+    def closed(self, reason: str) -> None:
+        self.logger.info(f"Crawl finished {reason} {self.crawl_stats}")
+
+
+class RedisCachePipeline:
+    """Writes crawled entities to the bot cache in its key format and to the persisted search index"""
+
+    def process_item(self, item: dict, spider: UntappdSpider) -> dict:
+        if spider.cache.set_to_cache(item["key"], item["entity"]):
+            spider.crawl_stats["written"] += 1
+        return item
+
+
+def run_crawler(options: dict) -> None:
+    """Run the spider in this process until the crawl is finished"""
+    crawler_process = CrawlerProcess()
+    crawler_process.crawl(UntappdSpider, options=options)
     crawler_process.start()
 
-__all__ = ["crawler_process"]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawl untappd catalog to the bot cache")
+    parser.add_argument("query", nargs="+", help="search queries to start from")
+    parser.add_argument("--type", default="beer", choices=["beer", "brewery"])
+    parser.add_argument("--sort", default="all")
+    parser.add_argument("--pages", type=int, default=CRAWLER_MAX_PAGES, help="search pages per query")
+    parser.add_argument("--full", action="store_true", help="recrawl pages which were not changed")
+    parser.add_argument("--url", default=UNTAPPD_URL, help="untappd site, e.g. a local stand-in")
+    args = parser.parse_args()
+
+    run_crawler(
+        {
+            "query": args.query,
+            "type": args.type,
+            "sort": args.sort,
+            "pages": args.pages,
+            "incremental": not args.full,
+            "url": args.url,
+        }
+    )
+
+__all__ = ["UntappdSpider", "RedisCachePipeline", "CrawlState", "run_crawler"]
@@ -0,0 +1,131 @@
+import threading
+from queue import Queue, Full, Empty
+from typing import Dict, List, Optional, Tuple
+
+from app.entities import Beer
+from app.logging import LoggerMixin
+from app.settings import (
+    PREFETCH_QUEUE_SIZE,
+    PREFETCH_RATE,
+    PREFETCH_BURST,
+    PREFETCH_MAX_PENDING,
+    PREFETCH_SIMILAR_LIMIT,
+)
+from app.utils.event_loop import EventLoopThread
+from app.utils.rate_limit import TokenBucket
+
+TJob = Tuple[Optional[int], List[int]]
+
+
+class Prefetcher(LoggerMixin):
+    """
+    Warms the cache with the brewery and similar beers of a beer shown to user, so follow-up taps are cache hits.
+    Jobs wait in a bounded queue and are dropped when it is full. Upstream fetches are limited by a token bucket
+    of `rate` items per second, and the queued jobs are cancelled while more than `max_pending` requests are in flight.
+    """
+
+    def __init__(
+        self,
+        client,
+        runner: EventLoopThread,
+        queue_size: int = PREFETCH_QUEUE_SIZE,
+        rate: float = PREFETCH_RATE,
+        burst: int = PREFETCH_BURST,
+        max_pending: int = PREFETCH_MAX_PENDING,
+        similar_limit: int = PREFETCH_SIMILAR_LIMIT,
+    ) -> None:
+        super().__init__()
+        self._client = client
+        self._runner = runner
+        self._queue: Queue = Queue(maxsize=queue_size)
+        self._budget = TokenBucket(rate, burst)
+        self._max_pending = max_pending
+        self._similar_limit = similar_limit
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {"queued": 0, "fetched": 0, "dropped_full": 0, "cancelled": 0, "over_budget": 0}
+
+    def submit(self, beer: Beer) -> bool:
+        """Queue prefetch of the beer neighbours, returns False if the job was dropped"""
+        brewery_id = beer.brewery.id if beer.brewery is not None else None
+        job: TJob = (brewery_id, [item.id for item in beer.similar[: self._similar_limit]])
+        self.start()
+        try:
+            self._queue.put_nowait(job)
+        except Full:
+            self._count("dropped_full")
+            return False
+        self._count("queued")
+        return True
+
+    def start(self) -> None:
+        """Start the worker thread, it is called on the first submit as well"""
+        with self._lock:
+            if self._thread is None and not self._stopped.is_set():
+                self._thread = threading.Thread(target=self._work, name="prefetch", daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the worker, queued jobs are discarded"""
+        self._stopped.set()
+        self._cancel_queued()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            result = dict(self._stats)
+        result["queue_size"] = self._queue.qsize()
+        return result
+
+    def under_pressure(self) -> bool:
+        """Too many requests are in flight to spend the event loop on speculative work"""
+        return self._runner.pending >= self._max_pending
+
+    def _work(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                job = self._queue.get(timeout=0.5)
+            except Empty:
+                continue
+            try:
+                self._prefetch(*job)
+            except Exception as e:
+                self.logger.error(f"Prefetch failed, error {e!r}")
+
+    def _prefetch(self, brewery_id: Optional[int], similar_ids: List[int]) -> None:
+        for item_type, item_ids in (("brewery", [brewery_id] if brewery_id else []), ("beer", similar_ids)):
+            if not item_ids:
+                continue
+            if self.under_pressure():
+                self._count("cancelled")
+                self._cancel_queued()
+                return
+            missing = self._client.missing_items(item_ids, item_type)
+            granted = self._budget.take(len(missing))
+            if granted < len(missing):
+                self._count("over_budget", len(missing) - granted)
+            if granted:
+                fetched = self._client.get_items(missing[:granted], item_type, background=True)
+                self._count("fetched", len(fetched))
+                self.logger.info(f"Prefetched {item_type} {missing[:granted]}")
+
+    def _cancel_queued(self) -> None:
+        cancelled = 0
+        while True:
+            try:
+                self._queue.get_nowait()
+            except Empty:
+                break
+            cancelled += 1
+        if cancelled:
+            self._count("cancelled", cancelled)
+            self.logger.info(f"Prefetch of {cancelled} beers was cancelled")
+
+    def _count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += value
+
+
+__all__ = ["Prefetcher"]
@@ -0,0 +1,138 @@
+import threading
+import time
+from typing import Callable, Dict, Mapping, Optional
+
+from redis.exceptions import RedisError
+
+from app.logging import LoggerMixin
+from app.settings import (
+    UNTAPPD_QUOTA_KEY,
+    UNTAPPD_QUOTA_LIMIT,
+    UNTAPPD_QUOTA_PERIOD,
+    UNTAPPD_QUOTA_RESERVE,
+    UNTAPPD_QUOTA_MIN_REMAINING,
+)
+
+TAKE_SCRIPT = """
+local limit = tonumber(redis.call("hget", KEYS[1], "limit")) or tonumber(ARGV[2])
+local tokens = tonumber(redis.call("hget", KEYS[1], "tokens")) or limit
+local updated_at = tonumber(redis.call("hget", KEYS[1], "updated_at")) or tonumber(ARGV[1])
+local period = tonumber(ARGV[3])
+tokens = math.min(limit, tokens + math.max(0, tonumber(ARGV[1]) - updated_at) * limit / period)
+local floor = math.max(tonumber(ARGV[6]), tonumber(ARGV[5]) * limit)
+local granted = 0
+if tokens - tonumber(ARGV[4]) >= floor then
+    tokens = tokens - tonumber(ARGV[4])
+    granted = 1
+end
+redis.call("hmset", KEYS[1], "tokens", tostring(tokens), "limit", limit, "updated_at", ARGV[1])
+redis.call("expire", KEYS[1], period * 2)
+return granted
+"""
+
+UPDATE_SCRIPT = """
+local limit = tonumber(ARGV[2]) or tonumber(redis.call("hget", KEYS[1], "limit")) or tonumber(ARGV[4])
+redis.call("hmset", KEYS[1], "tokens", ARGV[1], "limit", limit, "updated_at", ARGV[3])
+redis.call("expire", KEYS[1], tonumber(ARGV[5]) * 2)
+return 1
+"""
+
+
+class QuotaManager(LoggerMixin):
+    """
+    Untappd API quota shared by all bot processes as a token bucket in redis.
+    The bucket refills by `limit` calls per `period` seconds and is corrected by rate limit headers of API responses.
+    Background calls are denied while less than `reserve` part of the limit is left, so it is kept for interactive
+    calls, which are denied only when `min_remaining` calls are left. Denied calls are expected to use the scraper.
+    """
+
+    LIMIT_HEADER = "X-Ratelimit-Limit"
+    REMAINING_HEADER = "X-Ratelimit-Remaining"
+
+    def __init__(
+        self,
+        redis,
+        key: str = UNTAPPD_QUOTA_KEY,
+        limit: int = UNTAPPD_QUOTA_LIMIT,
+        period: int = UNTAPPD_QUOTA_PERIOD,
+        reserve: float = UNTAPPD_QUOTA_RESERVE,
+        min_remaining: int = UNTAPPD_QUOTA_MIN_REMAINING,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        super().__init__()
+        self._redis = redis
+        self._key = key
+        self._limit = limit
+        self._period = period
+        self._reserve = reserve
+        self._min_remaining = min_remaining
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {"granted": 0, "denied_interactive": 0, "denied_background": 0}
+
+    def acquire(self, cost: int = 1, background: bool = False) -> bool:
+        """Take quota for `cost` API calls, redis errors grant the quota so the API is still used"""
+        reserve = self._reserve if background else 0
+        try:
+            granted = bool(
+                self._redis.eval(
+                    TAKE_SCRIPT,
+                    1,
+                    self._key,
+                    self._clock(),
+                    self._limit,
+                    self._period,
+                    cost,
+                    reserve,
+                    self._min_remaining,
+                )
+            )
+        except RedisError as e:
+            self.logger.error(f"Redis error: {e}")
+            granted = True
+        if granted:
+            self._count("granted")
+        else:
+            self._count("denied_background" if background else "denied_interactive")
+        return granted
+
+    def observe(self, status: int, headers: Mapping[str, str]) -> None:
+        """Correct remaining quota by API response, too many requests response exhausts it"""
+        remaining: Optional[str] = headers.get(QuotaManager.REMAINING_HEADER)
+        limit = headers.get(QuotaManager.LIMIT_HEADER, "")
+        if status == 429:
+            remaining = "0"
+        if remaining is None or not remaining.isdigit():
+            return
+        try:
+            self._redis.eval(
+                UPDATE_SCRIPT, 1, self._key, remaining, limit, self._clock(), self._limit, self._period,
+            )
+        except RedisError as e:
+            self.logger.error(f"Redis error: {e}")
+        if status == 429:
+            self.logger.warning("Untappd API quota is exhausted")
+
+    def remaining(self) -> Optional[float]:
+        """Quota left at the last update of the bucket"""
+        try:
+            tokens = self._redis.hget(self._key, "tokens")
+        except RedisError as e:
+            self.logger.error(f"Redis error: {e}")
+            return None
+        return float(tokens) if tokens is not None else None
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            result: Dict[str, float] = dict(self._stats)
+        remaining = self.remaining()
+        if remaining is not None:
+            result["remaining"] = remaining
+        return result
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+
+__all__ = ["QuotaManager"]
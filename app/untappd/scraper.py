@@ -1,7 +1,10 @@
+import asyncio
 import re
-from typing import Union, Optional, List
+from typing import Union, Optional, List, Callable, Iterable, TypeVar, Awaitable
+from urllib.parse import urlparse
 
-from bs4 import BeautifulSoup
+from aiohttp import ClientTimeout
+from bs4 import BeautifulSoup, SoupStrainer, FeatureNotFound
 
 from app.entities import (
     SearchResult,
@@ -16,22 +19,229 @@ from app.entities import (
     Contact,
 )
 from app.logging import LoggerMixin
-from app.utils.fetch import simple_get
+from app.settings import (
+    SCRAPER_HTML_PARSER,
+    SCRAPER_RESTRICT_PARSING,
+    SCRAPER_CONCURRENCY,
+    SCRAPER_RATE_LIMIT,
+    UNTAPPD_URL,
+)
+from app.utils.fetch import simple_get, HttpSession
+from app.utils.rate_limit import HostRateLimiter
 
+T = TypeVar("T")
 
-class UntappdScraper(LoggerMixin):
-    """A class used to scrap and parse untappd.com in runtime"""
 
-    def __init__(self, timeout: int) -> None:
-        """Init  scrapper with timeout"""
+def _has_class(*classes: str) -> Callable:
+    """Matches class attribute containing any of the classes, the attribute is not split yet while parsing"""
+
+    def match(value) -> bool:
+        return bool(value) and any(cls in value.split() for cls in classes)
+
+    return match
+
+
+# Subtrees of untappd pages which contain everything the page parsers read
+SEARCH_PAGE_STRAINER = SoupStrainer("div", class_="beer-item")
+BEER_PAGE_STRAINER = SoupStrainer("div", class_=_has_class("b_info", "sidebar"))
+BREWERY_PAGE_STRAINER = SoupStrainer("div", class_=_has_class("b_info"))
+
+
+def resolve_parser(name: str) -> str:
+    """Returns the requested BeautifulSoup parser if it is installed and the builtin html.parser otherwise"""
+    try:
+        BeautifulSoup("", name)
+        return name
+    except FeatureNotFound:
+        return "html.parser"
+
+
+class UntappdPageParser(LoggerMixin):
+    """
+    Parsers of untappd.com pages shared by the scrapers.
+    Restricted parsing builds only subtrees of a page used by its parser and falls back to the full page
+    if something is missing there.
+    """
+
+    def __init__(self, parser: str = SCRAPER_HTML_PARSER, restrict: bool = SCRAPER_RESTRICT_PARSING) -> None:
         super().__init__()
-        self.url = "https://untappd.com"
+        self._parser = resolve_parser(parser)
+        self._restrict = restrict
+
+    def _parse_brewery_link(self, response) -> Optional[str]:
+        """Link to brewery page from beer page"""
+        try:
+            html = self._make_soup(response, BEER_PAGE_STRAINER if self._restrict else None)
+            return html.find("p", class_="brewery").find("a")["href"].strip()
+        except (AttributeError, KeyError, TypeError):
+            self.logger.info("Brewery link was not found")
+            return None
+
+    def _make_soup(self, response, parse_only: Optional[SoupStrainer] = None) -> BeautifulSoup:
+        return BeautifulSoup(response, self._parser, parse_only=parse_only)
+
+    def _parse_page(self, response, strainer: SoupStrainer, parse: Callable[[BeautifulSoup], T]) -> T:
+        """Parse restricted page first and the whole page if the restricted one misses something"""
+        if self._restrict:
+            try:
+                return parse(self._make_soup(response, strainer))
+            except (AttributeError, KeyError, TypeError):
+                self.logger.info("Restricted page is not enough, parse the whole page")
+        return parse(self._make_soup(response))
+
+    def _parse_search_page(self, response) -> SearchResult:
+        """Performs searching beers by name"""
+        search_result: SearchResult = []
+
+        try:
+            search_result = self._parse_page(response, SEARCH_PAGE_STRAINER, self._parse_search_html)
+        except (AttributeError, KeyError) as e:
+            self.logger.exception(e)
+        else:
+            self.logger.info(f"Search page for was parsed successfully")
+        return search_result
+
+    def _parse_search_html(self, html: BeautifulSoup) -> SearchResult:
+        search_result: SearchResult = []
+        results = html.find_all("div", class_="beer-item")
+        for r in results:
+            item_text = r.find("a", class_="label")["href"].strip()
+            item_id = int(re.sub(r"\D", "", item_text))
+            item_name = r.find("p", class_="name").text.strip()
+            search_item = SearchItem(item_id, item_name)
+            search_result.append(search_item)
+        return search_result
+
+    def _parse_beer_page(self, beer_id, response) -> Optional[Beer]:
+        """Perform parsing untappd beer page"""
+        beer = None
+
+        try:
+            beer = self._parse_page(response, BEER_PAGE_STRAINER, lambda html: self._parse_beer_html(beer_id, html))
+        except (AttributeError, KeyError) as e:
+            self.logger.exception(e)
+        else:
+            self.logger.info(f"Page for beer {beer_id} was parsed successfully")
+        return beer
+
+    def _parse_beer_html(self, beer_id, html: BeautifulSoup) -> Beer:
+        name = html.find("h1").text.strip()
+        brewery_name = html.find("p", class_="brewery").text.strip()
+        style = html.find("p", class_="style").text.strip()
+        abv_text = html.find("p", class_="abv").text.strip()
+        abv = UntappdPageParser._convert_to_float(abv_text)
+        ibu_text = html.find("p", class_="ibu").text.strip()
+        ibu = UntappdPageParser._convert_to_float(ibu_text)
+        rating_text = html.find("div", class_="caps")["data-rating"].strip()
+        rating = UntappdPageParser._convert_to_float(rating_text)
+        raters_text = html.find("p", class_="raters").text.replace("Ratings", "").replace(",", "").strip()
+        raters = UntappdPageParser._convert_to_float(raters_text)
+        description = html.find("div", class_="beer-descrption-read-less").text.strip()
+        similar_beer_items = html.find("h3", text="Similar Beers").parent.find_all("a", {"data-href": ":beer/similar"})
+        similar: SimilarList = list(map(UntappdPageParser._parse_similar_beer, similar_beer_items))
+
+        # todo fix brewery id
+        brewery = BreweryShort(id=0, name=brewery_name)
+        return Beer(
+            id=beer_id,
+            name=name,
+            style=style,
+            abv=abv,
+            ibu=ibu,
+            rating=rating,
+            raters=raters,
+            description=description,
+            brewery=brewery,
+            similar=similar,
+        )
+
+    def _parse_brewery_page(self, brewery_id: int, response) -> Optional[Brewery]:
+        """Perform parsing untappd brewery page"""
+        brewery = None
+
+        try:
+            brewery = self._parse_page(
+                response, BREWERY_PAGE_STRAINER, lambda html: self._parse_brewery_html(brewery_id, html)
+            )
+        except (AttributeError, KeyError) as e:
+            self.logger.exception(e)
+        else:
+            self.logger.info(f"Page for brewery {brewery_id} was parsed successfully")
+        return brewery
+
+    def _parse_brewery_html(self, brewery_id: int, html: BeautifulSoup) -> Brewery:
+        name = html.find("h1").text.strip()
+        style = html.find("p", class_="style").text.strip()
+        desc = html.find("div", class_="beer-descrption-read-less").text.strip()
+        rating = html.find("div", class_="caps")["data-rating"].strip()
+        rating = UntappdPageParser._convert_to_float(rating)
+        raters = html.find("p", class_="raters").text.replace("Ratings", "").replace(",", "").strip()
+        raters = UntappdPageParser._convert_to_int(raters)
+        fb_item = html.find("a", class_="fb tip")
+        fb = fb_item["href"] if fb_item else ""
+        tw_item = html.find("a", class_="tw tip")
+        tw = tw_item["href"] if tw_item else ""
+        url_item = html.find("a", class_="url tip")
+        url = url_item["href"] if url_item else ""
+
+        return Brewery(
+            id=brewery_id,
+            name=name,
+            description=desc,
+            brewery_type=style,
+            rating=rating,
+            raters=raters,
+            location=Location(None, None),
+            contact=Contact(twitter=tw, facebook=fb, url=url),
+            country="",
+        )
+
+    @staticmethod
+    def _parse_similar_beer(item) -> Similar:
+        similar_id = UntappdPageParser._convert_to_int(item["href"])
+        similar_name = item.text.strip()
+        return Similar(similar_id, similar_name)
+
+    @staticmethod
+    def _convert_to_float(text: str) -> float:
+        """Convert text to float"""
+        string = re.sub(r"[^\d\.]", "", text)
+        result = round(float(string), 2) if string else 0.0
+        return result
+
+    @staticmethod
+    def _convert_to_int(text: str) -> int:
+        """Convert text to float"""
+        string = re.sub(r"[^\d\.]", "", text)
+        result = int(string) if string else 0
+        return result
+
+    @staticmethod
+    def _parse_link_id(link: str) -> int:
+        """Id from the last segment of the link, e.g. `/w/brewery-2/123`, vanity links like `/BrewDog` give 0"""
+        segment = urlparse(link).path.rstrip("/").rsplit("/", 1)[-1]
+        return int(segment) if segment.isdigit() else 0
+
+
+class UntappdScraper(UntappdPageParser):
+    """A class used to scrap and parse untappd.com in runtime"""
+
+    def __init__(
+        self,
+        timeout: int,
+        parser: str = SCRAPER_HTML_PARSER,
+        restrict: bool = SCRAPER_RESTRICT_PARSING,
+        url: str = UNTAPPD_URL,
+    ) -> None:
+        """Init  scrapper with timeout, html parser backend and restricted parsing"""
+        super().__init__(parser, restrict)
+        self.url = url
         self._timeout = timeout
 
     def request(self, url):
-        self.logger.info(f"Start request for {url}")
+        self.logger.info("Start request for %s", url)
         response = simple_get(url, options={"headers": {"User-agent": "BakhusBot"}, "timeout": self._timeout})
-        self.logger.info(f"Got response {response} for {url}")
+        self.logger.debug("Got response %s for %s", response, url)
         return response
 
     def search_beer(self, query: str) -> SearchResult:
@@ -62,6 +272,16 @@ class UntappdScraper(LoggerMixin):
         result = self._parse_brewery_page(brewery_id, response)
         return result
 
+    def get_beers(self, beer_ids: Iterable) -> List[Beer]:
+        """Performs getting beers by ids, beers which can not be fetched are skipped"""
+        beers = [self.get_beer(beer_id) for beer_id in beer_ids]
+        return [beer for beer in beers if beer is not None]
+
+    def get_breweries(self, brewery_ids: Iterable) -> List[Brewery]:
+        """Performs getting breweries by ids, breweries which can not be fetched are skipped"""
+        breweries = [self.get_brewery(brewery_id) for brewery_id in brewery_ids]
+        return [brewery for brewery in breweries if brewery is not None]
+
     def get_brewery_by_beer(self, beer_id: int) -> Optional[Brewery]:
         """Performs getting brewery by beer id"""
         self.logger.info(f"get brewery by beer id {beer_id} request")
@@ -74,7 +294,7 @@ class UntappdScraper(LoggerMixin):
     def crawl_search_page(self, search_type: TSearchType, response):
         """Crawling search results page by page"""
 
-        html = BeautifulSoup(response, "html.parser")
+        html = self._make_soup(response, SEARCH_PAGE_STRAINER if self._restrict else None)
         search_result: List[Union[Optional[Beer], Optional[Brewery]]] = []
 
         try:
@@ -91,127 +311,105 @@ class UntappdScraper(LoggerMixin):
         except (AttributeError, KeyError) as e:
             self.logger.exception(e)
         else:
-            self.logger.info(f"Search for {search_result} was crawled successfully")
+            self.logger.debug("Search for %s was crawled successfully", search_result)
         return search_result
 
-    def _parse_search_page(self, response) -> SearchResult:
-        """Performs searching beers by name"""
-        html = BeautifulSoup(response, "html.parser")
-        search_result: SearchResult = []
 
-        try:
-            results = html.find_all("div", class_="beer-item")
-            for r in results:
-                item_text = r.find("a", class_="label")["href"].strip()
-                item_id = int(re.sub(r"\D", "", item_text))
-                item_name = r.find("p", class_="name").text.strip()
-                search_item = SearchItem(item_id, item_name)
-                search_result.append(search_item)
-        except (AttributeError, KeyError) as e:
-            self.logger.exception(e)
-        else:
-            self.logger.info(f"Search page for was parsed successfully")
-        return search_result
+class AsyncUntappdScraper(UntappdPageParser):
+    """
+    Async scraper of untappd.com over pooled connections of the http session.
+    At most `concurrency` pages are fetched at once and requests to the host are spaced out by `rate` per second.
+    Pages are parsed in the default executor so the event loop is not blocked.
+    """
 
-    def _parse_beer_page(self, beer_id, response) -> Optional[Beer]:
-        """Perform parsing untappd beer page"""
-        html = BeautifulSoup(response, "html.parser")
-        beer = None
+    def __init__(
+        self,
+        timeout: int,
+        session: HttpSession,
+        concurrency: int = SCRAPER_CONCURRENCY,
+        rate: float = SCRAPER_RATE_LIMIT,
+        parser: str = SCRAPER_HTML_PARSER,
+        restrict: bool = SCRAPER_RESTRICT_PARSING,
+        url: str = UNTAPPD_URL,
+    ) -> None:
+        super().__init__(parser, restrict)
+        self.url = url
+        self._timeout = ClientTimeout(total=timeout)
+        self._session = session
+        self._concurrency = max(concurrency, 1)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._rate_limiter = HostRateLimiter(rate)
 
-        try:
-            name = html.find("h1").text.strip()
-            brewery_name = html.find("p", class_="brewery").text.strip()
-            style = html.find("p", class_="style").text.strip()
-            abv_text = html.find("p", class_="abv").text.strip()
-            abv = UntappdScraper._convert_to_float(abv_text)
-            ibu_text = html.find("p", class_="ibu").text.strip()
-            ibu = UntappdScraper._convert_to_float(ibu_text)
-            rating_text = html.find("div", class_="caps")["data-rating"].strip()
-            rating = UntappdScraper._convert_to_float(rating_text)
-            raters_text = html.find("p", class_="raters").text.replace("Ratings", "").replace(",", "").strip()
-            raters = UntappdScraper._convert_to_float(raters_text)
-            description = html.find("div", class_="beer-descrption-read-less").text.strip()
-            similar_beer_items = html.find("h3", text="Similar Beers").parent.find_all(
-                "a", {"data-href": ":beer/similar"}
-            )
-            similar: SimilarList = list(map(UntappdScraper._parse_similar_beer, similar_beer_items))
-
-            # todo fix brewery id
-            brewery = BreweryShort(id=0, name=brewery_name)
-            beer = Beer(
-                id=beer_id,
-                name=name,
-                style=style,
-                abv=abv,
-                ibu=ibu,
-                rating=rating,
-                raters=raters,
-                description=description,
-                brewery=brewery,
-                similar=similar,
-            )
-        except (AttributeError, KeyError) as e:
-            self.logger.exception(e)
-        else:
-            self.logger.info(f"Page for beer {beer_id} was parsed successfully")
-        return beer
+    async def request(self, url: str) -> bytes:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+        async with self._semaphore:
+            await self._rate_limiter.wait(url)
+            self.logger.info("Start request for %s", url)
+            response = await self._session.get_html(url, headers={"User-agent": "BakhusBot"}, timeout=self._timeout)
+            self.logger.info("Got response %s bytes for %s", len(response), url)
+            return response
 
-    def _parse_brewery_page(self, brewery_id: int, response) -> Optional[Brewery]:
-        """Perform parsing untappd brewery page"""
-        html = BeautifulSoup(response, "html.parser")
-        brewery = None
+    async def search_beer(self, query: str) -> SearchResult:
+        """Performs searching beer"""
+        response = await self.request(f"{self.url}/search?q={query}&type=beer&sort=all")
+        return await self._parse(self._parse_search_page, response)
 
-        try:
-            name = html.find("h1").text.strip()
-            style = html.find("p", class_="style").text.strip()
-            desc = html.find("div", class_="beer-descrption-read-less").text.strip()
-            rating = html.find("div", class_="caps")["data-rating"].strip()
-            rating = UntappdScraper._convert_to_float(rating)
-            raters = html.find("p", class_="raters").text.replace("Ratings", "").replace(",", "").strip()
-            raters = UntappdScraper._convert_to_int(raters)
-            fb_item = html.find("a", class_="fb tip")
-            fb = fb_item["href"] if fb_item else ""
-            tw_item = html.find("a", class_="tw tip")
-            tw = tw_item["href"] if tw_item else ""
-            url_item = html.find("a", class_="url tip")
-            url = url_item["href"] if url_item else ""
-
-            brewery = Brewery(
-                id=brewery_id,
-                name=name,
-                description=desc,
-                brewery_type=style,
-                rating=rating,
-                raters=raters,
-                location=Location(None, None),
-                contact=Contact(twitter=tw, facebook=fb, url=url),
-                country="",
-            )
-        except (AttributeError, KeyError) as e:
-            self.logger.exception(e)
-        else:
-            self.logger.info(f"Page for brewery {brewery_id} was parsed successfully")
-        return brewery
+    async def search_brewery(self, query: str) -> SearchResult:
+        """Performs searching brewery"""
+        response = await self.request(f"{self.url}/search?q={query}&type=brewery&sort=all")
+        return await self._parse(self._parse_search_page, response)
 
-    @staticmethod
-    def _parse_similar_beer(item) -> Similar:
-        similar_id = UntappdScraper._convert_to_int(item["href"])
-        similar_name = item.text.strip()
-        return Similar(similar_id, similar_name)
+    async def get_beer(self, beer_id: int) -> Optional[Beer]:
+        """Performs getting beers by id"""
+        response = await self.request(f"{self.url}/beer/{beer_id}")
+        return await self._parse(self._parse_beer_page, beer_id, response)
 
-    @staticmethod
-    def _convert_to_float(text: str) -> float:
-        """Convert text to float"""
-        string = re.sub(r"[^\d\.]", "", text)
-        result = round(float(string), 2) if string else 0.0
-        return result
+    async def get_brewery(self, brewery_id: int) -> Optional[Brewery]:
+        """Performs getting brewery by id"""
+        response = await self.request(f"{self.url}/brewery/{brewery_id}")
+        return await self._parse(self._parse_brewery_page, brewery_id, response)
 
-    @staticmethod
-    def _convert_to_int(text: str) -> int:
-        """Convert text to float"""
-        string = re.sub(r"[^\d\.]", "", text)
-        result = int(string) if string else 0
+    async def get_beers(self, beer_ids: Iterable) -> List[Beer]:
+        """Fetch beers concurrently, beers which can not be fetched are skipped"""
+        return await self._fetch_all(self.get_beer, beer_ids)
+
+    async def get_breweries(self, brewery_ids: Iterable) -> List[Brewery]:
+        """Fetch breweries concurrently, breweries which can not be fetched are skipped"""
+        return await self._fetch_all(self.get_brewery, brewery_ids)
+
+    async def get_brewery_by_beer(self, beer_id: int) -> Optional[Brewery]:
+        """Performs getting brewery by the link from beer page, the brewery of a vanity link has id 0"""
+        response = await self.request(f"{self.url}/beer/{beer_id}")
+        link = await self._parse(self._parse_brewery_link, response)
+        if link is None:
+            return None
+        brewery_id = self._parse_link_id(link)
+        brewery_page = await self.request(f"{self.url}{link}" if link.startswith("/") else link)
+        return await self._parse(self._parse_brewery_page, brewery_id, brewery_page)
+
+    async def crawl_search_page(self, search_type: TSearchType, response) -> List[Union[Beer, Brewery]]:
+        """Fetch every item of search results page concurrently, failed items are skipped"""
+        search_items = await self._parse(self._parse_search_page, response)
+        fetch = self.get_beer if search_type == "beer" else self.get_brewery
+        search_result: List[Union[Beer, Brewery]] = await self._fetch_all(fetch, [item.id for item in search_items])
+        self.logger.info(f"Search page with {len(search_result)} items was crawled successfully")
+        return search_result
+
+    async def _fetch_all(self, fetch: Callable[..., Awaitable[Optional[T]]], item_ids: Iterable) -> List[T]:
+        """Fetch every item concurrently keeping the order of ids, failed items are skipped"""
+        item_ids = list(item_ids)
+        items = await asyncio.gather(*(fetch(item_id) for item_id in item_ids), return_exceptions=True)
+        result = []
+        for item_id, item in zip(item_ids, items):
+            if isinstance(item, BaseException):
+                self.logger.error(f"Can not fetch item {item_id}, error {item!r}")
+            elif item is not None:
+                result.append(item)
         return result
 
+    async def _parse(self, parse: Callable[..., T], *args) -> T:
+        return await asyncio.get_event_loop().run_in_executor(None, parse, *args)
+
 
-__all__ = ["UntappdScraper"]
+__all__ = ["UntappdScraper", "AsyncUntappdScraper"]
@@ -0,0 +1,327 @@
+import heapq
+import json
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+
+from redis.exceptions import RedisError
+
+from app.entities import Beer, Brewery
+from app.logging import LoggerMixin
+from app.settings import SEARCH_INDEX_KEY, SEARCH_INDEX_FUZZY_THRESHOLD
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Case and accent insensitive words of text"""
+    decomposed = unicodedata.normalize("NFKD", text).casefold()
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return TOKEN_RE.findall(stripped)
+
+
+def trigrams(token: str) -> Set[str]:
+    padded = f"  {token} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class _Document:
+    __slots__ = ("item_id", "name", "rating", "raters", "tokens", "expires_at")
+
+    def __init__(
+        self,
+        item_id: int,
+        name: str,
+        rating: float,
+        raters: float,
+        tokens: Set[str],
+        expires_at: Optional[float] = None,
+    ) -> None:
+        self.item_id = item_id
+        self.name = name
+        self.rating = rating
+        self.raters = raters
+        self.tokens = tokens
+        self.expires_at = expires_at
+
+    @property
+    def fields(self) -> tuple:
+        """Fields persisted in redis"""
+        return self.name, self.rating, self.raters, self.expires_at
+
+    @property
+    def popularity(self) -> float:
+        return (self.rating or 0) * math.log1p(self.raters or 0)
+
+
+class _TypeIndex:
+    """Inverted index of words to documents and of trigrams to words for one entity type"""
+
+    def __init__(self) -> None:
+        self.documents: Dict[int, _Document] = {}
+        self.postings: Dict[str, Set[int]] = {}
+        self.trigrams: Dict[str, Set[str]] = {}
+        self.trigram_counts: Dict[str, int] = {}
+
+    def add(self, document: _Document) -> None:
+        self.remove(document.item_id)
+        self.documents[document.item_id] = document
+        for token in document.tokens:
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = set()
+                token_trigrams = trigrams(token)
+                self.trigram_counts[token] = len(token_trigrams)
+                for trigram in token_trigrams:
+                    self.trigrams.setdefault(trigram, set()).add(token)
+            postings.add(document.item_id)
+
+    def remove(self, item_id: int) -> None:
+        document = self.documents.pop(item_id, None)
+        if document is None:
+            return
+        for token in document.tokens:
+            postings = self.postings[token]
+            postings.discard(item_id)
+            if not postings:
+                del self.postings[token]
+                del self.trigram_counts[token]
+                for trigram in trigrams(token):
+                    tokens = self.trigrams[trigram]
+                    tokens.discard(token)
+                    if not tokens:
+                        del self.trigrams[trigram]
+
+    def similar_tokens(self, token: str, threshold: float) -> Dict[str, float]:
+        """Words of the index with trigram similarity to the token not less than threshold"""
+        result: Dict[str, float] = {}
+        if token in self.postings:
+            result[token] = 1.0
+        token_trigrams = trigrams(token)
+        overlaps: Counter = Counter()
+        for trigram in token_trigrams:
+            overlaps.update(self.trigrams.get(trigram, ()))
+        for candidate, overlap in overlaps.items():
+            if candidate == token:
+                continue
+            similarity = overlap / (len(token_trigrams) + self.trigram_counts[candidate] - overlap)
+            if similarity >= threshold:
+                result[candidate] = similarity
+        return result
+
+    def search(self, query: str, limit: int, threshold: float, min_score: float) -> List[Tuple[int, float]]:
+        query_tokens = list(dict.fromkeys(tokenize(query)))
+        count = len(query_tokens)
+        terms = []
+        for token in query_tokens:
+            matches = self.similar_tokens(token, threshold)
+            if matches:
+                size = sum(len(self.postings[candidate]) for candidate in matches)
+                terms.append((size, max(matches.values()), matches))
+        terms.sort(key=lambda term: term[0])
+
+        # the most frequent words which together can't reach min_score are only checked on the candidates
+        # found by the rarer words, instead of walking their long postings
+        essential = len(terms)
+        bound = 0.0
+        while essential and (bound + terms[essential - 1][1]) / count < min_score:
+            essential -= 1
+            bound += terms[essential][1]
+
+        scores: Dict[int, float] = {}
+        for _, _, matches in terms[:essential]:
+            if len(matches) == 1:
+                [(candidate, similarity)] = matches.items()
+                for item_id in self.postings[candidate]:
+                    scores[item_id] = scores.get(item_id, 0.0) + similarity
+                continue
+            best: Dict[int, float] = {}
+            for candidate, similarity in matches.items():
+                for item_id in self.postings[candidate]:
+                    if similarity > best.get(item_id, 0.0):
+                        best[item_id] = similarity
+            for item_id, similarity in best.items():
+                scores[item_id] = scores.get(item_id, 0.0) + similarity
+        for _, _, matches in terms[essential:]:
+            for item_id in scores:
+                tokens = self.documents[item_id].tokens
+                scores[item_id] += max((matches.get(token, 0.0) for token in tokens), default=0.0)
+        if min_score > 0:
+            scores = {item_id: score for item_id, score in scores.items() if score / count >= min_score}
+        if not scores:
+            return []
+
+        # rank by match score rounded to two digits first, the popularity only orders items of the same score,
+        # so it is computed for the best scored items only
+        lowest = round(heapq.nlargest(limit, scores.values())[-1] / count, 2) - 0.005
+        top = [(item_id, score / count) for item_id, score in scores.items() if score / count >= lowest]
+        top.sort(key=lambda item: (round(item[1], 2), self.documents[item[0]].popularity), reverse=True)
+        return top[:limit]
+
+
+class SearchIndex(LoggerMixin):
+    """
+    Local full-text search over beers and breweries of the cache.
+    Words are matched exactly or fuzzy by trigram similarity, results with the same match score are ranked
+    by rating and number of raters. Indexed names are persisted in a redis hash and loaded on start.
+    Items added with a `ttl` expire together with their cache keys, expired items are removed from the index
+    and from the hash before every search and addition.
+    """
+
+    def __init__(
+        self,
+        redis=None,
+        key: str = SEARCH_INDEX_KEY,
+        threshold: float = SEARCH_INDEX_FUZZY_THRESHOLD,
+        clock: Callable[[], float] = time.time,
+    ):
+        super().__init__()
+        self._redis = redis
+        self._key = key
+        self._threshold = threshold
+        self._clock = clock
+        self._indexes: Dict[str, _TypeIndex] = {"beer": _TypeIndex(), "brewery": _TypeIndex()}
+        self._expiry: List[Tuple[float, str, int]] = []
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return sum(len(index.documents) for index in self._indexes.values())
+
+    def add(self, key: str, entity: Union[Beer, Brewery], ttl: Optional[int] = None, persist: bool = True) -> None:
+        """Index entity stored under the cache key for `ttl` seconds, the item does not expire without it"""
+        item_type = key.split("_", 1)[0]
+        if item_type not in self._indexes or not isinstance(entity, (Beer, Brewery)):
+            return
+        self.prune()
+        expires_at = self._clock() + ttl if ttl else None
+        document = self._add(item_type, int(entity.id), entity.name, entity.rating, entity.raters, expires_at)
+        if persist:
+            self._persist(key, document)
+
+    def touch(self, key: str, ttl: int) -> None:
+        """Prolong expiry of the indexed item together with its cache key"""
+        item_type, _, item_id = key.partition("_")
+        index = self._indexes.get(item_type)
+        if index is None or not item_id.isdigit():
+            return
+        with self._lock:
+            document = index.documents.get(int(item_id))
+            if document is None:
+                return
+            document.expires_at = self._clock() + ttl
+            heapq.heappush(self._expiry, (document.expires_at, item_type, document.item_id))
+        self._persist(key, document)
+
+    def prune(self) -> int:
+        """Remove expired items from the index and from redis, returns their number"""
+        now = self._clock()
+        expired = []
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                expires_at, item_type, item_id = heapq.heappop(self._expiry)
+                index = self._indexes[item_type]
+                document = index.documents.get(item_id)
+                # the item could be added or touched again since then, it has a later entry in the heap then
+                if document is not None and document.expires_at == expires_at:
+                    index.remove(item_id)
+                    expired.append(f"{item_type}_{item_id}")
+        if expired and self._redis is not None:
+            try:
+                self._redis.hdel(self._key, *expired)
+            except RedisError as e:
+                self.logger.error(f"Can't persist search index {expired}: {e}")
+        return len(expired)
+
+    def remove(self, key: str) -> None:
+        item_type, _, item_id = key.partition("_")
+        index = self._indexes.get(item_type)
+        if index is None or not item_id.isdigit():
+            return
+        with self._lock:
+            index.remove(int(item_id))
+        if self._redis is not None:
+            try:
+                self._redis.hdel(self._key, key)
+            except RedisError as e:
+                self.logger.error(f"Can't persist search index {key}: {e}")
+
+    def search(self, query: str, item_type: str, limit: int = 5, min_score: float = 0.0) -> List[Tuple[int, float]]:
+        """Ids of the best matching items with match scores from 0 to 1, items scored below min_score are skipped"""
+        index = self._indexes.get(item_type)
+        if index is None:
+            return []
+        self.prune()
+        with self._lock:
+            return index.search(query, limit, self._threshold, min_score)
+
+    def refresh(self, key: str) -> None:
+        """Reload indexed item from redis, e.g. after it was written by another process"""
+        if self._redis is None:
+            return
+        try:
+            value = self._redis.hget(self._key, key)
+        except RedisError as e:
+            self.logger.error(f"Can't read search index {key}: {e}")
+            return
+        item_type, _, item_id = key.partition("_")
+        index = self._indexes.get(item_type)
+        if index is None or not item_id.isdigit():
+            return
+        if value is None:
+            with self._lock:
+                index.remove(int(item_id))
+        else:
+            self._add(item_type, int(item_id), *json.loads(value))
+
+    def load(self) -> None:
+        """
+        Load the index persisted in redis. Expired items are deleted from redis,
+        as well as items written without expiry by the earlier versions, whose cache keys may be gone.
+        """
+        if self._redis is None:
+            return
+        count = 0
+        expired = []
+        now = self._clock()
+        try:
+            for key, value in self._redis.hscan_iter(self._key, count=1000):
+                key = key.decode()
+                item_type, _, item_id = key.partition("_")
+                if item_type not in self._indexes or not item_id.isdigit():
+                    continue
+                fields = json.loads(value)
+                if len(fields) < 4 or (fields[3] is not None and fields[3] <= now):
+                    expired.append(key)
+                    continue
+                self._add(item_type, int(item_id), *fields)
+                count += 1
+            for start in range(0, len(expired), 1000):
+                self._redis.hdel(self._key, *expired[start : start + 1000])
+        except RedisError as e:
+            self.logger.error(f"Can't load search index: {e}")
+        self.logger.info(f"Search index was loaded with {count} items, {len(expired)} expired items were deleted")
+
+    def _add(
+        self, item_type: str, item_id: int, name: str, rating: float, raters: float, expires_at: Optional[float] = None
+    ) -> _Document:
+        document = _Document(item_id, name, rating, raters, set(tokenize(name)), expires_at)
+        with self._lock:
+            self._indexes[item_type].add(document)
+            if expires_at is not None:
+                heapq.heappush(self._expiry, (expires_at, item_type, item_id))
+        return document
+
+    def _persist(self, key: str, document: _Document) -> None:
+        if self._redis is None:
+            return
+        try:
+            self._redis.hset(self._key, key, json.dumps(document.fields))
+        except RedisError as e:
+            self.logger.error(f"Can't persist search index {key}: {e}")
+
+
+__all__ = ["SearchIndex", "tokenize"]
@@ -0,0 +1,195 @@
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Any
+
+from app.logging import LoggerMixin
+from app.settings import SINGLE_FLIGHT_LOCK_TTL, SINGLE_FLIGHT_TIMEOUT, SINGLE_FLIGHT_POLL_INTERVAL
+
+
+class _Call:
+    """Upstream fetch shared by concurrent callers"""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight(LoggerMixin):
+    """
+    Deduplicates concurrent fetches of the same key, batches of keys are deduplicated key by key.
+    Inside a process the first caller fetches and the rest wait for its result.
+    Across processes the fetching caller holds a short redis lock, callers of other processes poll the cache
+    until the item appears there and fetch it themselves if the lock holder does not finish in time.
+    """
+
+    def __init__(
+        self,
+        cache,
+        lock_ttl: float = SINGLE_FLIGHT_LOCK_TTL,
+        timeout: float = SINGLE_FLIGHT_TIMEOUT,
+        poll_interval: float = SINGLE_FLIGHT_POLL_INTERVAL,
+    ) -> None:
+        super().__init__()
+        self._cache = cache
+        self._lock_ttl = lock_ttl
+        self._timeout = timeout
+        self._poll_interval = poll_interval
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {"fetches": 0, "coalesced_local": 0, "coalesced_remote": 0, "timeouts": 0}
+
+    def do(self, key: str, fetch: Callable[[], Any], lookup: Optional[Callable[[], Any]] = None):
+        """
+        Fetch item once for all concurrent callers.
+        `lookup` checks the cache filled by another process and returns None if the item is not there yet.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self._stats["coalesced_local"] += 1
+
+        if not leader:
+            if not call.done.wait(self._timeout):
+                self.logger.error(f"Waiting for fetch of {key} has been timed out")
+                self._count("timeouts")
+                return fetch()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._fetch_once(key, fetch, lookup)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def do_many(
+        self,
+        keys: List[str],
+        fetch: Callable[[List[str]], Dict[str, Any]],
+        lookup: Optional[Callable[[List[str]], Dict[str, Any]]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Fetch items of the keys once for all concurrent callers, keys which nobody fetches yet are fetched in one batch.
+        `fetch` and `lookup` give items by key, keys which are missing there were not found.
+        """
+        led: Dict[str, _Call] = {}
+        waiting: Dict[str, _Call] = {}
+        with self._lock:
+            for key in keys:
+                call = self._calls.get(key)
+                if call is None:
+                    led[key] = self._calls[key] = _Call()
+                else:
+                    waiting[key] = call
+                    self._stats["coalesced_local"] += 1
+
+        results: Dict[str, Any] = {}
+        try:
+            if led:
+                results.update(self._fetch_many_once(list(led), fetch, lookup))
+        except BaseException as e:
+            for call in led.values():
+                call.error = e
+            raise
+        finally:
+            with self._lock:
+                for key, call in led.items():
+                    call.result = results.get(key)
+                    del self._calls[key]
+            for call in led.values():
+                call.done.set()
+
+        for key, call in waiting.items():
+            if not call.done.wait(self._timeout):
+                self.logger.error(f"Waiting for fetch of {key} has been timed out")
+                self._count("timeouts")
+                results.update(fetch([key]))
+            elif call.error is not None:
+                raise call.error
+            elif call.result is not None:
+                results[key] = call.result
+        return results
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def _fetch_once(self, key: str, fetch: Callable[[], Any], lookup: Optional[Callable[[], Any]]):
+        token = self._cache.acquire_lock(key, self._lock_ttl)
+        if token is not None:
+            try:
+                result = lookup() if lookup is not None else None
+                if result is None:
+                    self._count("fetches")
+                    result = fetch()
+                return result
+            finally:
+                self._cache.release_lock(key, token)
+
+        if lookup is not None:
+            deadline = time.monotonic() + self._lock_ttl
+            while time.monotonic() < deadline:
+                time.sleep(self._poll_interval)
+                result = lookup()
+                if result is not None:
+                    self._count("coalesced_remote")
+                    return result
+            self.logger.error(f"Fetch of {key} in another process has been timed out")
+            self._count("timeouts")
+        self._count("fetches")
+        return fetch()
+
+    def _fetch_many_once(
+        self,
+        keys: List[str],
+        fetch: Callable[[List[str]], Dict[str, Any]],
+        lookup: Optional[Callable[[List[str]], Dict[str, Any]]],
+    ) -> Dict[str, Any]:
+        tokens = {key: self._cache.acquire_lock(key, self._lock_ttl) for key in keys}
+        owned = [key for key in keys if tokens[key] is not None]
+        results: Dict[str, Any] = {}
+        try:
+            if owned:
+                results.update(lookup(owned) if lookup is not None else {})
+                missing = [key for key in owned if key not in results]
+                if missing:
+                    self._count("fetches")
+                    results.update(fetch(missing))
+        finally:
+            for key in owned:
+                self._cache.release_lock(key, tokens[key])
+
+        locked = [key for key in keys if tokens[key] is None]
+        if locked and lookup is not None:
+            deadline = time.monotonic() + self._lock_ttl
+            while locked and time.monotonic() < deadline:
+                time.sleep(self._poll_interval)
+                found = lookup(locked)
+                if found:
+                    self._count("coalesced_remote")
+                    results.update(found)
+                    locked = [key for key in locked if key not in found]
+            if locked:
+                self.logger.error(f"Fetch of {locked} in another process has been timed out")
+                self._count("timeouts")
+        if locked:
+            self._count("fetches")
+            results.update(fetch(locked))
+        return results
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+
+__all__ = ["SingleFlight"]
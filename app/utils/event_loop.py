@@ -0,0 +1,120 @@
+import asyncio
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Awaitable, Callable, List, Optional
+
+from app.logging import LoggerMixin
+from app.settings import ASYNC_TIMEOUT, ASYNC_MAX_PENDING
+
+
+class LoopOverloadedError(RuntimeError):
+    """Raised when too many coroutines are already waiting in the event loop"""
+
+
+class EventLoopThread(LoggerMixin):
+    """
+    One event loop running forever in a dedicated daemon thread.
+    Sync code, e.g. telegram handlers started by @run_async, submits coroutines to it and waits for results,
+    so all of them share a single loop and the connections pooled in it.
+    """
+
+    def __init__(
+        self, timeout: float = ASYNC_TIMEOUT, max_pending: int = ASYNC_MAX_PENDING, name: str = "untappd-io"
+    ) -> None:
+        super().__init__()
+        self._timeout = timeout
+        self._max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_forever, name=name, daemon=True)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._shutdown_hooks: List[Callable[[], Awaitable]] = []
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self._loop
+
+    @property
+    def pending(self) -> int:
+        """Number of coroutines submitted and not finished yet"""
+        return self._pending
+
+    def start(self) -> None:
+        """Start the loop thread, it is called on the first submit as well"""
+        with self._lock:
+            if not self._thread.is_alive() and not self._loop.is_closed():
+                self._thread.start()
+                self.logger.info(f"Event loop thread {self._thread.name} has been started")
+
+    def add_shutdown_hook(self, hook: Callable[[], Awaitable]) -> None:
+        """Register coroutine function awaited in the loop before it stops, e.g. closing of http sessions"""
+        self._shutdown_hooks.append(hook)
+
+    def submit(self, coro: Awaitable, wait: Optional[float] = None) -> Future:
+        """
+        Schedule coroutine in the loop and return concurrent future of its result.
+        Waits up to `wait` seconds for a free slot when too many coroutines are in flight.
+        """
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("Can not wait for a coroutine inside the event loop thread")
+        self.start()
+        if not self._slots.acquire(timeout=self._timeout if wait is None else wait):
+            coro.close()  # type: ignore
+            raise LoopOverloadedError(f"More than {self._max_pending} coroutines are in flight")
+        with self._lock:
+            self._pending += 1
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)  # type: ignore
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future: Future) -> None:
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = None):
+        """Run coroutine in the loop thread and wait for its result, the coroutine is cancelled on timeout"""
+        timeout = self._timeout if timeout is None else timeout
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            self.logger.error(f"Coroutine was cancelled after {timeout} seconds")
+            raise
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Await shutdown hooks, cancel remaining tasks and close the loop"""
+        timeout = self._timeout if timeout is None else timeout
+        if self._loop.is_closed():
+            return
+        if self._thread.is_alive():
+            try:
+                asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(timeout)
+            except FutureTimeoutError:
+                self.logger.error("Event loop shutdown has been timed out")
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout)
+            self.logger.info(f"Event loop thread {self._thread.name} has been stopped")
+        if not self._loop.is_running():
+            self._loop.close()
+
+    async def _shutdown(self) -> None:
+        current = asyncio.current_task()
+        tasks = [task for task in asyncio.all_tasks() if task is not current]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for hook in self._shutdown_hooks:
+            try:
+                await hook()
+            except Exception as e:
+                self.logger.error(f"Shutdown hook failed, error {e!r}")
+
+    def _run_forever(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+
+__all__ = ["EventLoopThread", "LoopOverloadedError"]
@@ -1,8 +1,20 @@
+import asyncio
 import logging
+from typing import Callable, Optional
+
 import requests
 from requests.exceptions import RequestException
 from contextlib import closing
-from aiohttp import ClientSession
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, ClientResponse
+
+from app.settings import (
+    HTTP_TIMEOUT,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_POOL_LIMIT,
+    HTTP_POOL_LIMIT_PER_HOST,
+    HTTP_DNS_TTL,
+    HTTP_KEEPALIVE_TIMEOUT,
+)
 
 
 def simple_get(url: str, options) -> bytes:
@@ -17,7 +29,7 @@ def simple_get(url: str, options) -> bytes:
             if is_good_response(resp):
                 result = resp.content
     except RequestException as e:
-        logger = logging.getLogger()
+        logger = logging.getLogger(__name__)
         logger.exception(e)
     finally:
         return result
@@ -31,15 +43,112 @@ def is_good_response(resp) -> bool:
     return resp.status_code == 200 and content_type is not None and content_type.find("html") > -1
 
 
-async def async_get(url: str, **kwargs):
+class HttpSession:
     """
-    Async version of GET request with json parsing
+    Long-living aiohttp session shared by all requests of the application.
+    It keeps connections alive in a pool limited in total and per host, caches DNS lookups
+    and applies the same timeouts to every request. The underlying session is bound to the event loop
+    it was opened in and is reopened in the loop using it once that loop is closed. Requests from another loop
+    while the bound one is still open fall back to a short-living session.
     """
-    logger = logging.getLogger()
-    logger.info(f"Start request for {url}")
-    async with ClientSession() as session:
-        async with session.get(url, **kwargs) as response:
-            logger.info(f"Got response {response.status} for URL: {url}")
+
+    def __init__(
+        self,
+        limit: int = HTTP_POOL_LIMIT,
+        limit_per_host: int = HTTP_POOL_LIMIT_PER_HOST,
+        dns_ttl: int = HTTP_DNS_TTL,
+        keepalive_timeout: float = HTTP_KEEPALIVE_TIMEOUT,
+        timeout: float = HTTP_TIMEOUT,
+        connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+    ) -> None:
+        self._limit = limit
+        self._limit_per_host = limit_per_host
+        self._dns_ttl = dns_ttl
+        self._keepalive_timeout = keepalive_timeout
+        self._timeout = ClientTimeout(total=timeout, connect=connect_timeout)
+        self._session: Optional[ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _create_session(self) -> ClientSession:
+        connector = TCPConnector(
+            limit=self._limit,
+            limit_per_host=self._limit_per_host,
+            ttl_dns_cache=self._dns_ttl,
+            keepalive_timeout=self._keepalive_timeout,
+        )
+        return ClientSession(connector=connector, timeout=self._timeout)
+
+    def _get_session(self) -> Optional[ClientSession]:
+        """Returns the pooled session for the running loop, opens it on the first call"""
+        loop = asyncio.get_event_loop()
+        if self._loop is not None and self._loop.is_closed():
+            # connections of a closed loop can be neither used nor closed, they are left to the garbage collector
+            self._session = None
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+            self._loop = loop
+        return self._session if self._loop is loop else None
+
+    async def get_json(self, url: str, **kwargs):
+        """GET request with json parsing over pooled connections"""
+        session = self._get_session()
+        if session is not None:
+            return await _get_json(session, url, **kwargs)
+        async with self._create_session() as session:
+            return await _get_json(session, url, **kwargs)
+
+    async def get_html(self, url: str, **kwargs) -> bytes:
+        """
+        Async version of `simple_get` over pooled connections.
+        Returns content of the page if it is HTML and empty bytes if it is not or the page does not exist,
+        unlike `simple_get` other failed responses, connection errors and timeouts are raised.
+        """
+        session = self._get_session()
+        if session is not None:
+            return await _get_html(session, url, **kwargs)
+        async with self._create_session() as session:
+            return await _get_html(session, url, **kwargs)
+
+    async def close(self) -> None:
+        """Close pooled connections, must be awaited in the loop the session was opened in"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._loop = None
+
+
+async def _get_json(
+    session: ClientSession, url: str, on_response: Optional[Callable[[ClientResponse], None]] = None, **kwargs
+):
+    logger = logging.getLogger(__name__)
+    logger.debug("Start request for %s", url)
+    async with session.get(url, **kwargs) as response:
+        logger.debug("Got response %s for URL: %s", response.status, url)
+        if on_response is not None:
+            on_response(response)
+        response.raise_for_status()
+        json = await response.json()
+        return json
+
+
+async def _get_html(session: ClientSession, url: str, **kwargs) -> bytes:
+    result = b""
+    async with session.get(url, **kwargs) as response:
+        if response.status != 404:
             response.raise_for_status()
-            json = await response.json()
-            return json
+        content_type = response.headers.get("Content-Type", "").lower()
+        if response.status == 200 and content_type.find("html") > -1:
+            result = await response.read()
+    return result
+
+
+async def async_get(url: str, session: Optional[HttpSession] = None, **kwargs):
+    """
+    Async version of GET request with json parsing.
+    Uses pooled connections of `session` if it is passed or a new session otherwise.
+    `on_response` is called with every response before its status is checked, e.g. to read its headers.
+    """
+    if session is not None:
+        return await session.get_json(url, **kwargs)
+    async with ClientSession() as client_session:
+        return await _get_json(client_session, url, **kwargs)
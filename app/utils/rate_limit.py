@@ -0,0 +1,49 @@
+import asyncio
+import threading
+import time
+from typing import Callable, Dict
+from urllib.parse import urlparse
+
+
+class HostRateLimiter:
+    """Spaces out starts of requests to the same host by at least 1 / rate seconds, rate 0 disables limiting"""
+
+    def __init__(self, rate: float) -> None:
+        self._interval = 1 / rate if rate > 0 else 0.0
+        self._next_slot: Dict[str, float] = {}
+
+    async def wait(self, url: str) -> None:
+        """Wait for the next free slot of the url host, must be awaited in a single event loop"""
+        if not self._interval:
+            return
+        host = urlparse(url).netloc
+        now = asyncio.get_event_loop().time()
+        slot = max(now, self._next_slot.get(host, now))
+        self._next_slot[host] = slot + self._interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class TokenBucket:
+    """Thread safe budget of `rate` tokens per second, unused tokens are accumulated up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: int, clock: Callable[[], float] = time.monotonic) -> None:
+        self._rate = rate
+        self._capacity = capacity
+        self._clock = clock
+        self._tokens = float(capacity)
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def take(self, count: int) -> int:
+        """Take up to `count` tokens, returns the number of tokens granted"""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) * self._rate)
+            self._updated_at = now
+            granted = min(count, int(self._tokens))
+            self._tokens -= granted
+            return granted
+
+
+__all__ = ["HostRateLimiter", "TokenBucket"]
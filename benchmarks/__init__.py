@@ -0,0 +1,7 @@
+"""
+Offline benchmarks for the bot. Run a benchmark as a module, e.g. `python -m benchmarks.bench_http_session`.
+Importing `app` builds the bot, so a placeholder telegram token is used when none is configured.
+"""
+import os
+
+os.environ.setdefault("TELEGRAM_TOKEN", "000000:benchmark")
@@ -0,0 +1,40 @@
+"""
+Encode/decode time and size per entity for the cache codecs.
+
+    python -m benchmarks.bench_cache_codec --number 20000
+"""
+import argparse
+import timeit
+
+from app.untappd.cache import VersionedCodec, JsonCodec, MsgpackCodec
+from benchmarks.samples import create_beer, create_brewery, LONG_DESCRIPTION
+
+CODECS = {
+    "json (legacy)": VersionedCodec(JsonCodec()),
+    "msgpack": VersionedCodec(MsgpackCodec(), compress_threshold=0),
+    "msgpack+zlib": VersionedCodec(MsgpackCodec()),
+}
+
+ENTITIES = {
+    "beer": ("beer", create_beer()),
+    "beer, long description": ("beer", create_beer(description=LONG_DESCRIPTION)),
+    "brewery": ("brewery", create_brewery()),
+}
+
+
+def main(number: int):
+    print(f"{'entity':<24} {'codec':<16} {'bytes':>7} {'encode us':>10} {'decode us':>10}")
+    for entity_name, (entity_type, entity) in ENTITIES.items():
+        for codec_name, codec in CODECS.items():
+            data = codec.encode(entity)
+            assert codec.decode(entity_type, data) == entity
+            encode = timeit.timeit(lambda: codec.encode(entity), number=number) / number * 1e6
+            decode = timeit.timeit(lambda: codec.decode(entity_type, data), number=number) / number * 1e6
+            print(f"{entity_name:<24} {codec_name:<16} {len(data):>7} {encode:>10.2f} {decode:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+    main(args.number)
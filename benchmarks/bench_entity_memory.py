@@ -0,0 +1,95 @@
+"""
+Memory of cached entities with slots and interned strings against plain dataclasses.
+Strings of every entity are separate objects, as they are after decoding of cached payloads.
+
+    python -m benchmarks.bench_entity_memory --count 1000000
+"""
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+from dataclasses import dataclass, fields, make_dataclass
+
+from app.entities import Beer, Brewery, BreweryShort, Contact, Location, Similar
+from benchmarks.bench_search_index import make_name, STYLES
+
+COUNTRIES = ["Germany", "Belgium", "United States", "Czech Republic", "United Kingdom", "Russia", "Japan"]
+BREWERY_TYPES = ["Micro Brewery", "Macro Brewery", "Nano Brewery", "Brew Pub", "Contract Brewery"]
+
+
+def plain(cls):
+    """Dataclass with the same fields and per-instance `__dict__`, as entities were before"""
+    return dataclass(make_dataclass(f"Plain{cls.__name__}", [(field.name, field.type) for field in fields(cls)]))
+
+
+PLAIN = {cls: plain(cls) for cls in (Beer, Brewery, BreweryShort, Contact, Location, Similar)}
+SLOTTED = {cls: cls for cls in PLAIN}
+
+
+def copy(value: str) -> str:
+    return (value + " ")[:-1]
+
+
+def create_beer(classes, beer_id: int, rng: random.Random, names, breweries, similar: int):
+    brewery_id, brewery_name = rng.choice(breweries)
+    return classes[Beer](
+        id=beer_id,
+        name=copy(rng.choice(names)),
+        style=copy(rng.choice(STYLES)),
+        abv=round(rng.uniform(3, 12), 1),
+        ibu=rng.randint(0, 100),
+        rating=round(rng.uniform(2.5, 4.8), 2),
+        raters=rng.randint(0, 50000),
+        description="",
+        brewery=classes[BreweryShort](id=brewery_id, name=copy(brewery_name)),
+        similar=[classes[Similar](id=rng.randint(1, 10 ** 7), name=copy(rng.choice(names))) for _ in range(similar)],
+    )
+
+
+def create_brewery(classes, brewery_id: int, rng: random.Random, names, breweries, similar: int):
+    _, name = breweries[brewery_id % len(breweries)]
+    return classes[Brewery](
+        id=brewery_id,
+        name=copy(name),
+        brewery_type=copy(rng.choice(BREWERY_TYPES)),
+        country=copy(rng.choice(COUNTRIES)),
+        description="",
+        contact=classes[Contact](twitter="", facebook="", url=""),
+        location=classes[Location](lat=rng.uniform(-90, 90), lng=rng.uniform(-180, 180)),
+        rating=round(rng.uniform(2.5, 4.8), 2),
+        raters=rng.randint(0, 50000),
+    )
+
+
+def measure(factory, classes, count: int, similar: int):
+    rng = random.Random(42)
+    names = [make_name(rng) for _ in range(min(count, 100000))]
+    breweries = [(brewery_id, make_name(rng)) for brewery_id in range(max(1, count // 20))]
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    entities = [factory(classes, entity_id, rng, names, breweries, similar) for entity_id in range(count)]
+    elapsed = time.perf_counter() - started
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del entities
+    return memory, elapsed
+
+
+def main(count: int, similar: int):
+    print(f"{'entity':<8} {'variant':<8} {'count':>9} {'memory MB':>10} {'bytes each':>11} {'build s':>8}")
+    for name, factory in (("beer", create_beer), ("brewery", create_brewery)):
+        for variant, classes in (("plain", PLAIN), ("slotted", SLOTTED)):
+            memory, elapsed = measure(factory, classes, count, similar)
+            print(
+                f"{name:<8} {variant:<8} {count:>9} {memory / 2 ** 20:>10.0f} {memory / count:>11.0f} {elapsed:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=1000000)
+    parser.add_argument("--similar", type=int, default=5, help="similar beers of every beer")
+    args = parser.parse_args()
+    main(args.count, args.similar)
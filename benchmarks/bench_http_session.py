@@ -0,0 +1,126 @@
+"""
+Compare a new ClientSession per request with the pooled HttpSession against a local HTTPS stand-in
+of the Untappd API. Prints requests/sec and latency percentiles for both modes.
+
+    python -m benchmarks.bench_http_session --requests 2000 --concurrency 20
+"""
+import argparse
+import asyncio
+import os
+import ssl
+import statistics
+import subprocess  # nosec
+import tempfile
+import time
+from typing import List
+
+from aiohttp import web
+
+from app.utils.fetch import async_get, HttpSession
+
+BEER_RESPONSE = {"response": {"beer": {"bid": 1569404, "beer_name": "Lost In Spice"}}}
+
+
+def create_certificate(directory: str):
+    """Create self-signed certificate for localhost with openssl"""
+    cert_path = os.path.join(directory, "cert.pem")
+    key_path = os.path.join(directory, "key.pem")
+    subprocess.run(  # nosec
+        [
+            "openssl",
+            "req",
+            "-x509",
+            "-newkey",
+            "rsa:2048",
+            "-nodes",
+            "-days",
+            "1",
+            "-subj",
+            "/CN=localhost",
+            "-addext",
+            "subjectAltName=DNS:localhost,IP:127.0.0.1",
+            "-keyout",
+            key_path,
+            "-out",
+            cert_path,
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return cert_path, key_path
+
+
+async def start_server(cert_path: str, key_path: str, port: int) -> web.AppRunner:
+    async def beer_info(request):
+        return web.json_response(BEER_RESPONSE)
+
+    app = web.Application()
+    app.router.add_get("/v4/beer/info/{beer_id}", beer_info)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    server_context.load_cert_chain(cert_path, key_path)
+    await web.TCPSite(runner, "127.0.0.1", port, ssl_context=server_context).start()
+    return runner
+
+
+async def run_load(fetch, url: str, requests: int, concurrency: int):
+    latencies: List[float] = []
+    queue: asyncio.Queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(url)
+
+    async def worker():
+        while not queue.empty():
+            target = queue.get_nowait()
+            started = time.perf_counter()
+            await fetch(target)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return elapsed, latencies
+
+
+def report(name: str, elapsed: float, latencies: List[float]):
+    ordered = sorted(latencies)
+    p50 = ordered[len(ordered) // 2] * 1000
+    p99 = ordered[min(int(len(ordered) * 0.99), len(ordered) - 1)] * 1000
+    mean = statistics.mean(ordered) * 1000
+    print(
+        f"{name:<24} {len(ordered) / elapsed:>10.1f} req/s  mean {mean:7.2f} ms  "
+        f"p50 {p50:7.2f} ms  p99 {p99:7.2f} ms"
+    )
+
+
+async def main(requests: int, concurrency: int, port: int):
+    with tempfile.TemporaryDirectory() as directory:
+        cert_path, key_path = create_certificate(directory)
+        runner = await start_server(cert_path, key_path, port)
+        client_context = ssl.create_default_context(cafile=cert_path)
+        url = f"https://localhost:{port}/v4/beer/info/1569404"
+
+        try:
+            elapsed, latencies = await run_load(
+                lambda target: async_get(target, ssl=client_context), url, requests, concurrency
+            )
+            report("session per request", elapsed, latencies)
+
+            http_session = HttpSession(limit_per_host=concurrency)
+            elapsed, latencies = await run_load(
+                lambda target: async_get(target, session=http_session, ssl=client_context), url, requests, concurrency
+            )
+            await http_session.close()
+            report("pooled HttpSession", elapsed, latencies)
+        finally:
+            await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--port", type=int, default=8443)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency, args.port))
@@ -0,0 +1,85 @@
+"""
+Latency of parsing an API beer response with logging off, with the queue pipeline and with a synchronous handler
+formatting and writing records in the calling thread, as LoggerMixin did before.
+
+    python -m benchmarks.bench_logging --calls 20000
+"""
+import argparse
+import logging
+import os
+import statistics
+import time
+
+from app.logging import init_log, stop_log, LOG_FORMAT
+from app.untappd.api import UntappdAPI
+
+
+def create_raw_beer(similar: int = 25) -> dict:
+    """Beer of the API response with the usual size of lists and texts"""
+    return {
+        "bid": 1569404,
+        "beer_name": "Lost In Spice",
+        "beer_style": "Spiced / Herbed Beer",
+        "beer_abv": 5.5,
+        "beer_ibu": 20,
+        "rating_score": 3.61,
+        "rating_count": 1024,
+        "beer_description": "A spiced ale brewed with coriander, ginger and orange peel. " * 10,
+        "brewery": {"brewery_id": 405662, "brewery_name": "Testbräu", "country_name": "Germany"},
+        "similar": {
+            "count": similar,
+            "items": [
+                {"beer": {"bid": 1000 + i, "beer_name": f"Similar Spiced Ale {i}", "beer_style": "Spiced"}}
+                for i in range(similar)
+            ],
+        },
+        "media": {"items": [{"photo": {"photo_img_md": f"https://untappd.akamaized.net/{i}.jpg"}} for i in range(25)]},
+    }
+
+
+def configure(mode: str, stream) -> None:
+    if mode == "off":
+        init_log(level="INFO", levels={}, handler=logging.StreamHandler(stream))
+    elif mode == "queue":
+        init_log(level="DEBUG", levels={}, handler=logging.StreamHandler(stream))
+    elif mode == "queue sampled":
+        init_log(level="DEBUG", levels={}, sample_rate=0.01, handler=logging.StreamHandler(stream))
+    else:
+        stop_log()
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        logger = logging.getLogger("app")
+        logger.handlers = [handler]
+        logger.setLevel(logging.DEBUG)
+
+
+def measure(api: UntappdAPI, raw_beer: dict, calls: int):
+    latencies = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        api._parse_beer(raw_beer)
+        latencies.append((time.perf_counter() - started) * 10 ** 6)
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.95)], latencies[int(len(latencies) * 0.99)]
+
+
+def main(calls: int, similar: int):
+    api = UntappdAPI()
+    raw_beer = create_raw_beer(similar)
+    print(f"{'mode':<14} {'p50 us':>8} {'p95 us':>8} {'p99 us':>8}")
+    with open(os.devnull, "w") as stream:
+        for mode in ("off", "queue", "queue sampled", "sync"):
+            configure(mode, stream)
+            measure(api, raw_beer, calls // 10)
+            p50, p95, p99 = measure(api, raw_beer, calls)
+            stop_log()
+            print(f"{mode:<14} {p50:>8.1f} {p95:>8.1f} {p99:>8.1f}")
+    init_log()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--similar", type=int, default=25, help="similar beers in the response")
+    args = parser.parse_args()
+    main(args.calls, args.similar)
@@ -0,0 +1,52 @@
+"""
+Parse time and peak memory per page of UntappdScraper page parsers for every parser backend,
+with and without restricted parsing, on the saved untappd pages from tests/fixtures.
+
+    python -m benchmarks.bench_scraper_parsers --number 50
+"""
+import argparse
+import timeit
+import tracemalloc
+from pathlib import Path
+
+from app.untappd.scraper import UntappdScraper
+
+FIXTURES = Path(__file__).parent.parent / "tests" / "fixtures" / "untappd"
+BACKENDS = [("html.parser", False), ("html.parser", True), ("lxml", False), ("lxml", True)]
+
+
+def page_parsers(scraper: UntappdScraper):
+    beer = (FIXTURES / "beer.html").read_bytes()
+    brewery = (FIXTURES / "brewery.html").read_bytes()
+    search = (FIXTURES / "search.html").read_bytes()
+    return {
+        "beer": lambda: scraper._parse_beer_page(1569404, beer),
+        "brewery": lambda: scraper._parse_brewery_page(405662, brewery),
+        "search": lambda: scraper._parse_search_page(search),
+    }
+
+
+def peak_memory(parse) -> int:
+    tracemalloc.start()
+    parse()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main(number: int):
+    print(f"{'page':<8} {'parser':<12} {'restricted':<10} {'ms/page':>8} {'peak KiB':>9}")
+    for parser, restrict in BACKENDS:
+        scraper = UntappdScraper(timeout=10, parser=parser, restrict=restrict)
+        for page, parse in page_parsers(scraper).items():
+            assert parse(), f"{page} page was not parsed"
+            elapsed = timeit.timeit(parse, number=number) / number * 1000
+            peak = peak_memory(parse) / 1024
+            print(f"{page:<8} {parser:<12} {str(restrict):<10} {elapsed:>8.2f} {peak:>9.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=50)
+    args = parser.parse_args()
+    main(args.number)
@@ -0,0 +1,88 @@
+"""
+Build time, memory and query latency of the local search index over synthetic beer names.
+
+    python -m benchmarks.bench_search_index --sizes 100000 1000000 --queries 500
+"""
+import argparse
+import random
+import statistics
+import time
+import tracemalloc
+
+from app.settings import SEARCH_LOCAL_MIN_SCORE
+from app.untappd.search_index import SearchIndex
+from benchmarks.samples import create_beer
+
+SYLLABLES = ["ka", "lo", "mi", "bru", "hop", "sta", "ve", "dor", "an", "ri", "tek", "sol", "ne", "gar", "wu"]
+ADJECTIVES = ["Hazy", "Imperial", "Double", "Barrel Aged", "Session", "Dry Hopped", "Smoked", "Sour", "Wild", "Golden"]
+STYLES = ["IPA", "Stout", "Porter", "Lager", "Pilsner", "Pale Ale", "Saison", "Gose", "Tripel", "Bock", "Kölsch"]
+
+
+def make_word(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+
+
+def make_name(rng: random.Random) -> str:
+    return f"{make_word(rng)} {rng.choice(ADJECTIVES)} {rng.choice(STYLES)}"
+
+
+def make_typo(rng: random.Random, name: str) -> str:
+    position = rng.randrange(len(name))
+    return name[:position] + name[position + 1 :]
+
+
+def build(size: int, rng: random.Random):
+    names = []
+    index = SearchIndex()
+    beer = create_beer()
+    tracemalloc.start()
+    started = time.perf_counter()
+    for beer_id in range(size):
+        beer.id = beer_id
+        beer.name = make_name(rng)
+        beer.rating = round(rng.uniform(2.5, 4.8), 2)
+        beer.raters = rng.randint(0, 50000)
+        index.add(f"beer_{beer_id}", beer, persist=False)
+        names.append(beer.name)
+    elapsed = time.perf_counter() - started
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return index, names, elapsed, memory
+
+
+def measure(index: SearchIndex, queries, min_score: float):
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query, "beer", limit=5, min_score=min_score)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.95)]
+
+
+def main(sizes, number: int):
+    rng = random.Random(42)
+    print(f"{'size':>9} {'build s':>8} {'memory MB':>10} {'query':<10} {'min score':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for size in sizes:
+        index, names, elapsed, memory = build(size, rng)
+        samples = [rng.choice(names) for _ in range(number)]
+        queries = {
+            "exact": samples,
+            "typo": [make_typo(rng, name) for name in samples],
+            "one word": [name.split()[0] for name in samples],
+        }
+        for query_name, query_list in queries.items():
+            for min_score in (0.0, SEARCH_LOCAL_MIN_SCORE):
+                p50, p95 = measure(index, query_list, min_score)
+                print(
+                    f"{size:>9} {elapsed:>8.1f} {memory / 2 ** 20:>10.0f} {query_name:<10} {min_score:>9.1f} "
+                    f"{p50:>8.2f} {p95:>8.2f}"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+    main(args.sizes, args.queries)
@@ -0,0 +1,319 @@
+"""
+End to end load test of the bot on the local stand-ins of untappd and telegram, see benchmarks.upstreams.
+
+Every simulated user searches a beer, selects one of the options when several are found, then opens
+the brewery and the similar beers of it and selects one of the similar beers. Updates reach BeerBot
+by long polling of the telegram stand-in, and a step lasts until the bot sends the reply the user waits for.
+Redis is replaced by fakeredis unless --redis-host is given.
+
+    python -m benchmarks.load --users 20 --duration 60 --latency 0.05 --error-rate 0.01
+"""
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from queue import Empty
+from typing import Callable, Dict, List, Optional, Tuple
+
+import redis
+from telegram.ext import Dispatcher
+
+from app.logging import init_log
+from app.bot.beer_bot import BeerBot
+from app.bot.conversation import LocalConversationStore
+from app.untappd.api import UntappdAPI
+from app.untappd.cache import TieredCache, LocalCache
+from app.untappd.client import UntappdClient
+from app.untappd.prefetch import Prefetcher
+from app.untappd.quota import QuotaManager
+from app.untappd.scraper import AsyncUntappdScraper
+from app.untappd.search_index import SearchIndex
+from app.utils.event_loop import EventLoopThread
+from app.utils.fetch import HttpSession
+from benchmarks.upstreams import UntappdStub, TelegramStub
+
+STEPS = ("search", "select_beer", "brewery", "similar")
+FAILURE_TEXTS = ("Nothing found", "Hey. I'm sorry")
+
+_update_ids = itertools.count(1)
+
+
+def create_bot(
+    untappd: UntappdStub, telegram: TelegramStub, redis_client, scraper_rate: float = 2, prefetch: bool = True
+):
+    """Bot wired as in `app`, with the stand-ins as upstreams and the API quota of the untappd stand-in"""
+    runner = EventLoopThread()
+    session = HttpSession()
+    runner.add_shutdown_hook(session.close)
+    quota = QuotaManager(redis=redis_client, limit=untappd.rate_limit, period=int(untappd.rate_period))
+    api = UntappdAPI(session=session, quota=quota, base_url=f"{untappd.url}/v4")
+    scraper = AsyncUntappdScraper(timeout=10, session=session, rate=scraper_rate, url=untappd.url)
+    cache = TieredCache(redis=redis_client, local=LocalCache(), index=SearchIndex(redis=redis_client))
+    client = UntappdClient(scraper=scraper, api=api, cache=cache, runner=runner, quota=quota)
+    prefetcher = Prefetcher(client=client, runner=runner) if prefetch else None
+    bot = BeerBot(
+        client=client, prefetcher=prefetcher, conversations=LocalConversationStore(), base_url=telegram.api_url
+    )
+    # `run_async` handlers run in the pool of the singleton dispatcher, it is the one of the bot built by `app`
+    Dispatcher._set_singleton(bot.dispatcher)
+    return bot, client, prefetcher
+
+
+def create_user(chat_id: int) -> dict:
+    return {"id": chat_id, "is_bot": False, "first_name": f"User {chat_id}"}
+
+
+def command_update(chat_id: int, text: str) -> dict:
+    update_id = next(_update_ids)
+    command_length = len(text.split(" ", 1)[0])
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": create_user(chat_id),
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": command_length}],
+        },
+    }
+
+
+def callback_update(chat_id: int, data: str) -> dict:
+    update_id = next(_update_ids)
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": create_user(chat_id),
+            "chat_instance": str(chat_id),
+            "data": data,
+            "message": {"message_id": update_id, "date": int(time.time()), "chat": {"id": chat_id, "type": "private"}},
+        },
+    }
+
+
+def callbacks(reply: dict, prefix: str) -> List[str]:
+    markup = reply.get("reply_markup") or {}
+    return [
+        button["callback_data"]
+        for row in markup.get("inline_keyboard", [])
+        for button in row
+        if button.get("callback_data", "").startswith(prefix)
+    ]
+
+
+def is_failure(reply: dict) -> bool:
+    return reply.get("text", "").startswith(FAILURE_TEXTS)
+
+
+def is_beer(reply: dict) -> bool:
+    return bool(callbacks(reply, "info_"))
+
+
+def is_options(reply: dict) -> bool:
+    return bool(callbacks(reply, "beer_"))
+
+
+def is_location(reply: dict) -> bool:
+    return reply["method"] == "sendLocation"
+
+
+class VirtualUser:
+    """Runs the search flow in a loop, latencies and outcomes of its steps are kept by step name"""
+
+    def __init__(
+        self, chat_id: int, telegram: TelegramStub, queries: List[str], seed: int, timeout: float, think: float
+    ) -> None:
+        self.chat_id = chat_id
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.outcomes: Counter = Counter()
+        self.flows = 0
+        self._telegram = telegram
+        self._replies = telegram.replies(chat_id)
+        self._queries = queries
+        self._random = random.Random(seed)
+        self._timeout = timeout
+        self._think = think
+
+    def run(self, deadline: float) -> None:
+        while time.monotonic() < deadline:
+            self.flow()
+            self.flows += 1
+
+    def flow(self) -> None:
+        query = self._random.choice(self._queries)
+        update = command_update(self.chat_id, f"/search {query}")
+        reply = self.step("search", update, lambda reply: is_beer(reply) or is_options(reply))
+        if reply is not None and is_options(reply):
+            data = self._random.choice(callbacks(reply, "beer_"))
+            reply = self.step("select_beer", callback_update(self.chat_id, data), is_beer)
+        if reply is None or not is_beer(reply):
+            return
+        beer_id = callbacks(reply, "info_")[0].split("_")[1]
+        self.step("brewery", callback_update(self.chat_id, f"info_{beer_id}_brewery"), is_location)
+        reply = self.step("similar", callback_update(self.chat_id, f"info_{beer_id}_similar"), is_options)
+        if reply is not None:
+            data = self._random.choice(callbacks(reply, "beer_"))
+            self.step("select_beer", callback_update(self.chat_id, data), is_beer)
+
+    def step(self, name: str, update: dict, expected: Callable[[dict], bool]) -> Optional[dict]:
+        """Send update and wait for the expected reply, None is returned when the bot failed or timed out"""
+        if self._think:
+            time.sleep(self._random.uniform(0, 2 * self._think))
+        self._drain()
+        started = time.perf_counter()
+        self._telegram.push_update(update)
+        deadline = started + self._timeout
+        while True:
+            try:
+                reply = self._replies.get(timeout=max(deadline - time.perf_counter(), 0))
+            except Empty:
+                self.outcomes[name, "timeout"] += 1
+                return None
+            if expected(reply):
+                self.latencies[name].append(time.perf_counter() - started)
+                self.outcomes[name, "ok"] += 1
+                return reply
+            if is_failure(reply):
+                self.outcomes[name, "failed"] += 1
+                return None
+
+    def _drain(self) -> None:
+        """Late replies of a failed or timed out step are not taken for replies of the next one"""
+        try:
+            while True:
+                self._replies.get_nowait()
+        except Empty:
+            pass
+
+
+def percentile(values: List[float], q: float) -> float:
+    return values[min(int(len(values) * q), len(values) - 1)] if values else float("nan")
+
+
+def summarize(users: List[VirtualUser], elapsed: float) -> dict:
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    outcomes: Counter = Counter()
+    for user in users:
+        for name, values in user.latencies.items():
+            latencies[name].extend(values)
+        outcomes.update(user.outcomes)
+    steps = {}
+    for name in STEPS:
+        values = sorted(latencies[name])
+        steps[name] = {
+            "ok": outcomes[name, "ok"],
+            "failed": outcomes[name, "failed"],
+            "timeout": outcomes[name, "timeout"],
+            "p50": percentile(values, 0.5),
+            "p90": percentile(values, 0.9),
+            "p99": percentile(values, 0.99),
+            "max": values[-1] if values else float("nan"),
+        }
+    flows = sum(user.flows for user in users)
+    total_steps = sum(outcomes.values())
+    return {
+        "users": len(users),
+        "seconds": elapsed,
+        "flows": flows,
+        "flows_per_second": flows / elapsed,
+        "steps_per_second": total_steps / elapsed,
+        "steps": steps,
+    }
+
+
+def report(summary: dict, upstream_stats: Dict[str, Counter]) -> None:
+    print(
+        f"{summary['users']} users, {summary['seconds']:.1f} s, {summary['flows']} flows, "
+        f"{summary['flows_per_second']:.1f} flows/s, {summary['steps_per_second']:.1f} steps/s"
+    )
+    header = " ".join(f"{q + ' ms':>8}" for q in ("p50", "p90", "p99", "max"))
+    print(f"{'step':<12} {'ok':>6} {'failed':>6} {'timeout':>7} {header}")
+    for name, step in summary["steps"].items():
+        times = " ".join(f"{step[q] * 1000:>8.1f}" for q in ("p50", "p90", "p99", "max"))
+        print(f"{name:<12} {step['ok']:>6} {step['failed']:>6} {step['timeout']:>7} {times}")
+    for name, stats in upstream_stats.items():
+        print(f"{name}: " + ", ".join(f"{key} {value}" for key, value in sorted(stats.items())))
+
+
+def start_stack(args) -> Tuple[UntappdStub, TelegramStub, BeerBot, UntappdClient, Prefetcher]:
+    untappd = UntappdStub(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        beers=args.beers,
+        seed=args.seed,
+    ).start()
+    telegram = TelegramStub().start()
+    redis_client = redis.Redis(host=args.redis_host) if args.redis_host else create_fake_redis()
+    bot, client, prefetcher = create_bot(untappd, telegram, redis_client, args.scraper_rate)
+    client.start()
+    bot.updater.start_polling(timeout=1)
+    return untappd, telegram, bot, client, prefetcher
+
+
+def create_fake_redis():
+    import fakeredis  # dev requirement, load tests run without a redis server
+
+    return fakeredis.FakeRedis()
+
+
+def main(args) -> dict:
+    init_log(level=args.log_level)
+    untappd, telegram, bot, client, prefetcher = start_stack(args)
+    queries = [f"beer {i}" for i in range(args.queries)]
+    users = [
+        VirtualUser(10 ** 6 + i, telegram, queries, args.seed + i, args.timeout, args.think) for i in range(args.users)
+    ]
+    started = time.monotonic()
+    threads = [
+        threading.Thread(target=user.run, args=(started + args.duration,), name=f"user-{user.chat_id}")
+        for user in users
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    summary = summarize(users, time.monotonic() - started)
+    upstream_stats = {"untappd": untappd.stats, "telegram": telegram.stats}
+    summary["upstreams"] = {name: dict(stats) for name, stats in upstream_stats.items()}
+
+    bot.updater.stop()
+    prefetcher.stop()
+    client.close()
+    untappd.stop()
+    telegram.stop()
+    report(summary, upstream_stats)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(summary, output, indent=2)
+    return summary
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10, help="concurrent users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds users start new flows")
+    parser.add_argument("--think", type=float, default=0, help="mean seconds a user waits before each step")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds a step waits for the reply")
+    parser.add_argument("--queries", type=int, default=200, help="distinct search queries")
+    parser.add_argument("--beers", type=int, default=1000, help="beers found by searches")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds of every untappd response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random seconds added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="part of untappd responses failing with 500")
+    parser.add_argument("--rate-limit", type=int, default=100, help="API requests per hour before 429")
+    parser.add_argument("--scraper-rate", type=float, default=2, help="scraper requests per second")
+    parser.add_argument("--redis-host", help="redis server instead of fakeredis")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", help="write the summary as json")
+    return parser
+
+
+if __name__ == "__main__":
+    main(create_parser().parse_args())
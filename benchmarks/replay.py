@@ -0,0 +1,224 @@
+"""
+Replay of updates recorded by the bot with RECORD_PATH against the BeerBot dispatcher, with the local stand-ins
+of untappd and telegram as upstreams, see benchmarks.upstreams. Redis is replaced by fakeredis unless
+--redis-host is given.
+
+Updates are put to the dispatcher queue at their recorded offsets divided by --speed, --speed 0 puts them
+as fast as possible. Latency of an update is the time until the first reply of the bot to its chat; replies are
+matched to the oldest update of the chat waiting for one. Updates which are not commands or button taps get no
+reply and are only dispatched.
+
+With --deterministic the stand-ins have a fixed seed and no jitter, the prefetcher is off, and updates are
+dispatched one by one in the recorded order, each after the replies to the previous one settled, so runs make
+the same upstream calls and their reports can be compared.
+
+    python -m benchmarks.replay updates.jsonl --speed 10
+    python -m benchmarks.replay updates.jsonl --deterministic --output report.json
+"""
+import argparse
+import json
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+import redis
+from telegram import Update
+
+from app.logging import init_log
+from benchmarks.load import create_bot, create_fake_redis, percentile
+from benchmarks.upstreams import UntappdStub, TelegramStub
+
+
+def load_updates(path: str) -> List[Tuple[float, dict]]:
+    """Recorded updates with their offsets in seconds, in the recorded order"""
+    with open(path, encoding="utf-8") as records:
+        items = [json.loads(line) for line in records if line.strip()]
+    return [(item["at"], item["update"]) for item in items]
+
+
+def update_kind(update: dict) -> Optional[str]:
+    """Command name or kind of the tapped button, None for updates the bot does not reply to"""
+    callback_query = update.get("callback_query")
+    if callback_query is not None:
+        data = callback_query.get("data", "")
+        parts = data.split("_")
+        return f"info_{parts[-1]}" if parts[0] == "info" else parts[0]
+    text = (update.get("message") or {}).get("text", "")
+    if text.startswith("/"):
+        return text[1:].split(" ", 1)[0].split("@", 1)[0]
+    return None
+
+
+def chat_id(update: dict) -> Optional[int]:
+    callback_query = update.get("callback_query")
+    if callback_query is not None:
+        message = callback_query.get("message") or {}
+        return message.get("chat", {}).get("id", callback_query["from"]["id"])
+    return (update.get("message") or {}).get("chat", {}).get("id")
+
+
+class ReplyTracker:
+    """Updates waiting for a reply by chat, latencies of the answered ones by kind of update"""
+
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.dispatched: Counter = Counter()
+        self._pending: Dict[int, Deque[Tuple[str, float]]] = defaultdict(deque)
+        self._lock = threading.Lock()
+        self._last_reply = time.perf_counter()
+        self._answered = threading.Condition(self._lock)
+
+    def sent(self, chat: int, kind: str) -> None:
+        with self._lock:
+            self.dispatched[kind] += 1
+            self._pending[chat].append((kind, time.perf_counter()))
+
+    def on_reply(self, chat: int, reply: dict) -> None:
+        now = time.perf_counter()
+        with self._lock:
+            self._last_reply = now
+            pending = self._pending.get(chat)
+            if pending:
+                kind, started = pending.popleft()
+                self.latencies[kind].append(now - started)
+            self._answered.notify_all()
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(len(items) for items in self._pending.values())
+
+    def wait(self, timeout: float, settle: float = 0.0) -> None:
+        """Wait until every update got a reply and no more replies came for `settle` seconds"""
+        deadline = time.perf_counter() + timeout
+        with self._lock:
+            while time.perf_counter() < deadline:
+                now = time.perf_counter()
+                if not any(self._pending.values()) and now - self._last_reply >= settle:
+                    return
+                self._answered.wait(min(max(settle - (now - self._last_reply), 0.01), deadline - now))
+
+    def unanswered(self) -> Counter:
+        with self._lock:
+            return Counter(kind for items in self._pending.values() for kind, _ in items)
+
+
+def replay(
+    bot,
+    updates: List[Tuple[float, dict]],
+    tracker: ReplyTracker,
+    speed: float,
+    deterministic: bool,
+    timeout: float,
+    settle: float,
+) -> float:
+    """Dispatch updates and wait for the replies, returns seconds of the replay"""
+    started = time.perf_counter()
+    for at, data in updates:
+        if not deterministic and speed > 0:
+            delay = started + at / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        kind, chat = update_kind(data), chat_id(data)
+        if kind is not None and chat is not None:
+            tracker.sent(chat, kind)
+        bot.dispatcher.update_queue.put(Update.de_json(data, bot.updater.bot))
+        if deterministic:
+            tracker.wait(timeout, settle)
+    tracker.wait(timeout)
+    return time.perf_counter() - started
+
+
+def summarize(tracker: ReplyTracker, updates: int, elapsed: float) -> dict:
+    unanswered = tracker.unanswered()
+    kinds = {}
+    for kind in sorted(tracker.dispatched):
+        values = sorted(tracker.latencies[kind])
+        kinds[kind] = {
+            "dispatched": tracker.dispatched[kind],
+            "answered": len(values),
+            "unanswered": unanswered[kind],
+            "p50": percentile(values, 0.5),
+            "p90": percentile(values, 0.9),
+            "p99": percentile(values, 0.99),
+            "max": values[-1] if values else float("nan"),
+        }
+    answered = sum(len(values) for values in tracker.latencies.values())
+    return {
+        "updates": updates,
+        "seconds": elapsed,
+        "updates_per_second": updates / elapsed if elapsed else float("nan"),
+        "replies_per_second": answered / elapsed if elapsed else float("nan"),
+        "kinds": kinds,
+    }
+
+
+def report(summary: dict) -> None:
+    print(
+        f"{summary['updates']} updates in {summary['seconds']:.1f} s, "
+        f"{summary['updates_per_second']:.1f} updates/s, {summary['replies_per_second']:.1f} answered/s"
+    )
+    header = " ".join(f"{q + ' ms':>8}" for q in ("p50", "p90", "p99", "max"))
+    print(f"{'update':<14} {'sent':>6} {'answered':>8} {'no reply':>8} {header}")
+    for kind, item in summary["kinds"].items():
+        times = " ".join(f"{item[q] * 1000:>8.1f}" for q in ("p50", "p90", "p99", "max"))
+        print(f"{kind:<14} {item['dispatched']:>6} {item['answered']:>8} {item['unanswered']:>8} {times}")
+
+
+def main(args) -> dict:
+    init_log(level=args.log_level)
+    updates = load_updates(args.path)
+    tracker = ReplyTracker()
+    untappd = UntappdStub(
+        latency=args.latency,
+        jitter=0 if args.deterministic else args.jitter,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        seed=args.seed if args.deterministic else None,
+    ).start()
+    telegram = TelegramStub(on_reply=tracker.on_reply).start()
+    redis_client = redis.Redis(host=args.redis_host) if args.redis_host else create_fake_redis()
+    bot, client, prefetcher = create_bot(
+        untappd, telegram, redis_client, args.scraper_rate, prefetch=not args.deterministic
+    )
+    client.start()
+    bot._start_dispatcher()
+
+    elapsed = replay(bot, updates, tracker, args.speed, args.deterministic, args.timeout, args.settle)
+    summary = summarize(tracker, len(updates), elapsed)
+    summary["upstreams"] = {"untappd": dict(untappd.stats), "telegram": dict(telegram.stats)}
+
+    bot.dispatcher.stop()
+    if prefetcher is not None:
+        prefetcher.stop()
+    client.close()
+    untappd.stop()
+    telegram.stop()
+    report(summary)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(summary, output, indent=2)
+    return summary
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="JSONL file recorded by the bot")
+    parser.add_argument("--speed", type=float, default=1, help="speed up of the recorded timing, 0 is no waiting")
+    parser.add_argument("--deterministic", action="store_true", help="one update at a time, fixed seed")
+    parser.add_argument("--settle", type=float, default=0.1, help="seconds without replies ending a step")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds to wait for replies")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds of every untappd response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random seconds added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="part of untappd responses failing with 500")
+    parser.add_argument("--rate-limit", type=int, default=100, help="API requests per hour before 429")
+    parser.add_argument("--scraper-rate", type=float, default=2, help="scraper requests per second")
+    parser.add_argument("--redis-host", help="redis server instead of fakeredis")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", help="write the report as json")
+    return parser
+
+
+if __name__ == "__main__":
+    main(create_parser().parse_args())
@@ -0,0 +1,37 @@
+"""Sample entities shared by benchmarks"""
+from app.entities import Beer, Brewery, BreweryShort, Contact, Location, Similar
+
+SHORT_DESCRIPTION = "A spiced ale brewed with coriander, ginger and orange peel."
+LONG_DESCRIPTION = (
+    "Brewed with a blend of pale and crystal malts, this ale is spiced with coriander, ginger, "
+    "cardamom and orange peel, then conditioned on cinnamon and vanilla for a warming finish. "
+) * 12
+
+
+def create_beer(beer_id: int = 1569404, description: str = SHORT_DESCRIPTION) -> Beer:
+    return Beer(
+        id=beer_id,
+        name="Lost In Spice",
+        style="Spiced / Herbed Beer",
+        abv=5.5,
+        ibu=20,
+        rating=3.61234,
+        raters=1024,
+        description=description,
+        brewery=BreweryShort(id=405662, name="Testbräu"),
+        similar=[Similar(id=1000 + i, name=f"Similar Spiced Ale {i}") for i in range(5)],
+    )
+
+
+def create_brewery(brewery_id: int = 405662, description: str = SHORT_DESCRIPTION) -> Brewery:
+    return Brewery(
+        id=brewery_id,
+        name="Testbräu",
+        brewery_type="Micro Brewery",
+        country="Germany",
+        description=description,
+        contact=Contact(twitter="testbraeu", facebook="https://facebook.com/testbraeu", url="https://testbraeu.de"),
+        location=Location(lat=52.52, lng=13.405),
+        rating=3.75,
+        raters=4096,
+    )
@@ -0,0 +1,190 @@
+"""
+Offline benchmark suite of the hot paths on the recorded untappd fixtures: page parsers of the scraper,
+API response parsers, cache encode/decode and rendering of a beer message.
+
+Times are normalized by a pure python reference loop measured in the same run, so baselines saved on one machine
+stay comparable on another one. The check exits with 1 when a case is slower than its baseline by more than
+the tolerance in the run and in `--confirm` reruns of it.
+
+    python -m benchmarks.suite --save            # measure and write benchmarks/baselines.json
+    python -m benchmarks.suite --check           # measure and compare with the baselines
+    python -m benchmarks.suite --check --cases api --output results.json
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app import beer_bot
+from app.logging import init_log
+from app.untappd.api import UntappdAPI
+from app.untappd.cache import RedisCache
+from app.untappd.scraper import UntappdScraper
+
+FIXTURES = Path(__file__).parent.parent / "tests" / "fixtures" / "untappd"
+BASELINES = Path(__file__).parent / "baselines.json"
+TOLERANCE = 0.25
+
+
+def load_fixture(name: str) -> bytes:
+    return (FIXTURES / name).read_bytes()
+
+
+def create_cases() -> Dict[str, Callable[[], object]]:
+    """Benchmarked calls by name, every call is checked to give a result before it is measured"""
+    scraper = UntappdScraper(timeout=10)
+    api = UntappdAPI()
+    cache = RedisCache(redis=None)
+    beer_page, brewery_page, search_page = (load_fixture(f"{page}.html") for page in ("beer", "brewery", "search"))
+    raw_beer = json.loads(load_fixture("api_beer.json"))["response"]["beer"]
+    raw_brewery = json.loads(load_fixture("api_brewery.json"))["response"]["brewery"]
+    beer, brewery = api._parse_beer(raw_beer), api._parse_brewery(raw_brewery)
+    cached_beer, cached_brewery = cache._codec.encode(beer), cache._codec.encode(brewery)
+    return {
+        "scraper.beer_page": lambda: scraper._parse_beer_page(1569404, beer_page),
+        "scraper.brewery_page": lambda: scraper._parse_brewery_page(405662, brewery_page),
+        "scraper.search_page": lambda: scraper._parse_search_page(search_page),
+        "api.beer": lambda: api._parse_beer(raw_beer),
+        "api.brewery": lambda: api._parse_brewery(raw_brewery),
+        "cache.encode_beer": lambda: cache._codec.encode(beer),
+        "cache.encode_brewery": lambda: cache._codec.encode(brewery),
+        "cache.decode_beer": lambda: cache.prepare_response("beer_1569404", cached_beer),
+        "cache.decode_brewery": lambda: cache.prepare_response("brewery_405662", cached_brewery),
+        "bot.beer_to_html": lambda: beer_bot._parse_beer_to_html(beer),
+    }
+
+
+def reference() -> int:
+    """Fixed interpreter workload, the unit of normalized times"""
+    total = 0
+    for i in range(100):
+        total += len(str(i)) * (i % 7)
+    return total
+
+
+def calibrate(call: Callable[[], object], min_time: float) -> int:
+    """Number of calls in a round lasting at least `min_time`"""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            call()
+        if time.perf_counter() - started >= min_time:
+            return number
+        number *= 2
+
+
+def timed_round(call: Callable[[], object], number: int) -> float:
+    started = time.perf_counter()
+    for _ in range(number):
+        call()
+    return (time.perf_counter() - started) / number
+
+
+def measure(call: Callable[[], object], repeat: int = 7, min_time: float = 0.05) -> dict:
+    """
+    Seconds per call of the fastest round and the median time relative to the reference workload.
+    Rounds of the call and of the reference alternate, so both see the same load of the box.
+    """
+    if not call():
+        raise RuntimeError("The case gave no result, the fixture was not parsed")
+    number, unit_number = calibrate(call, min_time), calibrate(reference, min_time)
+    seconds, ratios = [], []
+    for _ in range(repeat):
+        unit = timed_round(reference, unit_number)
+        seconds.append(timed_round(call, number))
+        ratios.append(seconds[-1] / unit)
+    return {"seconds": min(seconds), "relative": statistics.median(ratios)}
+
+
+def run(cases: Dict[str, Callable[[], object]], repeat: int = 7, min_time: float = 0.05) -> Dict[str, dict]:
+    return {name: measure(call, repeat, min_time) for name, call in cases.items()}
+
+
+def compare(
+    results: Dict[str, dict], baselines: Dict[str, dict], tolerance: float = TOLERANCE
+) -> Tuple[List[str], List[str]]:
+    """Names of cases which are slower than their baselines by more than `tolerance` and cases without baselines"""
+    regressions, missing = [], []
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            missing.append(name)
+        elif result["relative"] > baseline["relative"] * (1 + tolerance):
+            regressions.append(name)
+    return regressions, missing
+
+
+def load_baselines(path: Path = BASELINES) -> Dict[str, dict]:
+    return json.loads(path.read_text())["cases"] if path.exists() else {}
+
+
+def save_baselines(results: Dict[str, dict], path: Path = BASELINES) -> None:
+    data = {"python": sys.version.split()[0], "cases": results}
+    path.write_text(json.dumps(data, indent=2, sort_keys=True) + "\n")
+
+
+def report(results: Dict[str, dict], baselines: Dict[str, dict]) -> None:
+    print(f"{'case':<24} {'us/call':>9} {'relative':>9} {'baseline':>9} {'change':>8}")
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        line = f"{name:<24} {result['seconds'] * 1e6:>9.1f} {result['relative']:>9.3f}"
+        if baseline is not None:
+            change = result["relative"] / baseline["relative"] - 1
+            line += f" {baseline['relative']:>9.3f} {change:>+8.0%}"
+        print(line)
+
+
+def main(
+    save: bool,
+    check: bool,
+    prefixes: List[str],
+    repeat: int = 7,
+    tolerance: float = TOLERANCE,
+    confirm: int = 2,
+    output: Optional[str] = None,
+    log_level: str = "WARNING",
+) -> int:
+    init_log(level=log_level)
+    cases = {name: call for name, call in create_cases().items() if not prefixes or name.startswith(tuple(prefixes))}
+    results = run(cases, repeat=repeat)
+    baselines = load_baselines()
+    report(results, baselines)
+    if output:
+        Path(output).write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+    if save:
+        save_baselines({**baselines, **results})
+        print(f"Baselines are saved to {BASELINES}")
+    if check:
+        regressions, missing = compare(results, baselines, tolerance)
+        for _ in range(confirm):
+            if not regressions:
+                break
+            # a slowdown must repeat to be reported, a single run is disturbed by other processes too often
+            rerun = run({name: cases[name] for name in regressions}, repeat=repeat)
+            regressions, _ = compare(rerun, baselines, tolerance)
+        for name in missing:
+            print(f"No baseline for {name}, save baselines with --save")
+        for name in regressions:
+            print(f"{name} is slower than the baseline by more than {tolerance:.0%}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--save", action="store_true", help="write the results to the baselines")
+    parser.add_argument("--check", action="store_true", help="fail when a case is slower than its baseline")
+    parser.add_argument("--cases", nargs="*", default=[], help="prefixes of cases to run, e.g. scraper api")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="allowed slowdown, 0.25 is 25%%")
+    parser.add_argument("--confirm", type=int, default=2, help="reruns of slower cases before they fail the check")
+    parser.add_argument("--output", help="write the results as json")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+    sys.exit(
+        main(args.save, args.check, args.cases, args.repeat, args.tolerance, args.confirm, args.output, args.log_level)
+    )
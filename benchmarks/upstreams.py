@@ -0,0 +1,332 @@
+"""
+Local stand-ins of untappd.com, the Untappd v4 API and the Telegram Bot API for load tests.
+
+The Untappd server answers the API from the recorded responses in tests/fixtures with the ids of a generated
+catalog, and serves the saved pages for any beer, brewery or search. Latency, error rate and the API rate limit
+are configurable. The Telegram server records messages sent by the bot by chat and serves updates pushed
+by a test to long polling.
+
+    python -m benchmarks.upstreams --latency 0.05 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import copy
+import json
+import random
+import threading
+import time
+import zlib
+from collections import Counter, defaultdict
+from pathlib import Path
+from queue import Queue
+from typing import Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from app.logging import LoggerMixin
+from app.utils.event_loop import EventLoopThread
+
+FIXTURES = Path(__file__).parent.parent / "tests" / "fixtures" / "untappd"
+
+
+class StubServer(LoggerMixin):
+    """aiohttp application served from its own event loop thread, port 0 binds a free port"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        super().__init__()
+        self.host = host
+        self.port = port
+        self._runner = EventLoopThread(name=type(self).__name__)
+        self._app_runner: Optional[web.AppRunner] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def make_app(self) -> web.Application:
+        raise NotImplementedError
+
+    def start(self) -> "StubServer":
+        self._runner.run(self._start())
+        self.logger.info(f"{type(self).__name__} is served on {self.url}")
+        return self
+
+    def stop(self) -> None:
+        if self._app_runner is not None:
+            self._runner.run(self._app_runner.cleanup())
+            self._app_runner = None
+        self._runner.stop()
+
+    def call_soon(self, callback, *args) -> None:
+        """Run callback in the loop of the server, e.g. to wake up waiting requests"""
+        self._runner.loop.call_soon_threadsafe(callback, *args)
+
+    async def _start(self) -> None:
+        self._app_runner = web.AppRunner(self.make_app())
+        await self._app_runner.setup()
+        site = web.TCPSite(self._app_runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]  # type: ignore
+
+
+class UntappdStub(StubServer):
+    """
+    Searches find beers with ids from 1 to `beers`, brewery of beer is `id % breweries + 1`, any id can be fetched.
+    Every response waits `latency` seconds plus up to `jitter` and fails with 500 with `error_rate` probability.
+    API responses carry rate limit headers, and the API answers 429 after `rate_limit` requests in `rate_period`.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.05,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit: int = 100,
+        rate_period: float = 60 * 60,
+        beers: int = 1000,
+        breweries: int = 100,
+        search_results: int = 5,
+        seed: Optional[int] = None,
+    ) -> None:
+        super().__init__(host, port)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.rate_period = rate_period
+        self.beers = beers
+        self.breweries = breweries
+        self.search_results = search_results
+        self.stats: Counter = Counter()
+        self._random = random.Random(seed)
+        self._window_started = time.monotonic()
+        self._window_calls = 0
+        self._beer = json.loads((FIXTURES / "api_beer.json").read_text())
+        self._brewery = json.loads((FIXTURES / "api_brewery.json").read_text())
+        self._pages = {page: (FIXTURES / f"{page}.html").read_bytes() for page in ("beer", "brewery", "search")}
+
+    def make_app(self) -> web.Application:
+        app = web.Application(middlewares=[self.upstream_conditions])
+        app.router.add_get("/v4/search/beer", self.api_search_beer)
+        app.router.add_get("/v4/search/brewery", self.api_search_brewery)
+        app.router.add_get("/v4/beer/info/{item_id}", self.api_beer)
+        app.router.add_get("/v4/brewery/info/{item_id}", self.api_brewery)
+        app.router.add_get("/search", self.page("search"))
+        app.router.add_get("/beer/{item_id}", self.page("beer"))
+        app.router.add_get("/brewery/{item_id}", self.page("brewery"))
+        return app
+
+    @web.middleware
+    async def upstream_conditions(self, request: web.Request, handler) -> web.StreamResponse:
+        is_api = request.path.startswith("/v4/")
+        self.stats["api_requests" if is_api else "page_requests"] += 1
+        await asyncio.sleep(self.latency + self._random.uniform(0, self.jitter))
+        headers, throttled = self._take_quota() if is_api else ({}, False)
+        if throttled:
+            self.stats["throttled"] += 1
+            return web.json_response({"meta": {"code": 429}}, status=429, headers=headers)
+        if self._random.random() < self.error_rate:
+            self.stats["errors"] += 1
+            raise web.HTTPInternalServerError(headers=headers)
+        response = await handler(request)
+        response.headers.update(headers)
+        return response
+
+    def _take_quota(self) -> Tuple[Dict[str, str], bool]:
+        now = time.monotonic()
+        if now - self._window_started >= self.rate_period:
+            self._window_started, self._window_calls = now, 0
+        self._window_calls += 1
+        remaining = max(self.rate_limit - self._window_calls, 0)
+        headers = {"X-Ratelimit-Limit": str(self.rate_limit), "X-Ratelimit-Remaining": str(remaining)}
+        return headers, self._window_calls > self.rate_limit
+
+    def search_ids(self, query: str, count: int) -> List[int]:
+        """Same query always finds the same items"""
+        start = zlib.crc32(query.lower().encode())
+        return [(start + i) % count + 1 for i in range(min(self.search_results, count))]
+
+    def create_beer(self, beer_id: int) -> dict:
+        response = copy.deepcopy(self._beer)
+        beer = response["response"]["beer"]
+        beer["bid"] = beer_id
+        beer["beer_name"] = f"{beer['beer_name']} {beer_id}"
+        beer["brewery"]["brewery_id"] = beer_id % self.breweries + 1
+        for offset, item in enumerate(beer["similar"]["items"], 1):
+            item["beer"]["bid"] = (beer_id + offset) % self.beers + 1
+        return response
+
+    def create_brewery(self, brewery_id: int) -> dict:
+        response = copy.deepcopy(self._brewery)
+        response["response"]["brewery"]["brewery_id"] = brewery_id
+        response["response"]["brewery"]["brewery_name"] = f"Testbräu {brewery_id}"
+        return response
+
+    async def api_search_beer(self, request: web.Request) -> web.Response:
+        items = [{"beer": {"bid": beer_id}} for beer_id in self.search_ids(request.query.get("q", ""), self.beers)]
+        return web.json_response({"response": {"beers": {"count": len(items), "items": items}}})
+
+    async def api_search_brewery(self, request: web.Request) -> web.Response:
+        ids = self.search_ids(request.query.get("q", ""), self.breweries)
+        items = [{"brewery": {"brewery_id": brewery_id}} for brewery_id in ids]
+        return web.json_response({"response": {"brewery": {"count": len(items), "items": items}}})
+
+    async def api_beer(self, request: web.Request) -> web.Response:
+        beer_id = int(request.match_info["item_id"])
+        return web.json_response(self.create_beer(beer_id))
+
+    async def api_brewery(self, request: web.Request) -> web.Response:
+        brewery_id = int(request.match_info["item_id"])
+        return web.json_response(self.create_brewery(brewery_id))
+
+    def page(self, name: str):
+        async def handle(request: web.Request) -> web.Response:
+            return web.Response(body=self._pages[name], content_type="text/html")
+
+        return handle
+
+
+class TelegramStub(StubServer):
+    """
+    Bot API methods used by the bot. Sent messages are recorded as parsed requests with the method name,
+    the queue of a chat is returned by `replies`, or they are passed to `on_reply` with the chat id instead.
+    Updates pushed by `push_update` are served by getUpdates.
+    """
+
+    def __init__(
+        self, host: str = "127.0.0.1", port: int = 0, on_reply: Optional[Callable[[int, dict], None]] = None
+    ) -> None:
+        super().__init__(host, port)
+        self._on_reply = on_reply
+        self.stats: Counter = Counter()
+        self._replies: Dict[int, Queue] = defaultdict(Queue)
+        self._replies_lock = threading.Lock()
+        self._updates: List[dict] = []
+        self._updates_changed: Optional[asyncio.Condition] = None
+        self._message_id = 0
+
+    @property
+    def api_url(self) -> str:
+        """Base url of the bot API as it is passed to the telegram Bot, the token is appended to it"""
+        return f"{self.url}/bot"
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self.handle_method)
+        return app
+
+    def replies(self, chat_id: int) -> Queue:
+        with self._replies_lock:
+            return self._replies[chat_id]
+
+    def push_update(self, update: dict) -> None:
+        self.call_soon(self._push_update, update)
+
+    def _push_update(self, update: dict) -> None:
+        self._updates.append(update)
+        asyncio.ensure_future(self._notify())
+
+    async def _notify(self) -> None:
+        async with self._get_condition():
+            self._get_condition().notify_all()
+
+    def _get_condition(self) -> asyncio.Condition:
+        if self._updates_changed is None:
+            self._updates_changed = asyncio.Condition()
+        return self._updates_changed
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(request.query)
+        if request.can_read_body:
+            params.update(await request.json() if request.content_type == "application/json" else await request.post())
+        self.stats[method] += 1
+        if method == "getUpdates":
+            return self._ok(await self._get_updates(params))
+        if method == "getMe":
+            return self._ok({"id": 1, "is_bot": True, "first_name": "Beer Bot", "username": "beer_bot"})
+        if method in ("sendMessage", "sendLocation"):
+            return self._ok(self._record(method, params))
+        return self._ok(True)
+
+    async def _get_updates(self, params: dict) -> List[dict]:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        self._updates = [update for update in self._updates if update["update_id"] >= offset]
+        if not self._updates and timeout > 0:
+            condition = self._get_condition()
+            async with condition:
+                try:
+                    await asyncio.wait_for(condition.wait_for(lambda: bool(self._updates)), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        return self._updates[:limit]
+
+    def _record(self, method: str, params: dict) -> dict:
+        self._message_id += 1
+        chat_id = int(params["chat_id"])
+        message = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+        }
+        if method == "sendLocation":
+            message["location"] = {"latitude": params.get("latitude"), "longitude": params.get("longitude")}
+        else:
+            message["text"] = params.get("text", "")
+        reply = {**params, "method": method, "reply_markup": _load_markup(params.get("reply_markup"))}
+        if self._on_reply is not None:
+            self._on_reply(chat_id, reply)
+        else:
+            self.replies(chat_id).put(reply)
+        return message
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+
+def _load_markup(reply_markup) -> Optional[dict]:
+    if isinstance(reply_markup, str):
+        return json.loads(reply_markup)
+    return reply_markup
+
+
+def main(host: str, untappd_port: int, telegram_port: int, **options):
+    untappd = UntappdStub(host, untappd_port, **options).start()
+    telegram = TelegramStub(host, telegram_port).start()
+    print(f"UNTAPPD_URL={untappd.url}")
+    print(f"UNTAPPD_API_URL={untappd.url}/v4")
+    print(f"TELEGRAM_API_URL={telegram.api_url}")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        untappd.stop()
+        telegram.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--untappd-port", type=int, default=8081)
+    parser.add_argument("--telegram-port", type=int, default=8082)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds of every untappd response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random seconds added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="part of untappd responses failing with 500")
+    parser.add_argument("--rate-limit", type=int, default=100, help="API requests per period before 429")
+    parser.add_argument("--rate-period", type=float, default=60 * 60)
+    args = parser.parse_args()
+    main(
+        args.host,
+        args.untappd_port,
+        args.telegram_port,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        rate_period=args.rate_period,
+    )
@@ -0,0 +1,133 @@
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from app.entities import Beer, Brewery, BreweryShort, Contact, Location, Similar
+
+SECRET = {"X-Telegram-Bot-Api-Secret-Token": "secret"}
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def post(server, data, headers=None):
+    async def request():
+        async with TestClient(TestServer(server.make_app())) as client:
+            response = await client.post("/telegram", data=data, headers=headers)
+            return response.status
+
+    return run(request())
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        def command(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+
+        return command
+
+    def execute(self):
+        self.redis.round_trips += 1
+        return [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+        self.published = []
+        self.round_trips = 0
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def ttl(self, key):
+        if key not in self.data:
+            return -2
+        return self.ttls.get(key, -1)
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value.encode() if isinstance(value, str) else value
+        if ex is not None:
+            self.ttls[key] = ex
+        return True
+
+    def delete(self, key):
+        self.ttls.pop(key, None)
+        return 1 if self.data.pop(key, None) is not None else 0
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+        return 1
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def create_brewery(brewery_id=405662):
+    return Brewery(
+        id=brewery_id,
+        name="Testbräu",
+        brewery_type="Micro Brewery",
+        country="Germany",
+        description="",
+        contact=Contact(),
+        location=Location(lat=1.0, lng=2.0),
+        rating=3.5,
+        raters=10,
+    )
+
+
+def create_beer(beer_id=1569404, description="Spiced beer"):
+    return Beer(
+        id=beer_id,
+        name="Lost In Spice",
+        style="Spiced / Herbed Beer",
+        abv=5.5,
+        ibu=20,
+        rating=3.61,
+        raters=1024,
+        description=description,
+        brewery=BreweryShort(id=405662, name="Testbräu"),
+        similar=[Similar(id=1, name="Spice Girl"), Similar(id=2, name="Lost In Hops")],
+    )
+
+
+class FakeSession:
+    def __init__(self, pages, delay=0.01):
+        self.pages = pages
+        self.delay = delay
+        self.requested = []
+        self.running = 0
+        self.peak = 0
+
+    async def get_html(self, url, **kwargs):
+        self.requested.append(url)
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(self.delay)
+        self.running -= 1
+        return self.pages.get(url, b"")
@@ -0,0 +1,77 @@
+import pytest
+import asyncio
+from pathlib import Path
+
+from app.untappd.scraper import AsyncUntappdScraper
+from app.utils.rate_limit import HostRateLimiter
+from tests.units.helpers import FakeSession, run
+
+FIXTURES = Path(__file__).parent.parent / "fixtures" / "untappd"
+
+
+@pytest.mark.units
+class TestAsyncUntappdScraper:
+    def test_crawl_search_page(self):
+        beer_page = (FIXTURES / "beer.html").read_bytes()
+        pages = {f"https://untappd.com/beer/{beer_id}": beer_page for beer_id in (1569404, 1002, 4004, 5005)}
+        session = FakeSession(pages)
+        scraper = AsyncUntappdScraper(timeout=10, session=session, concurrency=2, rate=0)
+        search_page = (FIXTURES / "search.html").read_bytes()
+
+        result = run(scraper.crawl_search_page("beer", search_page))
+
+        assert [beer.id for beer in result] == [1569404, 1002, 4004, 5005]
+        assert len(session.requested) == 5
+        assert session.peak == 2
+
+    def test_get_brewery_by_beer_follows_brewery_link(self):
+        pages = {
+            "https://untappd.com/beer/1569404": (FIXTURES / "beer.html").read_bytes(),
+            "https://untappd.com/w/testbrau/405662": (FIXTURES / "brewery.html").read_bytes(),
+        }
+        scraper = AsyncUntappdScraper(timeout=10, session=FakeSession(pages), rate=0)
+
+        result = run(scraper.get_brewery_by_beer(1569404))
+
+        assert result.id == 405662
+        assert result.name == "Testbräu"
+
+    def test_get_brewery_by_vanity_link(self):
+        beer_page = (FIXTURES / "beer.html").read_bytes().replace(b"/w/testbrau/405662", b"/Test.Brau")
+        pages = {
+            "https://untappd.com/beer/1569404": beer_page,
+            "https://untappd.com/Test.Brau": (FIXTURES / "brewery.html").read_bytes(),
+        }
+        scraper = AsyncUntappdScraper(timeout=10, session=FakeSession(pages), rate=0)
+
+        result = run(scraper.get_brewery_by_beer(1569404))
+
+        assert (result.id, result.name) == (0, "Testbräu")
+
+    @pytest.mark.parametrize(
+        "link, brewery_id",
+        [("/w/brewery-2/123", 123), ("/w/brewery/123/", 123), ("https://untappd.com/w/b/7", 7), ("/BrewDog", 0)],
+    )
+    def test_parse_link_id(self, link, brewery_id):
+        assert AsyncUntappdScraper._parse_link_id(link) == brewery_id
+
+
+@pytest.mark.units
+class TestHostRateLimiter:
+    def test_spaces_out_requests_to_the_same_host(self):
+        limiter = HostRateLimiter(rate=20)
+        starts = {}
+
+        async def request(url):
+            await limiter.wait(url)
+            starts.setdefault(url, []).append(asyncio.get_event_loop().time())
+
+        async def main():
+            urls = ["https://untappd.com/beer/1"] * 3 + ["https://api.untappd.com/v4"] * 3
+            await asyncio.gather(*(request(url) for url in urls))
+
+        run(main())
+
+        for times in starts.values():
+            assert all(later - earlier >= 0.045 for earlier, later in zip(times, times[1:]))
+        assert abs(starts["https://untappd.com/beer/1"][0] - starts["https://api.untappd.com/v4"][0]) < 0.04
@@ -0,0 +1,106 @@
+import pytest
+import asyncio
+
+from app.untappd.backends import BackendSelector, BackendsUnavailableError, CircuitBreaker, LatencyTracker
+from tests.units.helpers import FakeClock, run
+
+
+def answer(value, delay=0.0, log=None):
+    async def call():
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            if log is not None:
+                log.append("cancelled")
+            raise
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    return call
+
+
+@pytest.mark.units
+class TestCircuitBreaker:
+    def test_opens_on_error_rate_and_closes_after_probe(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(error_rate=0.5, window=4, min_calls=4, open_timeout=10, slow_call=1, clock=clock)
+        for success, latency in ((True, 0.1), (False, 0.1), (True, 0.1), (True, 2)):
+            assert breaker.allow()
+            breaker.record(success, latency)
+
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.available()
+        assert not breaker.allow()
+        clock.now = 10
+        assert breaker.available()
+        assert breaker.allow()
+        assert not breaker.allow()
+        breaker.record(True, 0.1)
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_failed_probe_opens_again(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(min_calls=1, open_timeout=10, clock=clock)
+        breaker.record(False, 0.1)
+        clock.now = 10
+        assert breaker.allow()
+        breaker.record(False, 0.1)
+
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow()
+
+
+@pytest.mark.units
+def test_latency_percentile():
+    tracker = LatencyTracker(window=100, min_samples=10)
+    for latency in range(9):
+        tracker.add(latency)
+    assert tracker.percentile(95) is None
+    for latency in range(9, 100):
+        tracker.add(latency)
+    assert tracker.percentile(95) == 95
+
+
+@pytest.mark.units
+class TestBackendSelector:
+    def test_slow_primary_is_hedged_and_cancelled(self):
+        selector = BackendSelector(hedge_delay=0.01)
+        log = []
+
+        result = run(selector.call([("api", answer("api", 1, log)), ("scraper", answer("scraper", 0.01))]))
+
+        assert result == "scraper"
+        assert log == ["cancelled"]
+        assert selector.stats()["hedged"] == selector.stats()["hedge_wins"] == 1
+
+    def test_fast_primary_is_not_hedged(self):
+        selector = BackendSelector(hedge_delay=0.1)
+        scraped = []
+
+        async def scrape():
+            scraped.append(True)
+
+        assert run(selector.call([("api", answer("api", 0.01)), ("scraper", scrape)])) == "api"
+        assert scraped == []
+
+    def test_failure_and_empty_result_fall_back(self):
+        selector = BackendSelector(hedge_delay=1)
+
+        assert run(selector.call([("api", answer(KeyError("beer"))), ("scraper", answer("scraper"))])) == "scraper"
+        assert run(selector.call([("api", answer(None)), ("scraper", answer("scraper"))])) == "scraper"
+        assert run(selector.call([("api", answer([])), ("scraper", answer(None))])) is None
+        assert selector.stats()["fallbacks"] == 3
+        with pytest.raises(KeyError):
+            run(selector.call([("api", answer(KeyError("beer"))), ("scraper", answer(KeyError("beer")))]))
+
+    def test_open_circuits_are_skipped(self):
+        selector = BackendSelector(breaker_factory=lambda: CircuitBreaker(error_rate=0.3, min_calls=1))
+        run(selector.call([("api", answer(KeyError("beer"))), ("scraper", answer("scraper"))]))
+
+        assert not selector.available("api")
+        assert run(selector.call([("api", answer("api")), ("scraper", answer("scraper"))])) == "scraper"
+        with pytest.raises(KeyError):
+            run(selector.call([("scraper", answer(KeyError("beer")))], hedge=False))
+        with pytest.raises(BackendsUnavailableError):
+            run(selector.call([("api", answer("api")), ("scraper", answer("scraper"))]))
@@ -0,0 +1,40 @@
+import pytest
+
+from benchmarks.suite import create_cases, compare, measure, load_baselines, save_baselines
+
+
+@pytest.mark.units
+class TestBenchmarkSuite:
+    def test_cases_parse_recorded_fixtures(self):
+        for name, call in create_cases().items():
+            assert call(), f"{name} gave no result"
+
+    def test_slower_cases_are_regressions(self):
+        baselines = {"api.beer": {"relative": 1.0}, "api.brewery": {"relative": 1.0}}
+        results = {
+            "api.beer": {"relative": 1.2},
+            "api.brewery": {"relative": 1.3},
+            "bot.beer_to_html": {"relative": 0.1},
+        }
+
+        regressions, missing = compare(results, baselines, tolerance=0.25)
+
+        assert regressions == ["api.brewery"]
+        assert missing == ["bot.beer_to_html"]
+
+    def test_measure_is_relative_to_reference(self):
+        result = measure(lambda: 1, repeat=3, min_time=0.001)
+
+        assert result["seconds"] > 0
+        assert 0 < result["relative"] < 1
+
+    def test_case_without_result_fails(self):
+        with pytest.raises(RuntimeError):
+            measure(lambda: None, repeat=1, min_time=0.001)
+
+    def test_baselines_round_trip(self, tmp_path):
+        path = tmp_path / "baselines.json"
+        save_baselines({"api.beer": {"seconds": 1e-05, "relative": 0.5}}, path)
+
+        assert load_baselines(path) == {"api.beer": {"seconds": 1e-05, "relative": 0.5}}
+        assert load_baselines(tmp_path / "missing.json") == {}
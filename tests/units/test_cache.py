@@ -0,0 +1,213 @@
+import pytest
+import json
+import threading
+from dataclasses import asdict
+
+from app.untappd.cache import LocalCache, TieredCache, RedisCache, NOT_FOUND, VersionedCodec, MsgpackCodec, JsonCodec
+from tests.units.helpers import FakeClock, FakeRedis, create_beer, create_brewery
+
+
+@pytest.mark.units
+class TestLocalCache:
+    def test_evicts_least_recently_used(self):
+        cache = LocalCache(max_size=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+
+    def test_expires_items(self):
+        clock = FakeClock()
+        cache = LocalCache(max_size=2, ttl=10, clock=clock)
+        cache.set("a", 1)
+        clock.now = 9
+        assert cache.get("a") == 1
+        clock.now = 10
+        assert cache.get("a") is None
+        assert len(cache) == 0
+
+
+@pytest.mark.units
+class TestTieredCache:
+    def test_levels_and_stats(self):
+        redis = FakeRedis()
+        cache = TieredCache(redis, local=LocalCache(max_size=10, ttl=60))
+        brewery = create_brewery()
+        cache.set_to_cache("brewery_405662", brewery)
+        cache._local.clear()
+
+        assert cache.get_from_cache("brewery_405662") == brewery
+        assert cache.get_from_cache("brewery_405662") is cache.get_from_cache("brewery_405662")
+        assert cache.get_from_cache("brewery_1") is None
+
+        stats = cache.stats()
+        assert stats["local_hits"] == 2
+        assert stats["redis_hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["local_hit_ratio"] == 0.5
+        assert stats["redis_hit_ratio"] == 0.5
+
+    def test_invalidation_from_other_process(self):
+        redis = FakeRedis()
+        first = TieredCache(redis, local=LocalCache(max_size=10, ttl=60))
+        second = TieredCache(redis, local=LocalCache(max_size=10, ttl=60))
+        second._local.set("brewery_405662", create_brewery())
+        first.set_to_cache("brewery_405662", create_brewery())
+
+        for channel, message in redis.published:
+            first._on_invalidate({"channel": channel, "data": message.encode()})
+            second._on_invalidate({"channel": channel, "data": message.encode()})
+
+        assert first._local.get("brewery_405662") is not None
+        assert second._local.get("brewery_405662") is None
+
+
+@pytest.mark.units
+class TestRedisCache:
+    def test_ttl_by_entity_type(self):
+        redis = FakeRedis()
+        cache = RedisCache(redis, ttl={"brewery": 100, "default": 10}, stale_ttl=5)
+        cache.set_to_cache("brewery_405662", create_brewery())
+
+        assert redis.ttls["brewery_405662"] == 105
+        assert cache.get_ttl("beer_1") == 10
+
+    def test_negative_cache(self):
+        redis = FakeRedis()
+        cache = RedisCache(redis, negative_ttl=7)
+        cache.set_to_cache("brewery_1", None)
+
+        assert cache.get_from_cache("brewery_1") is NOT_FOUND
+        assert redis.ttls["brewery_1"] == 7
+
+    def test_stale_item_is_served_and_refreshed_once(self):
+        redis = FakeRedis()
+        cache = RedisCache(redis, ttl={"default": 100}, stale_ttl=10)
+        brewery = create_brewery()
+        cache.set_to_cache("brewery_405662", brewery)
+        redis.ttls["brewery_405662"] = 5
+        release = threading.Event()
+        refreshed = []
+
+        def refresh():
+            release.wait(1)
+            refreshed.append(True)
+
+        assert cache.get_from_cache("brewery_405662", refresh) == brewery
+        assert cache.get_from_cache("brewery_405662", refresh) == brewery
+        release.set()
+        cache._refresher.shutdown(wait=True)
+
+        assert refreshed == [True]
+        assert "refresh_brewery_405662" not in redis.data
+
+    def test_fresh_item_is_not_refreshed(self):
+        redis = FakeRedis()
+        cache = RedisCache(redis, ttl={"default": 100}, stale_ttl=10)
+        cache.set_to_cache("brewery_405662", create_brewery())
+
+        assert cache.get_from_cache("brewery_405662", lambda: pytest.fail("refreshed")) is not None
+        assert cache._refresher is None
+
+
+@pytest.mark.units
+class TestBulkCache:
+    def test_get_many_in_one_round_trip(self):
+        redis = FakeRedis()
+        cache = RedisCache(redis)
+        beers = {f"beer_{beer_id}": create_beer(beer_id) for beer_id in range(10)}
+        assert cache.set_many({**beers, "beer_10": None})
+        assert redis.round_trips == 1
+
+        found, missed = cache.get_many([*beers, "beer_10", "beer_11"])
+
+        assert redis.round_trips == 2
+        assert found == {**beers, "beer_10": NOT_FOUND}
+        assert missed == ["beer_11"]
+        assert redis.ttls["beer_1"] == 24 * 60 * 60 + 60 * 60
+        assert redis.ttls["beer_10"] == 2 * 60
+
+    def test_get_many_refreshes_stale_items(self):
+        redis = FakeRedis()
+        cache = RedisCache(redis, refresh_workers=1)
+        cache.set_many({"beer_1": create_beer(1), "beer_2": create_beer(2)})
+        redis.ttls["beer_2"] = 10
+        refreshed = []
+        done = threading.Event()
+
+        def refresh(key):
+            refreshed.append(key)
+            done.set()
+
+        cache.get_many(["beer_1", "beer_2"], refresh=refresh)
+
+        assert done.wait(1)
+        assert refreshed == ["beer_2"]
+        cache.stop()
+
+    def test_tiered_get_many_checks_local_cache_first(self):
+        redis = FakeRedis()
+        cache = TieredCache(redis, local=LocalCache(max_size=10, ttl=60))
+        cache.set_many({"beer_1": create_beer(1), "beer_2": create_beer(2)})
+        cache._local.delete("beer_2")
+        round_trips = redis.round_trips
+
+        found, missed = cache.get_many(["beer_1", "beer_2", "beer_3"])
+        assert list(found) == ["beer_1", "beer_2"]
+        assert missed == ["beer_3"]
+        assert redis.round_trips == round_trips + 1
+
+        cache.get_many(["beer_1", "beer_2"])
+        assert redis.round_trips == round_trips + 1
+        stats = cache.stats()
+        assert (stats["local_hits"], stats["redis_hits"], stats["misses"]) == (3, 1, 1)
+
+
+@pytest.mark.units
+class TestVersionedCodec:
+    @pytest.mark.parametrize("entity_type, entity", [("beer", create_beer()), ("brewery", create_brewery())])
+    def test_roundtrip(self, entity_type, entity):
+        codec = VersionedCodec(MsgpackCodec())
+        data = codec.encode(entity)
+
+        assert data[0] == MsgpackCodec.version
+        assert codec.decode(entity_type, data) == entity
+        assert len(data) < len(json.dumps(asdict(entity)))
+
+    def test_compress_long_values(self):
+        codec = VersionedCodec(MsgpackCodec(), compress_threshold=256)
+        beer = create_beer(description="Very spicy. " * 100)
+        data = codec.encode(beer)
+
+        assert data[0] == MsgpackCodec.version | VersionedCodec.COMPRESSED
+        assert len(data) < len(beer.description)
+        assert codec.decode("beer", data) == beer
+
+    @pytest.mark.parametrize("entity_type, entity", [("beer", create_beer()), ("brewery", create_brewery())])
+    def test_read_legacy_json(self, entity_type, entity):
+        codec = VersionedCodec(MsgpackCodec())
+        data = json.dumps(asdict(entity)).encode()
+
+        assert codec.decode(entity_type, data) == entity
+        assert VersionedCodec(JsonCodec()).encode(entity) == data
+
+    def test_unknown_version(self):
+        with pytest.raises(ValueError):
+            VersionedCodec(MsgpackCodec()).decode("beer", b"\x05payload")
+
+
+@pytest.mark.units
+class TestSearchCache:
+    def test_normalized_queries_share_result(self):
+        redis = FakeRedis()
+        cache = RedisCache(redis, ttl={"search": 60, "default": 10})
+        cache.set_search_result("  Lost  in SPICE ", "beer", [1569404, 1])
+
+        assert cache.get_search_result("lost in spice", "beer") == [1569404, 1]
+        assert cache.get_search_result("ＬＯＳＴ\tin spice", "beer") == [1569404, 1]
+        assert cache.get_search_result("lost in spice", "brewery") is None
+        assert redis.ttls["search_beer_lost in spice"] == 60
@@ -0,0 +1,104 @@
+import pytest
+from unittest.mock import MagicMock
+
+from app import beer_bot
+from app.bot.conversation import LocalConversationStore, RedisConversationStore
+from tests.units.helpers import FakeClock, create_beer, create_brewery
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.mark.units
+def test_local_store_keeps_recently_used_items(clock):
+    store = LocalConversationStore(max_items=2, max_users=10, idle_ttl=60, clock=clock)
+    store.put(1, "beer_1", 1)
+    store.put(1, "beer_2", 2)
+    assert store.get(1, "beer_1") == 1
+    store.put(1, "beer_3", 3)
+
+    assert store.get(1, "beer_2") is None
+    assert store.get(1, "beer_1") == 1
+    assert store.get(1, "beer_3") == 3
+    assert store.get(2, "beer_1") is None
+
+
+@pytest.mark.units
+def test_local_store_expires_idle_users(clock):
+    store = LocalConversationStore(max_items=2, max_users=2, idle_ttl=60, clock=clock)
+    store.put(1, "beer_1", 1)
+    clock.now = 30
+    store.put(2, "beer_1", 2)
+    store.put(3, "beer_1", 3)
+    assert len(store) == 2
+    assert store.get(1, "beer_1") is None
+
+    clock.now = 50
+    assert store.get(3, "beer_1") == 3
+    clock.now = 100
+    assert store.get(2, "beer_1") is None
+    assert store.get(3, "beer_1") == 3
+    assert len(store) == 1
+
+
+@pytest.mark.units
+def test_redis_store_keeps_recently_used_items(clock):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    redis = fakeredis.FakeRedis()
+    store = RedisConversationStore(redis, prefix="conversation", max_items=2, idle_ttl=60, clock=clock)
+    store.put(1, "beer_1", 1)
+    clock.now = 1
+    store.put(1, "beer_2", 2)
+    clock.now = 2
+    assert store.get(1, "beer_1") == 1
+    clock.now = 3
+    store.put(1, "brewery_1", 10)
+
+    assert store.get(1, "beer_2") is None
+    assert store.get(1, "beer_1") == 1
+    assert store.get(1, "brewery_1") == 10
+    assert 0 < redis.ttl("conversation:1") <= 60
+    assert redis.zcard("conversation:1:lru") == 2
+
+    store.clear(1)
+    assert store.get(1, "beer_1") is None
+
+
+@pytest.mark.units
+def test_bot_resolves_references_by_client(clock, monkeypatch):
+    beer, brewery = create_beer(1), create_brewery(2)
+    client = MagicMock()
+    client.get_item.side_effect = lambda item_id, item_type: {("beer", 1): beer, ("brewery", 2): brewery}[
+        (item_type, item_id)
+    ]
+    store = LocalConversationStore(clock=clock)
+    # another bot would make a second dispatcher, which breaks `run_async` of the first one
+    bot = beer_bot
+    monkeypatch.setattr(bot, "_client", client)
+    monkeypatch.setattr(bot, "_conversations", store)
+    update = MagicMock()
+    update.effective_user.id = 42
+
+    bot.put_beer_context(update, beer.id, beer)
+    bot.put_brewery_context(update, beer.id, brewery)
+
+    assert store.get(42, "beer_1") == 1
+    assert store.get(42, "brewery_1") == 2
+    assert bot.get_beer_context(update, beer.id) is beer
+    assert bot.get_brewery_context(update, beer.id) is brewery
+    assert bot.get_beer_context(update, 3) is None
+
+
+@pytest.mark.units
+def test_bot_skips_items_without_id(clock, monkeypatch):
+    store = LocalConversationStore(clock=clock)
+    monkeypatch.setattr(beer_bot, "_conversations", store)
+    update = MagicMock()
+    update.effective_user.id = 42
+
+    beer_bot.put_brewery_context(update, 1, create_brewery(0))
+
+    assert store.get(42, "brewery_1") is None
@@ -0,0 +1,109 @@
+import pytest
+from pathlib import Path
+
+from app.untappd.cache import RedisCache
+from app.untappd.search_index import SearchIndex
+from tests.units.helpers import create_beer
+
+scrapy = pytest.importorskip("scrapy")
+fakeredis = pytest.importorskip("fakeredis")
+
+from scrapy.http import HtmlResponse  # noqa: E402
+
+from app.untappd.crawler import UntappdSpider, CrawlState, RedisCachePipeline  # noqa: E402
+
+FIXTURES = Path(__file__).parent.parent / "fixtures" / "untappd"
+SEARCH_IDS = [1569404, 1002, 3003, 4004, 5005]
+
+
+def create_spider(redis, **options):
+    options = {"query": "lost", "type": "beer", "sort": "all", "url": "http://127.0.0.1:8081", **options}
+    return UntappdSpider(options=options, redis_client=redis)
+
+
+def page_response(url, page, status=200, headers=None):
+    body = (FIXTURES / f"{page}.html").read_bytes() if status == 200 else b""
+    return HtmlResponse(url=url, body=body, status=status, headers=headers, request=scrapy.Request(url))
+
+
+def requested_urls(results):
+    return [result.url for result in results if isinstance(result, scrapy.Request)]
+
+
+@pytest.mark.units
+class TestUntappdSpider:
+    def test_search_page_follows_items_and_next_page(self):
+        spider = create_spider(fakeredis.FakeRedis(), page_size=5, pages=2)
+
+        urls = requested_urls(spider.parse(page_response(spider.search_url("lost"), "search"), "lost", 0))
+
+        assert spider.allowed_domains == ["127.0.0.1"]
+        assert urls == [f"http://127.0.0.1:8081/beer/{beer_id}" for beer_id in SEARCH_IDS] + [
+            spider.search_url("lost", offset=5)
+        ]
+
+    def test_fresh_items_are_skipped(self):
+        redis = fakeredis.FakeRedis()
+        RedisCache(redis).set_many({"beer_1569404": create_beer(1569404), "beer_3003": create_beer(3003)})
+        spider = create_spider(redis, page_size=5, pages=2)
+
+        urls = requested_urls(spider.parse(page_response(spider.search_url("lost"), "search"), "lost", 0))
+
+        assert urls[:-1] == [f"http://127.0.0.1:8081/beer/{beer_id}" for beer_id in (1002, 4004, 5005)]
+        assert spider.crawl_stats["fresh"] == 2
+
+    def test_paging_stops_at_cached_page(self):
+        redis = fakeredis.FakeRedis()
+        RedisCache(redis).set_many({f"beer_{beer_id}": create_beer(beer_id) for beer_id in SEARCH_IDS})
+        spider = create_spider(redis, page_size=5, pages=2)
+
+        assert requested_urls(spider.parse(page_response(spider.search_url("lost"), "search"), "lost", 0)) == []
+
+    def test_full_crawl_follows_fresh_items(self):
+        redis = fakeredis.FakeRedis()
+        RedisCache(redis).set_many({f"beer_{beer_id}": create_beer(beer_id) for beer_id in SEARCH_IDS})
+        spider = create_spider(redis, incremental=False)
+
+        assert len(requested_urls(spider.parse(page_response(spider.search_url("lost"), "search"), "lost", 0))) == 5
+
+    def test_crawled_page_is_written_once(self):
+        redis = fakeredis.FakeRedis()
+        spider = create_spider(redis)
+        url = "http://127.0.0.1:8081/beer/1569404"
+        headers = {"ETag": '"v1"', "Last-Modified": "Sun, 18 Oct 2026 10:00:00 GMT"}
+
+        items = list(spider.parse_beer(page_response(url, "beer", headers=headers), 1569404))
+        state = spider.state.get(url)
+        request = spider.detail_request(url, spider.parse_beer, 1569404)
+        unchanged = list(spider.parse_beer(page_response(url, "beer", headers={"ETag": '"v2"'}), 1569404))
+        not_modified = list(spider.parse_beer(page_response(url, "beer", status=304), 1569404))
+
+        assert [item["key"] for item in items] == ["beer_1569404"]
+        assert items[0]["entity"].name == "Lost In Spice"
+        assert state["etag"] == '"v1"' and state["last_modified"] == headers["Last-Modified"]
+        assert request.headers[b"If-None-Match"] == b'"v1"'
+        assert unchanged == [] and not_modified == []
+        assert spider.state.get(url)["etag"] == '"v2"'
+        assert spider.crawl_stats == {"written": 0, "unchanged": 1, "not_modified": 1, "fresh": 0}
+
+    def test_crawled_items_are_indexed(self):
+        redis = fakeredis.FakeRedis()
+        spider = create_spider(redis)
+        url = "http://127.0.0.1:8081/beer/1569404"
+        for item in spider.parse_beer(page_response(url, "beer"), 1569404):
+            RedisCachePipeline().process_item(item, spider)
+
+        index = SearchIndex(redis)
+        index.load()
+
+        assert spider.crawl_stats["written"] == 1
+        assert index.search("lost in spice", "beer") == [(1569404, 1.0)]
+
+    def test_page_state_expires(self):
+        redis = fakeredis.FakeRedis()
+        state = CrawlState(redis, ttl=60)
+        state.set("http://127.0.0.1:8081/beer/1", {"etag": '"v1"'})
+
+        assert 0 < redis.ttl(state.key("http://127.0.0.1:8081/beer/1")) <= 60
+        state.clear()
+        assert state.get("http://127.0.0.1:8081/beer/1") == {}
@@ -0,0 +1,53 @@
+import pytest
+import copy
+import pickle
+from dataclasses import asdict, FrozenInstanceError
+
+from app.entities import Beer, Brewery, Contact, Location, SearchItem, Similar
+from tests.units.helpers import create_beer, create_brewery
+
+
+def fresh(value: str) -> str:
+    return (value + " ")[:-1]
+
+
+@pytest.mark.units
+class TestEntities:
+    @pytest.mark.parametrize(
+        "entity",
+        [create_beer(), create_brewery(), Similar(1, "Spiced"), SearchItem(2, "Spiced"), Contact(), Location(1, 2)],
+    )
+    def test_entities_are_slotted_and_picklable(self, entity):
+        assert not hasattr(entity, "__dict__")
+        assert pickle.loads(pickle.dumps(entity)) == entity
+        assert copy.deepcopy(entity) == entity
+
+    def test_attributes_are_fixed(self):
+        beer = create_beer()
+        with pytest.raises(AttributeError):
+            beer.unknown = 1
+        with pytest.raises(FrozenInstanceError):
+            Similar(1, "Spiced").name = "Other"
+
+    def test_repeated_strings_are_interned(self):
+        breweries = [
+            Brewery(i, fresh("Testbräu"), fresh("Micro Brewery"), fresh("Germany"), "", Contact(), Location(), 3.5, 10)
+            for i in range(2)
+        ]
+        beers = [Beer(i, fresh("Stout"), fresh("Stout"), 5, 20, 3.5, 10, "", None, []) for i in range(2)]
+
+        assert breweries[0].name is breweries[1].name
+        assert breweries[0].brewery_type is breweries[1].brewery_type
+        assert breweries[0].country is breweries[1].country
+        assert beers[0].style is beers[1].style
+        assert beers[0].name is not beers[1].name
+
+    def test_asdict_and_setters(self):
+        beer = create_beer()
+        beer.set_brewery({"id": 1, "name": fresh("Testbräu")})
+        beer.set_similar([{"id": 2, "name": "Similar"}])
+
+        assert asdict(beer)["brewery"] == {"id": 1, "name": "Testbräu"}
+        assert asdict(beer)["similar"] == [{"id": 2, "name": "Similar"}]
+        assert beer.brewery.name is create_beer().brewery.name
+        assert Contact().url == ""
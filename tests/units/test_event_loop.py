@@ -0,0 +1,63 @@
+import pytest
+import asyncio
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from app.utils.event_loop import EventLoopThread, LoopOverloadedError
+
+
+@pytest.mark.units
+class TestEventLoopThread:
+    def test_run_reuses_loop(self):
+        runner = EventLoopThread(timeout=1)
+
+        async def current_loop():
+            return asyncio.get_event_loop()
+
+        try:
+            assert runner.run(current_loop()) is runner.run(current_loop()) is runner.loop
+        finally:
+            runner.stop()
+
+    def test_timeout_cancels_coroutine(self):
+        runner = EventLoopThread(timeout=1)
+        cancelled = []
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        try:
+            with pytest.raises(FutureTimeoutError):
+                runner.run(slow(), timeout=0.05)
+            runner.run(asyncio.sleep(0.05))
+            assert cancelled == [True]
+            assert runner.pending == 0
+        finally:
+            runner.stop()
+
+    def test_backpressure(self):
+        runner = EventLoopThread(timeout=1, max_pending=1)
+        try:
+            future = runner.submit(asyncio.sleep(0.2))
+            with pytest.raises(LoopOverloadedError):
+                runner.submit(asyncio.sleep(0), wait=0.01)
+            future.result(1)
+        finally:
+            runner.stop()
+
+    def test_stop_awaits_shutdown_hooks(self):
+        runner = EventLoopThread(timeout=1)
+        closed = []
+
+        async def close():
+            closed.append(True)
+
+        runner.add_shutdown_hook(close)
+        runner.run(asyncio.sleep(0))
+        runner.stop()
+
+        assert closed == [True]
+        assert runner.loop.is_closed()
@@ -0,0 +1,77 @@
+import pytest
+import asyncio
+
+from aiohttp import web, ClientResponseError
+
+from app.utils.event_loop import EventLoopThread
+from app.utils.fetch import HttpSession
+
+BEER_RESPONSE = {"response": {"beer": {"bid": 1569404}}}
+
+
+@pytest.fixture
+def server_url():
+    runner = EventLoopThread(timeout=1, name="test-server")
+
+    async def beer_info(request):
+        return web.json_response(BEER_RESPONSE)
+
+    async def status(request):
+        return web.Response(status=int(request.match_info["status"]), content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/beer", beer_info)
+    app.router.add_get("/status/{status}", status)
+    app_runner = web.AppRunner(app)
+    runner.run(app_runner.setup())
+    site = web.TCPSite(app_runner, "127.0.0.1", 0)
+    runner.run(site.start())
+    port = site._server.sockets[0].getsockname()[1]  # type: ignore
+    yield f"http://127.0.0.1:{port}"
+    runner.run(app_runner.cleanup())
+    runner.stop()
+
+
+@pytest.mark.units
+class TestHttpSession:
+    def test_request_from_another_loop_falls_back(self, server_url):
+        http_session = HttpSession()
+        first, other = asyncio.new_event_loop(), asyncio.new_event_loop()
+        try:
+            assert first.run_until_complete(http_session.get_json(f"{server_url}/beer")) == BEER_RESPONSE
+            pooled = http_session._session
+
+            assert other.run_until_complete(http_session.get_json(f"{server_url}/beer")) == BEER_RESPONSE
+            assert http_session._session is pooled
+            assert http_session._loop is first
+        finally:
+            first.run_until_complete(http_session.close())
+            first.close()
+            other.close()
+
+    def test_session_follows_loop_after_its_loop_is_closed(self, server_url):
+        http_session = HttpSession()
+        first, other = asyncio.new_event_loop(), asyncio.new_event_loop()
+        try:
+            first.run_until_complete(http_session.get_json(f"{server_url}/beer"))
+            first.close()
+
+            assert other.run_until_complete(http_session.get_json(f"{server_url}/beer")) == BEER_RESPONSE
+            assert http_session._loop is other
+            pooled = http_session._session
+            other.run_until_complete(http_session.get_json(f"{server_url}/beer"))
+            assert http_session._session is pooled
+        finally:
+            other.run_until_complete(http_session.close())
+            other.close()
+
+    def test_missing_page_is_empty_and_failed_page_raises(self, server_url):
+        http_session = HttpSession()
+        loop = asyncio.new_event_loop()
+        try:
+            assert loop.run_until_complete(http_session.get_html(f"{server_url}/status/404")) == b""
+            with pytest.raises(ClientResponseError):
+                loop.run_until_complete(http_session.get_html(f"{server_url}/status/503"))
+        finally:
+            loop.run_until_complete(http_session.close())
+            loop.close()
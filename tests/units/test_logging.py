@@ -0,0 +1,98 @@
+import pytest
+import logging
+import threading
+from queue import Queue
+
+from app.logging import init_log, stop_log, LoggerMixin, SamplingFilter, NonBlockingQueueHandler
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(self.format(record))
+
+
+class Component(LoggerMixin):
+    def __init__(self):
+        super().__init__("app.tests.Component")
+
+
+class Payload:
+    def __init__(self, size):
+        self.size = size
+        self.formatted_by = None
+
+    def __str__(self):
+        self.formatted_by = threading.current_thread().name
+        return "x" * self.size
+
+
+@pytest.fixture
+def handler():
+    handler = ListHandler()
+    yield handler
+    init_log()
+
+
+@pytest.mark.units
+class TestLogging:
+    def test_records_are_formatted_by_listener(self, handler):
+        init_log(level="DEBUG", levels={}, max_length=10, handler=handler)
+        payload = Payload(100)
+        Component().logger.debug("Got response %s", payload)
+        Component().logger.info(f"Got response {'y' * 20}")
+        stop_log()
+
+        [message, formatted] = handler.messages
+        assert message.endswith("DEBUG app.tests.Component Got response xxxxxxxxxx... (100 chars)")
+        assert formatted.endswith("INFO app.tests.Component Got respon... (33 chars)")
+        assert payload.formatted_by != threading.current_thread().name
+
+    def test_component_levels(self, handler):
+        init_log(level="WARNING", levels={"app.tests": "DEBUG"}, handler=handler)
+        Component().logger.debug("component")
+        LoggerMixin().logger.info("other")
+        LoggerMixin().logger.warning("warning")
+        stop_log()
+
+        assert [message.split()[-1] for message in handler.messages] == ["component", "warning"]
+
+    def test_disabled_records_are_not_formatted(self, handler):
+        init_log(level="INFO", levels={}, handler=handler)
+        payload = Payload(10)
+        Component().logger.debug("Got response %s", payload)
+        stop_log()
+
+        assert handler.messages == []
+        assert payload.formatted_by is None
+
+    def test_debug_records_are_sampled(self):
+        values = iter([0.05, 0.5, 0.5])
+        sampling = SamplingFilter(rate=0.1, rng=lambda: next(values))
+        records = [logging.makeLogRecord({"levelno": level}) for level in (10, 10, 10, 20, 40)]
+
+        assert [sampling.filter(record) for record in records] == [True, False, False, True, True]
+        assert sampling.sampled_out == 2
+
+    def test_full_queue_drops_records(self):
+        handler = NonBlockingQueueHandler(Queue(maxsize=1))
+        for _ in range(3):
+            handler.handle(logging.makeLogRecord({"msg": "message"}))
+
+        assert handler.queue.qsize() == 1
+        assert handler.dropped == 2
+
+    def test_record_context_is_skipped_on_demand(self, handler):
+        srcfile = logging._srcfile
+        init_log(levels={}, handler=handler)
+        assert logging._srcfile is not None and logging.logThreads
+
+        init_log(levels={}, handler=handler, skip_context=True)
+        try:
+            assert logging._srcfile is None
+            assert not logging.logThreads and not logging.logMultiprocessing
+        finally:
+            logging._srcfile, logging.logThreads, logging.logMultiprocessing = srcfile, True, True
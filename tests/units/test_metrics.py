@@ -0,0 +1,90 @@
+import pytest
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from app.metrics import Registry, MetricsServer, timed, key_type
+from tests.units.helpers import run
+
+
+@pytest.fixture
+def registry():
+    return Registry()
+
+
+def get_metrics(server):
+    async def request():
+        async with TestClient(TestServer(server.make_app())) as client:
+            response = await client.get("/metrics")
+            return response.status, response.headers["Content-Type"], await response.text()
+
+    return run(request())
+
+
+@pytest.mark.units
+class TestMetrics:
+    def test_counter_and_gauge_exposition(self, registry):
+        requests = registry.counter("cache_requests_total", "Cache lookups", ["level", "result"])
+        size = registry.gauge("queue_size", "Queue size", ["queue"])
+        requests.inc(level="redis", result="hit")
+        requests.inc(2, level="redis", result="hit")
+        requests.labels(level="local", result="miss").inc()
+        size.set_function(lambda: 3, queue="prefetch")
+
+        assert registry.expose().splitlines() == [
+            "# HELP cache_requests_total Cache lookups",
+            "# TYPE cache_requests_total counter",
+            'cache_requests_total{level="local",result="miss"} 1.0',
+            'cache_requests_total{level="redis",result="hit"} 3.0',
+            "# HELP queue_size Queue size",
+            "# TYPE queue_size gauge",
+            'queue_size{queue="prefetch"} 3',
+        ]
+
+    def test_histogram_buckets_are_cumulative(self, registry):
+        latency = registry.histogram("latency_seconds", "Latency", buckets=[0.1, 1])
+        for value in (0.05, 0.1, 0.5, 2):
+            latency.observe(value)
+
+        assert registry.expose().splitlines()[2:] == [
+            'latency_seconds_bucket{le="0.1"} 2',
+            'latency_seconds_bucket{le="1.0"} 3',
+            'latency_seconds_bucket{le="+Inf"} 4',
+            "latency_seconds_sum 2.65",
+            "latency_seconds_count 4",
+        ]
+
+    def test_timed_counts_errors(self, registry):
+        latency = registry.histogram("handler_seconds", "Handlers", ["handler"])
+        errors = registry.counter("handler_errors_total", "Failed handlers", ["handler"])
+
+        @timed(latency, errors, handler="search")
+        def handle(fail):
+            if fail:
+                raise ValueError("failed")
+            return "ok"
+
+        assert handle(False) == "ok"
+        with pytest.raises(ValueError):
+            handle(True)
+
+        exposed = registry.expose()
+        assert 'handler_seconds_count{handler="search"} 2' in exposed
+        assert 'handler_errors_total{handler="search"} 1.0' in exposed
+
+    def test_duplicated_metric(self, registry):
+        registry.counter("requests_total", "Requests")
+        with pytest.raises(ValueError):
+            registry.gauge("requests_total", "Requests")
+
+    def test_key_type(self):
+        assert key_type("beer_1") == "beer"
+        assert key_type("brewery_405662") == "brewery"
+
+    def test_metrics_endpoint(self, registry):
+        registry.counter("requests_total", "Requests").inc()
+
+        status, content_type, text = get_metrics(MetricsServer(registry=registry))
+
+        assert status == 200
+        assert content_type.startswith("text/plain; version=0.0.4")
+        assert "requests_total 1.0" in text
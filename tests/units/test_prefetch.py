@@ -0,0 +1,90 @@
+import pytest
+import threading
+
+from app.untappd.prefetch import Prefetcher
+from app.utils.rate_limit import TokenBucket
+from tests.units.helpers import FakeClock, create_beer
+
+
+class FakeRunner:
+    def __init__(self, pending=0):
+        self.pending = pending
+
+
+class FakeClient:
+    def __init__(self, cached=()):
+        self.cached = set(cached)
+        self.fetched = []
+        self.done = threading.Event()
+
+    def missing_items(self, item_ids, item_type):
+        return [item_id for item_id in item_ids if (item_type, item_id) not in self.cached]
+
+    def get_items(self, item_ids, item_type, background=False):
+        assert background
+        self.fetched.append((item_type, list(item_ids)))
+        if item_type == "beer":
+            self.done.set()
+        return list(item_ids)
+
+
+@pytest.mark.units
+def test_token_bucket_refills_up_to_capacity():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=3, clock=clock)
+
+    assert bucket.take(5) == 3
+    assert bucket.take(1) == 0
+    clock.now = 1
+    assert bucket.take(5) == 2
+    clock.now = 100
+    assert bucket.take(5) == 3
+
+
+@pytest.mark.units
+def test_prefetch_fetches_only_missing_neighbours():
+    beer = create_beer()
+    client = FakeClient(cached={("beer", 1)})
+    prefetcher = Prefetcher(client, FakeRunner(), rate=0, burst=10)
+    try:
+        assert prefetcher.submit(beer)
+        assert client.done.wait(1)
+    finally:
+        prefetcher.stop()
+
+    assert client.fetched == [("brewery", [405662]), ("beer", [2])]
+    assert prefetcher.stats()["fetched"] == 2
+
+
+@pytest.mark.units
+def test_prefetch_respects_budget():
+    client = FakeClient()
+    prefetcher = Prefetcher(client, FakeRunner(), rate=0, burst=2)
+
+    prefetcher._prefetch(405662, [1, 2, 3])
+
+    assert client.fetched == [("brewery", [405662]), ("beer", [1])]
+    assert prefetcher.stats()["over_budget"] == 2
+
+
+@pytest.mark.units
+def test_prefetch_is_cancelled_under_pressure():
+    client = FakeClient()
+    prefetcher = Prefetcher(client, FakeRunner(pending=16), max_pending=16)
+    prefetcher._queue.put_nowait((1, [2]))
+
+    prefetcher._prefetch(405662, [1])
+
+    assert client.fetched == []
+    assert prefetcher.stats()["cancelled"] == 2
+    assert prefetcher.stats()["queue_size"] == 0
+
+
+@pytest.mark.units
+def test_prefetch_queue_is_bounded():
+    prefetcher = Prefetcher(FakeClient(), FakeRunner(), queue_size=1)
+    prefetcher._stopped.set()
+
+    assert prefetcher.submit(create_beer())
+    assert not prefetcher.submit(create_beer())
+    assert prefetcher.stats()["dropped_full"] == 1
@@ -0,0 +1,51 @@
+import pytest
+
+from multidict import CIMultiDict
+
+from app.untappd.quota import QuotaManager
+from tests.units.helpers import FakeClock
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def quota(clock):
+    return QuotaManager(fakeredis.FakeRedis(), limit=10, period=100, reserve=0.5, min_remaining=1, clock=clock)
+
+
+@pytest.mark.units
+def test_interactive_calls_use_reserve_of_background_calls(quota):
+    assert all(quota.acquire(background=True) for _ in range(5))
+    assert not quota.acquire(background=True)
+    assert all(quota.acquire(cost=2) for _ in range(2))
+    assert not quota.acquire()
+    assert quota.stats() == {"granted": 7, "denied_interactive": 1, "denied_background": 1, "remaining": 1.0}
+
+
+@pytest.mark.units
+def test_bucket_refills_by_limit_per_period(quota, clock):
+    assert quota.acquire(cost=9)
+    assert not quota.acquire()
+    clock.now = 10
+    assert quota.acquire()
+    assert quota.remaining() == 1.0
+    clock.now = 1000
+    assert quota.acquire(cost=9)
+
+
+@pytest.mark.units
+def test_headers_correct_remaining_quota(quota):
+    quota.observe(200, CIMultiDict({"x-ratelimit-limit": "100", "x-ratelimit-remaining": "60"}))
+    assert quota.remaining() == 60
+    assert quota.acquire(cost=10, background=True)
+    assert not quota.acquire(cost=10, background=True)
+
+    quota.observe(429, CIMultiDict())
+    assert quota.remaining() == 0
+    assert not quota.acquire()
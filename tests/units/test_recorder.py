@@ -0,0 +1,95 @@
+import pytest
+import json
+from pathlib import Path
+
+from telegram import Bot, Update
+
+from app.bot.recorder import Anonymizer, UpdateRecorder
+
+FIXTURES = Path(__file__).parent.parent / "fixtures" / "telegram"
+
+
+@pytest.fixture
+def update_json():
+    return json.loads((FIXTURES / "search_update.json").read_text())
+
+
+@pytest.mark.units
+class TestRecorder:
+    def test_personal_data_is_removed(self, update_json):
+        update_json["message"]["reply_to_message"] = {"message_id": 1, "date": 1, "text": "my phone is 123"}
+        anonymizer = Anonymizer("salt")
+
+        data = anonymizer.anonymize(update_json)
+        message = data["message"]
+
+        assert message["from"] == {
+            "id": anonymizer.pseudonym(1111111),
+            "is_bot": False,
+            "first_name": "User",
+            "language_code": "en",
+        }
+        assert message["chat"] == {"id": anonymizer.pseudonym(1111111), "type": "private", "first_name": "User"}
+        assert message["from"]["id"] != 1111111
+        assert message["text"] == "/search Lost In Spice"
+        assert message["reply_to_message"]["text"] == "x" * 15
+
+    def test_new_chat_members_are_pseudonymized(self, update_json):
+        update_json["message"]["new_chat_members"] = [{"id": 2222222, "is_bot": False, "first_name": "Jane"}]
+        anonymizer = Anonymizer("salt")
+
+        [member] = anonymizer.anonymize(update_json)["message"]["new_chat_members"]
+
+        assert member == {"id": anonymizer.pseudonym(2222222), "is_bot": False, "first_name": "User"}
+
+    def test_left_chat_member_is_pseudonymized(self, update_json):
+        update_json["message"]["left_chat_member"] = {"id": 2222222, "is_bot": False, "first_name": "Jane"}
+        anonymizer = Anonymizer("salt")
+
+        member = anonymizer.anonymize(update_json)["message"]["left_chat_member"]
+
+        assert member == {"id": anonymizer.pseudonym(2222222), "is_bot": False, "first_name": "User"}
+
+    def test_users_under_other_keys_are_pseudonymized(self, update_json):
+        update_json["message"]["via_bot"] = {"id": 3333333, "is_bot": True, "first_name": "Helper", "username": "hb"}
+        anonymizer = Anonymizer("salt")
+
+        via_bot = anonymizer.anonymize(update_json)["message"]["via_bot"]
+
+        assert via_bot == {"id": anonymizer.pseudonym(3333333), "is_bot": True, "first_name": "User"}
+
+    def test_forward_sender_name_is_removed(self, update_json):
+        update_json["message"]["forward_sender_name"] = "Jane Doe"
+
+        assert "forward_sender_name" not in Anonymizer("salt").anonymize(update_json)["message"]
+
+    def test_author_signature_is_removed(self, update_json):
+        update_json["message"]["author_signature"] = "Jane Doe"
+
+        assert "author_signature" not in Anonymizer("salt").anonymize(update_json)["message"]
+
+    def test_pseudonyms_are_keyed(self):
+        assert Anonymizer("salt").pseudonym(1111111) == Anonymizer("salt").pseudonym(1111111)
+        assert Anonymizer("salt").pseudonym(1111111) != Anonymizer("pepper").pseudonym(1111111)
+        assert Anonymizer("salt").pseudonym(-1001) < 0
+
+    def test_updates_are_written_as_jsonl(self, update_json, tmp_path):
+        path = tmp_path / "updates.jsonl"
+        recorder = UpdateRecorder(str(path), Anonymizer("salt"))
+        recorder.start()
+        for update_id in (1, 2):
+            recorder.record(Update.de_json({**update_json, "update_id": update_id}, Bot("123:abc")))
+        recorder.stop()
+
+        records = [json.loads(line) for line in path.read_text().splitlines()]
+        assert [record["update"]["update_id"] for record in records] == [1, 2]
+        assert records[0]["at"] <= records[1]["at"]
+        assert "test_user" not in path.read_text()
+        assert recorder.recorded == 2
+
+    def test_full_queue_drops_updates(self, update_json, tmp_path):
+        recorder = UpdateRecorder(str(tmp_path / "updates.jsonl"), queue_size=1)
+        for _ in range(3):
+            recorder.record(Update.de_json(update_json, Bot("123:abc")))
+
+        assert recorder.dropped == 2
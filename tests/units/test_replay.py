@@ -0,0 +1,43 @@
+import pytest
+
+from benchmarks.load import command_update, callback_update
+from benchmarks.replay import update_kind, chat_id, ReplyTracker
+
+
+@pytest.mark.units
+class TestReplay:
+    @pytest.mark.parametrize(
+        "update, kind",
+        [
+            (command_update(7, "/search Lost In Spice"), "search"),
+            (command_update(7, "/list@beer_bot"), "list"),
+            (callback_update(7, "beer_1569404"), "beer"),
+            (callback_update(7, "info_1569404_brewery"), "info_brewery"),
+            ({"update_id": 1, "message": {"chat": {"id": 7}, "text": "xxxx"}}, None),
+        ],
+    )
+    def test_update_kind(self, update, kind):
+        assert update_kind(update) == kind
+        assert chat_id(update) == 7
+
+    def test_replies_are_matched_to_oldest_update_of_chat(self):
+        tracker = ReplyTracker()
+        tracker.sent(7, "search")
+        tracker.sent(7, "info_brewery")
+        tracker.sent(8, "search")
+
+        tracker.on_reply(7, {})
+        tracker.on_reply(9, {})
+
+        assert len(tracker.latencies["search"]) == 1
+        assert tracker.unanswered() == {"info_brewery": 1, "search": 1}
+        assert tracker.pending() == 2
+
+    def test_wait_returns_when_replies_settled(self):
+        tracker = ReplyTracker()
+        tracker.sent(7, "search")
+        tracker.on_reply(7, {})
+
+        tracker.wait(timeout=1, settle=0.01)
+
+        assert tracker.pending() == 0
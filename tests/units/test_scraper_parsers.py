@@ -0,0 +1,88 @@
+import pytest
+from pathlib import Path
+
+from app.untappd.scraper import UntappdScraper, BEER_PAGE_STRAINER
+from app.entities import Beer, Brewery, BreweryShort, Contact, Location, SearchItem, Similar
+
+FIXTURES = Path(__file__).parent.parent / "fixtures" / "untappd"
+BACKENDS = [("html.parser", False), ("html.parser", True), ("lxml", False), ("lxml", True)]
+
+
+def read_fixture(name: str) -> bytes:
+    return (FIXTURES / name).read_bytes()
+
+
+@pytest.mark.units
+@pytest.mark.parametrize("parser, restrict", BACKENDS)
+class TestUntappdScraperParsers:
+    def test_parse_beer_page(self, parser, restrict):
+        scraper = UntappdScraper(timeout=10, parser=parser, restrict=restrict)
+        result = scraper._parse_beer_page(1569404, read_fixture("beer.html"))
+
+        assert result == Beer(
+            id=1569404,
+            name="Lost In Spice",
+            style="Spiced / Herbed Beer",
+            abv=5.5,
+            ibu=20.0,
+            rating=3.61,
+            raters=1024.0,
+            description="A spiced ale brewed with coriander, ginger and orange peel. Show Less",
+            brewery=BreweryShort(id=0, name="Testbräu"),
+            similar=[Similar(1001, "Spice Girl"), Similar(1002, "Lost In Hops"), Similar(1003, "Ginger Ale")],
+        )
+
+    def test_parse_brewery_page(self, parser, restrict):
+        scraper = UntappdScraper(timeout=10, parser=parser, restrict=restrict)
+        result = scraper._parse_brewery_page(405662, read_fixture("brewery.html"))
+
+        assert result == Brewery(
+            id=405662,
+            name="Testbräu",
+            brewery_type="Micro Brewery",
+            country="",
+            description="Small test brewery from Berlin brewing spiced and hoppy ales. Show Less",
+            contact=Contact(
+                twitter="https://twitter.com/testbraeu",
+                facebook="https://facebook.com/testbraeu",
+                url="https://testbraeu.de",
+            ),
+            location=Location(None, None),
+            rating=3.75,
+            raters=4096,
+        )
+
+    def test_parse_search_page(self, parser, restrict):
+        scraper = UntappdScraper(timeout=10, parser=parser, restrict=restrict)
+        result = scraper._parse_search_page(read_fixture("search.html"))
+
+        assert result == [
+            SearchItem(1569404, "Lost In Spice"),
+            SearchItem(1002, "Lost In Hops"),
+            SearchItem(3003, "Test Pilot"),
+            SearchItem(4004, "Test Tube Stout"),
+            SearchItem(5005, "Taste Test"),
+        ]
+
+    def test_restricted_parse_falls_back_to_whole_page(self, parser, restrict):
+        scraper = UntappdScraper(timeout=10, parser=parser, restrict=restrict)
+        strainers = []
+        make_soup = scraper._make_soup
+
+        def spy(response, parse_only=None):
+            strainers.append(parse_only)
+            return make_soup(response, parse_only)
+
+        scraper._make_soup = spy
+        # beer info is moved out of the subtrees kept by the strainer
+        page = read_fixture("beer.html").replace(b'<div class="box b_info">', b'<div class="box b_info"></div><div>')
+        result = scraper._parse_beer_page(1569404, page)
+
+        assert (result.name, result.abv, result.ibu) == ("Lost In Spice", 5.5, 20.0)
+        assert strainers == ([BEER_PAGE_STRAINER, None] if restrict else [None])
+
+    def test_broken_page(self, parser, restrict):
+        scraper = UntappdScraper(timeout=10, parser=parser, restrict=restrict)
+
+        assert scraper._parse_beer_page(1569404, b"<html><body></body></html>") is None
+        assert scraper._parse_search_page(b"") == []
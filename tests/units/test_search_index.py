@@ -0,0 +1,158 @@
+import pytest
+
+from app.untappd.cache import RedisCache
+from app.untappd.search_index import SearchIndex, tokenize
+from tests.units.helpers import FakeRedis, FakeClock, create_beer, create_brewery
+
+
+class FakeHashRedis(FakeRedis):
+    def __init__(self):
+        super().__init__()
+        self.hashes = {}
+
+    def hset(self, name, key, value):
+        self.hashes.setdefault(name, {})[key.encode()] = value.encode()
+        return 1
+
+    def hget(self, name, key):
+        return self.hashes.get(name, {}).get(key.encode())
+
+    def hdel(self, name, *keys):
+        return sum(self.hashes.get(name, {}).pop(key.encode(), None) is not None for key in keys)
+
+    def expire(self, key, ttl):
+        self.ttls[key] = ttl
+        return key in self.data
+
+    def hscan_iter(self, name, count=None):
+        return iter(list(self.hashes.get(name, {}).items()))
+
+
+def add_beer(index, beer_id, name, rating=3.5, raters=100):
+    beer = create_beer(beer_id)
+    beer.name = name
+    beer.rating = rating
+    beer.raters = raters
+    index.add(f"beer_{beer_id}", beer)
+
+
+@pytest.mark.units
+def test_tokenize_ignores_case_and_accents():
+    assert tokenize("Testbräu  Pale-Ale") == ["testbrau", "pale", "ale"]
+
+
+@pytest.mark.units
+def test_search_exact_and_fuzzy_words():
+    index = SearchIndex()
+    add_beer(index, 1, "Pliny the Elder")
+    add_beer(index, 2, "Heady Topper")
+
+    assert index.search("pliny elder", "beer") == [(1, 1.0)]
+    item_id, score = index.search("plinny the eldr", "beer")[0]
+    assert item_id == 1
+    assert 0.4 < score < 1.0
+    assert index.search("pliny", "brewery") == []
+    assert index.search("stout", "beer") == []
+
+
+@pytest.mark.units
+def test_search_ranks_equal_matches_by_rating_and_raters():
+    index = SearchIndex()
+    add_beer(index, 1, "Hazy IPA", rating=3.6, raters=10)
+    add_beer(index, 2, "Hazy IPA", rating=4.2, raters=5000)
+    add_beer(index, 3, "Hazy Pale Ale", rating=4.5, raters=9000)
+
+    assert [item_id for item_id, _ in index.search("hazy ipa", "beer", limit=3)] == [2, 1, 3]
+
+
+@pytest.mark.units
+def test_search_skips_items_below_min_score():
+    index = SearchIndex()
+    add_beer(index, 1, "Kalo Hazy IPA")
+    add_beer(index, 2, "Mira Hazy IPA")
+    add_beer(index, 3, "Kalo Stout")
+
+    assert [item_id for item_id, _ in index.search("kalo hazy ipa", "beer", limit=3)] == [1, 2, 3]
+    assert index.search("kalo hazy ipa", "beer", limit=3, min_score=0.8) == [(1, 1.0)]
+    assert index.search("kalo hazy ipa", "beer", limit=3, min_score=0.6) == [(1, 1.0), (2, pytest.approx(2 / 3))]
+
+
+@pytest.mark.units
+def test_update_and_remove_item():
+    index = SearchIndex()
+    add_beer(index, 1, "Old Name")
+    add_beer(index, 1, "New Name")
+
+    assert index.search("old", "beer") == []
+    assert index.search("new name", "beer") == [(1, 1.0)]
+    index.remove("beer_1")
+    assert index.search("new name", "beer") == []
+    assert len(index) == 0
+
+
+@pytest.mark.units
+def test_cache_writes_update_persisted_index():
+    redis = FakeHashRedis()
+    cache = RedisCache(redis, index=SearchIndex(redis))
+    cache.set_to_cache("brewery_405662", create_brewery())
+    cache.set_to_cache("beer_7", None)
+
+    assert cache.search_index("testbrau", "brewery", 5) == [(405662, 1.0)]
+    assert cache.search_index("testbrau", "beer", 5) == []
+
+    restored = SearchIndex(redis)
+    restored.load()
+    assert restored.search("Testbräu", "brewery") == [(405662, 1.0)]
+
+    cache.delete_from_cache("brewery_405662")
+    restored.refresh("brewery_405662")
+    assert restored.search("testbrau", "brewery") == []
+
+
+@pytest.mark.units
+def test_items_expire_with_cache_keys():
+    redis = FakeHashRedis()
+    clock = FakeClock()
+    cache = RedisCache(redis, ttl={"default": 50}, stale_ttl=10, index=SearchIndex(redis, clock=clock))
+    cache.set_to_cache("brewery_405662", create_brewery())
+    cache.set_to_cache("beer_1", create_beer(1))
+    clock.now = 30
+    cache.touch("beer_1")
+
+    clock.now = 60
+    assert cache.search_index("testbrau", "brewery", 5) == []
+    assert cache.search_index("lost in spice", "beer", 5) == [(1, 1.0)]
+    assert list(redis.hashes["search_index"]) == [b"beer_1"]
+    clock.now = 90
+    assert cache.search_index("lost in spice", "beer", 5) == []
+    assert redis.hashes["search_index"] == {}
+
+
+@pytest.mark.units
+def test_not_found_items_are_removed():
+    redis = FakeHashRedis()
+    cache = RedisCache(redis, index=SearchIndex(redis))
+    cache.set_many({"beer_1": create_beer(1), "beer_2": create_beer(2)})
+    cache.set_to_cache("beer_1", None)
+    cache.set_many({"beer_2": None})
+
+    assert cache.search_index("lost in spice", "beer", 5) == []
+    assert redis.hashes["search_index"] == {}
+
+
+@pytest.mark.units
+def test_load_deletes_expired_and_legacy_items():
+    redis = FakeHashRedis()
+    clock = FakeClock()
+    index = SearchIndex(redis, clock=clock)
+    add_beer(index, 1, "Lost In Spice")
+    index.add("beer_2", create_beer(2), ttl=10)
+    index.add("beer_3", create_beer(3), ttl=100)
+    redis.hset("search_index", "beer_4", '["Lost In Spice", 3.5, 100]')
+
+    clock.now = 50
+    restored = SearchIndex(redis, clock=clock)
+    restored.load()
+
+    assert sorted(item_id for item_id, _ in restored.search("lost in spice", "beer", limit=5)) == [1, 3]
+    assert sorted(redis.hashes["search_index"]) == [b"beer_1", b"beer_3"]
@@ -0,0 +1,110 @@
+import pytest
+import threading
+import time
+
+from app.untappd.single_flight import SingleFlight
+
+
+class FakeLockCache:
+    def __init__(self, locked=False):
+        self.locked = locked
+        self.released = []
+
+    def acquire_lock(self, key, ttl):
+        return None if self.locked else "token"
+
+    def release_lock(self, key, token):
+        self.released.append((key, token))
+        return True
+
+
+@pytest.mark.units
+class TestSingleFlight:
+    def test_concurrent_callers_share_one_fetch(self):
+        single_flight = SingleFlight(FakeLockCache(), timeout=1)
+        started = threading.Event()
+        calls = []
+        results = []
+
+        def fetch():
+            calls.append(True)
+            started.set()
+            time.sleep(0.1)
+            return "beer"
+
+        def call():
+            results.append(single_flight.do("beer_1", fetch))
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(1)
+        followers = [threading.Thread(target=call) for _ in range(4)]
+        for follower in followers:
+            follower.start()
+        for thread in [leader, *followers]:
+            thread.join()
+
+        assert calls == [True]
+        assert results == ["beer"] * 5
+        assert single_flight.stats()["coalesced_local"] == 4
+        assert single_flight.stats()["fetches"] == 1
+
+    def test_error_is_shared(self):
+        single_flight = SingleFlight(FakeLockCache(), timeout=1)
+        started = threading.Event()
+        calls = []
+        errors = []
+
+        def fetch():
+            calls.append(True)
+            started.set()
+            time.sleep(0.1)
+            raise KeyError("beer")
+
+        def call():
+            try:
+                single_flight.do("beer_1", fetch)
+            except KeyError as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(1)
+        followers = [threading.Thread(target=call) for _ in range(4)]
+        for follower in followers:
+            follower.start()
+        for thread in [leader, *followers]:
+            thread.join()
+
+        assert calls == [True]
+        assert len(errors) == 5 and all(error is errors[0] for error in errors)
+        assert single_flight.do("beer_1", lambda: "beer") == "beer"
+
+    def test_waits_for_other_process(self):
+        single_flight = SingleFlight(FakeLockCache(locked=True), lock_ttl=1, poll_interval=0.01)
+        lookups = iter([None, None, "cached beer"])
+
+        result = single_flight.do("beer_1", lambda: pytest.fail("fetched"), lookup=lambda: next(lookups))
+
+        assert result == "cached beer"
+        assert single_flight.stats()["coalesced_remote"] == 1
+
+    def test_fetches_when_other_process_is_too_slow(self):
+        single_flight = SingleFlight(FakeLockCache(locked=True), lock_ttl=0.05, poll_interval=0.01)
+
+        assert single_flight.do("beer_1", lambda: "beer", lookup=lambda: None) == "beer"
+        assert single_flight.stats()["timeouts"] == 1
+
+    def test_batch_waits_for_keys_of_other_process(self):
+        single_flight = SingleFlight(FakeLockCache(locked=True), lock_ttl=0.05, poll_interval=0.01)
+        fetched = []
+
+        def fetch(keys):
+            fetched.append(keys)
+            return {key: key.replace("beer_", "beer ") for key in keys}
+
+        result = single_flight.do_many(["beer_1", "beer_2"], fetch, lookup=lambda keys: {"beer_1": "cached beer"})
+
+        assert result == {"beer_1": "cached beer", "beer_2": "beer 2"}
+        assert fetched == [["beer_2"]]
+        assert single_flight.stats()["timeouts"] == 1
@@ -0,0 +1,215 @@
+import pytest
+import json
+import time
+from pathlib import Path
+from threading import Thread
+
+from telegram import Bot, Update, User
+from telegram.ext import TypeHandler
+from telegram.ext.dispatcher import run_async
+
+from app import beer_bot
+from app.bot.conversation import LocalConversationStore
+
+from app.bot.streams import UpdateStream, StreamWorker
+from app.bot.webhook import WebhookServer
+from tests.units.helpers import SECRET, create_beer, post
+
+fakeredis = pytest.importorskip("fakeredis")
+
+FIXTURES = Path(__file__).parent.parent / "fixtures" / "telegram"
+BOT = Bot("123:abc")
+
+
+class FakeDispatcher:
+    """Dispatcher with itself as the only handler"""
+
+    use_context = False
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.updates = []
+        self.groups = [0]
+        self.handlers = {0: [self]}
+
+    def check_update(self, update):
+        return True
+
+    def handle_update(self, update, dispatcher, check, context):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("Handler failed")
+        self.updates.append((update.effective_chat.id, update.update_id))
+
+
+def create_update(update_id, chat_id):
+    data = json.loads((FIXTURES / "search_update.json").read_text())
+    data["update_id"] = update_id
+    data["message"]["chat"]["id"] = chat_id
+    return Update.de_json(data, BOT)
+
+
+@pytest.fixture
+def stream():
+    return UpdateStream(fakeredis.FakeRedis(), prefix="updates", shards=4, maxlen=1000)
+
+
+def create_worker(stream, dispatcher, bot=BOT, **kwargs):
+    worker = StreamWorker(stream, dispatcher, bot, group="bot", batch=10, **kwargs)
+    worker.create_groups()
+    return worker
+
+
+@pytest.mark.units
+def test_updates_of_chat_are_handled_in_order(stream):
+    for update_id in range(6):
+        stream.put(create_update(update_id, chat_id=update_id % 2))
+    dispatcher = FakeDispatcher()
+    worker = create_worker(stream, dispatcher)
+
+    assert worker.poll() == 6
+    for chat_id in (0, 1):
+        chat_updates = [update_id for chat, update_id in dispatcher.updates if chat == chat_id]
+        assert chat_updates == [chat_id, chat_id + 2, chat_id + 4]
+    assert stream.qsize() == 0
+    assert worker.poll() == 0
+
+
+@pytest.mark.units
+def test_workers_share_shards(stream):
+    dispatchers = [FakeDispatcher(), FakeDispatcher()]
+    workers = [
+        create_worker(stream, dispatcher, index=index, workers=2) for index, dispatcher in enumerate(dispatchers)
+    ]
+    for chat_id in range(8):
+        stream.put(create_update(chat_id, chat_id=chat_id))
+
+    assert workers[0].keys == ["updates:0", "updates:2"]
+    assert [worker.poll() for worker in workers] == [4, 4]
+    assert {chat_id % 2 for chat_id, _ in dispatchers[0].updates} == {0}
+    assert {chat_id % 2 for chat_id, _ in dispatchers[1].updates} == {1}
+
+
+@pytest.mark.units
+def test_failed_update_is_redelivered_before_next_ones(stream):
+    for update_id in range(3):
+        stream.put(create_update(update_id, chat_id=4))
+    dispatcher = FakeDispatcher(failures=1)
+    worker = create_worker(stream, dispatcher)
+
+    assert worker.poll() == 0
+    assert stream.qsize() == 3
+    assert worker.poll() == 3
+    assert dispatcher.updates == [(4, 0), (4, 1), (4, 2)]
+    assert worker.stats()["failed"] == 1
+    assert worker.stats()["redelivered"] == 3
+
+
+@pytest.mark.units
+def test_update_is_moved_to_dead_stream(stream):
+    stream.put(create_update(1, chat_id=4))
+    stream.put(create_update(2, chat_id=4))
+    dispatcher = FakeDispatcher(failures=2)
+    worker = create_worker(stream, dispatcher, max_deliveries=2)
+
+    worker.poll()
+    worker.poll()
+    assert worker.poll() == 1
+    assert dispatcher.updates == [(4, 2)]
+    assert worker.stats()["dead"] == 1
+    [(_, fields)] = stream.redis.xrange(stream.dead_key)
+    assert json.loads(fields[b"update"])["update_id"] == 1
+    assert fields[b"stream"] == b"updates:0"
+
+
+@pytest.mark.units
+def test_stuck_update_is_claimed_from_other_consumer(stream):
+    stream.put(create_update(1, chat_id=4))
+    worker = create_worker(stream, FakeDispatcher(), claim_idle=60 * 1000)
+    # a worker of the previous deployment took the update and died
+    stream.redis.xreadgroup("bot", "worker-5", {"updates:0": ">"})
+    stream.put(create_update(2, chat_id=4))
+
+    assert worker.poll() == 0
+
+    dispatcher = FakeDispatcher()
+    worker = create_worker(stream, dispatcher, claim_idle=0)
+    assert worker.poll() == 2
+    assert dispatcher.updates == [(4, 1), (4, 2)]
+    assert worker.stats()["claimed"] == 1
+
+
+@pytest.mark.units
+def test_webhook_writes_updates_to_stream(stream):
+    server = WebhookServer(BOT, stream, path="/telegram", secret="secret", max_queue=1)
+    update_json = (FIXTURES / "search_update.json").read_text()
+
+    assert post(server, update_json, SECRET) == 200
+    assert post(server, update_json, SECRET) == 503
+
+    dispatcher = FakeDispatcher()
+    assert create_worker(stream, dispatcher).poll() == 1
+    assert dispatcher.updates == [(1111111, 10000)]
+
+
+@pytest.fixture
+def dispatcher(monkeypatch):
+    """The dispatcher of the bot, `run_async` needs it to be the only one"""
+    dispatcher = beer_bot.dispatcher
+    me = User(123, "Bot", is_bot=True, username="beer_bot")
+    monkeypatch.setattr(dispatcher.bot, "get_me", lambda *args, **kwargs: me)
+    Thread(target=dispatcher.start, daemon=True).start()
+    for _ in range(100):
+        if dispatcher.running:
+            break
+        time.sleep(0.01)
+    assert dispatcher.running
+    yield dispatcher
+    dispatcher.stop()
+
+
+@pytest.fixture
+def errors(dispatcher, monkeypatch):
+    errors = []
+    monkeypatch.setattr(dispatcher, "error_handlers", type(dispatcher.error_handlers)())
+    dispatcher.add_error_handler(lambda update, context: errors.append(str(context.error)))
+    return errors
+
+
+@pytest.mark.units
+def test_failed_async_handler_leaves_update_pending(stream, dispatcher, errors, monkeypatch):
+    @run_async
+    def handle(update, context):
+        raise RuntimeError("Handler failed")
+
+    monkeypatch.setattr(dispatcher, "handlers", {0: [TypeHandler(Update, handle)]})
+    monkeypatch.setattr(dispatcher, "groups", [0])
+    stream.put(create_update(1, chat_id=4))
+    worker = create_worker(stream, dispatcher, bot=dispatcher.bot)
+
+    assert worker.poll() == 0
+    assert errors == ["Handler failed"]
+    assert worker.stats()["failed"] == 1
+    assert stream.redis.xpending("updates:0", "bot")["pending"] == 1
+
+
+class FakeClient:
+    def search_item(self, query, search_type):
+        return [create_beer(1)]
+
+
+@pytest.mark.units
+def test_failed_reply_of_bot_leaves_update_pending(stream, dispatcher, errors, monkeypatch):
+    def send_message(*args, **kwargs):
+        raise RuntimeError("Reply failed")
+
+    monkeypatch.setattr(beer_bot, "_client", FakeClient())
+    monkeypatch.setattr(beer_bot, "_conversations", LocalConversationStore())
+    monkeypatch.setattr(dispatcher.bot, "send_chat_action", lambda *args, **kwargs: True)
+    monkeypatch.setattr(dispatcher.bot, "send_message", send_message)
+    stream.put(create_update(1, chat_id=4))
+    worker = create_worker(stream, dispatcher, bot=dispatcher.bot)
+
+    assert worker.poll() == 0
+    assert errors == ["Reply failed"]
+    assert stream.redis.xpending("updates:0", "bot")["pending"] == 1
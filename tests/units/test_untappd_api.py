@@ -0,0 +1,132 @@
+import pytest
+import asyncio
+import threading
+
+from aiohttp import ClientResponseError
+from multidict import CIMultiDict, CIMultiDictProxy
+
+from app.untappd.api import UntappdAPI
+from tests.units.helpers import run
+
+
+@pytest.mark.units
+class TestUntappdAPISearch:
+    @staticmethod
+    def beer_search_response(*beer_ids):
+        return {"response": {"beers": {"items": [{"beer": {"bid": beer_id}} for beer_id in beer_ids]}}}
+
+    @staticmethod
+    def brewery_search_response(*brewery_ids):
+        return {"response": {"brewery": {"items": [{"brewery": {"brewery_id": b_id}} for b_id in brewery_ids]}}}
+
+    def test_beer_search_keeps_ranking_order(self):
+        client = UntappdAPI(concurrency=3)
+        delays = {1: 0.03, 2: 0.01, 3: 0.02}
+
+        async def get_beer(beer_id):
+            await asyncio.sleep(delays[beer_id])
+            return beer_id
+
+        client.get_beer = get_beer
+        response = TestUntappdAPISearch.beer_search_response(1, 2, 3)
+        result = run(client._parse_beer_search(response, limit=3))
+
+        assert result == [1, 2, 3]
+
+    def test_beer_search_respects_concurrency(self):
+        client = UntappdAPI(concurrency=2)
+        running = []
+        peak = []
+
+        async def get_beer(beer_id):
+            running.append(beer_id)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(beer_id)
+            return beer_id
+
+        client.get_beer = get_beer
+        response = TestUntappdAPISearch.beer_search_response(1, 2, 3, 4, 5)
+        result = run(client._parse_beer_search(response, limit=5))
+
+        assert result == [1, 2, 3, 4, 5]
+        assert max(peak) == 2
+
+    def test_brewery_search_isolates_failures(self):
+        client = UntappdAPI()
+
+        async def get_brewery(brewery_id):
+            if brewery_id == 2:
+                raise KeyError("brewery")
+            if brewery_id == 3:
+                return None
+            return brewery_id
+
+        client.get_brewery = get_brewery
+        response = TestUntappdAPISearch.brewery_search_response(1, 2, 3, 4)
+        result = run(client._parse_brewery_search(response, limit=4))
+
+        assert result == [1, 4]
+
+    def test_broken_search_response(self):
+        client = UntappdAPI()
+        result = run(client._parse_beer_search({"response": {}}))
+
+        assert result == []
+
+
+class StatusSession:
+    def __init__(self, status):
+        self.status = status
+
+    async def get_json(self, url, **kwargs):
+        raise ClientResponseError(None, (), status=self.status)
+
+
+@pytest.mark.units
+class TestUntappdAPIErrors:
+    def test_missing_item_is_none(self):
+        client = UntappdAPI(session=StatusSession(404))
+
+        assert run(client.get_beer(1)) is None
+
+    def test_failed_request_is_raised(self):
+        client = UntappdAPI(session=StatusSession(500))
+
+        with pytest.raises(ClientResponseError):
+            run(client.get_brewery(1))
+
+
+class FakeResponse:
+    status = 200
+    headers = CIMultiDictProxy(CIMultiDict({"X-Ratelimit-Remaining": "60"}))
+
+
+class HookSession:
+    async def get_json(self, url, on_response=None, **kwargs):
+        on_response(FakeResponse())
+        return {"response": {}}
+
+
+class ThreadQuota:
+    def __init__(self):
+        self.observed = threading.Event()
+        self.thread = None
+
+    def observe(self, status, headers):
+        self.thread = threading.current_thread()
+        self.observed.set()
+
+
+@pytest.mark.units
+def test_quota_is_observed_outside_event_loop():
+    quota = ThreadQuota()
+    client = UntappdAPI(session=HookSession(), quota=quota)
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(client._get("https://api.untappd.com/v4/beer/info/1"))
+        assert quota.observed.wait(1)
+    finally:
+        loop.close()
+
+    assert quota.thread is not threading.current_thread()
@@ -0,0 +1,211 @@
+import pytest
+import asyncio
+import threading
+import fakeredis
+from pathlib import Path
+from aiohttp import ClientResponseError
+
+from app.untappd.backends import BackendSelector
+from app.untappd.cache import RedisCache
+from app.untappd.client import UntappdClient
+from app.untappd.scraper import AsyncUntappdScraper
+from app.utils.event_loop import EventLoopThread
+from tests.units.helpers import FakeRedis, FakeSession, create_beer, create_brewery
+
+FIXTURES = Path(__file__).parent.parent / "fixtures" / "untappd"
+
+
+class FakeAPI:
+    def __init__(self, known_ids, delay=0):
+        self.known_ids = known_ids
+        self.delay = delay
+        self.batches = []
+
+    async def get_beers(self, beer_ids):
+        self.batches.append(list(beer_ids))
+        await asyncio.sleep(self.delay)
+        return [create_beer(beer_id) for beer_id in beer_ids if beer_id in self.known_ids]
+
+
+@pytest.fixture
+def runner():
+    runner = EventLoopThread(timeout=1)
+    yield runner
+    runner.stop()
+
+
+@pytest.mark.units
+def test_get_items_fetches_only_misses_in_one_batch(runner):
+    redis = fakeredis.FakeRedis()
+    cache = RedisCache(redis)
+    api = FakeAPI(known_ids={2, 3})
+    client = UntappdClient(api=api, scraper=api, cache=cache, runner=runner)
+    cache.set_many({"beer_1": create_beer(1), "beer_4": None})
+
+    items = client.get_items([1, 2, 3, 4, 5], "beer")
+
+    assert [item.id for item in items] == [1, 2, 3]
+    assert api.batches == [[2, 3, 5]]
+    assert client.get_items([3, 2], "beer") == [create_beer(3), create_beer(2)]
+    assert api.batches == [[2, 3, 5]]
+
+
+@pytest.mark.units
+def test_concurrent_get_items_fetch_misses_once(runner):
+    api = FakeAPI(known_ids={1, 2, 3}, delay=0.1)
+    client = UntappdClient(api=api, scraper=api, cache=RedisCache(fakeredis.FakeRedis()), runner=runner)
+    results = []
+    users = [threading.Thread(target=lambda: results.append(client.get_items([1, 2, 3], "beer"))) for _ in range(3)]
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+
+    assert api.batches == [[1, 2, 3]]
+    assert results == [[create_beer(1), create_beer(2), create_beer(3)]] * 3
+
+
+@pytest.mark.units
+def test_brewery_by_beer_is_read_from_cache(runner):
+    cache = RedisCache(FakeRedis())
+    api = FakeAPI(known_ids=set())
+    client = UntappdClient(api=api, scraper=api, cache=cache, runner=runner)
+    brewery = create_brewery()
+    cache.set_many({"beer_1": create_beer(1), "brewery_405662": brewery})
+
+    assert client.get_brewery_by_beer(1) == brewery
+
+
+@pytest.mark.units
+def test_brewery_of_scraped_beer_is_found_by_beer(runner):
+    pages = {
+        "https://untappd.com/beer/1569404": (FIXTURES / "beer.html").read_bytes(),
+        "https://untappd.com/w/testbrau/405662": (FIXTURES / "brewery.html").read_bytes(),
+    }
+    session = FakeSession(pages)
+    scraper = AsyncUntappdScraper(timeout=10, session=session, rate=0)
+    redis = fakeredis.FakeRedis()
+    client = UntappdClient(api=UnavailableAPI(), scraper=scraper, cache=RedisCache(redis), runner=runner)
+
+    assert client.get_item(1569404, "beer").brewery.id == 0
+    assert client.get_brewery_by_beer(1569404).id == 405662
+    assert redis.get("brewery_0") is None
+    assert client.get_item(405662, "brewery").name == "Testbräu"
+    assert len(session.requested) == 3
+
+
+@pytest.mark.units
+def test_scraped_search_gives_best_match(runner):
+    pages = {
+        "https://untappd.com/search?q=lost&type=beer&sort=all": (FIXTURES / "search.html").read_bytes(),
+        "https://untappd.com/beer/1569404": (FIXTURES / "beer.html").read_bytes(),
+    }
+    session = FakeSession(pages)
+    scraper = AsyncUntappdScraper(timeout=10, session=session, rate=0)
+    redis = fakeredis.FakeRedis()
+    cache = RedisCache(redis)
+    client = UntappdClient(api=UnavailableAPI(), scraper=scraper, cache=cache, runner=runner)
+
+    result = client.search_item("lost", "beer")
+
+    assert [(beer.id, beer.name) for beer in result] == [(1569404, "Lost In Spice")]
+    assert len(session.requested) == 2
+    assert cache.get_search_result("lost", "beer") == [1569404]
+
+
+class SlowAPI:
+    async def search_beer(self, query):
+        await asyncio.sleep(0.5)
+        return [create_beer(1)]
+
+
+@pytest.mark.units
+def test_scraper_wins_search_hedge_with_same_entities(runner):
+    pages = {
+        "https://untappd.com/search?q=lost&type=beer&sort=all": (FIXTURES / "search.html").read_bytes(),
+        "https://untappd.com/beer/1569404": (FIXTURES / "beer.html").read_bytes(),
+    }
+    scraper = AsyncUntappdScraper(timeout=10, session=FakeSession(pages), rate=0)
+    backends = BackendSelector(hedge_delay=0.01)
+    client = UntappdClient(api=SlowAPI(), scraper=scraper, cache=None, runner=runner, backends=backends)
+
+    result = client.perform_action("search_beer", [], "lost")
+
+    assert [beer.id for beer in result] == [1569404]
+    assert result[0].abv is not None
+    assert backends.stats()["hedge_wins"] == 1
+
+
+class FakeQuota:
+    def __init__(self, granted):
+        self.granted = granted
+        self.calls = []
+
+    def acquire(self, cost=1, background=False):
+        self.calls.append((cost, background))
+        return self.granted
+
+
+class FailingAPI:
+    async def get_beer(self, beer_id):
+        raise ClientResponseError(None, (), status=500)
+
+
+class UnavailableAPI:
+    async def get_beer(self, beer_id):
+        raise ClientResponseError(None, (), status=503)
+
+    async def get_brewery_by_beer(self, beer_id):
+        raise ClientResponseError(None, (), status=503)
+
+    async def search_beer(self, query):
+        raise ClientResponseError(None, (), status=503)
+
+
+class FakeScraper:
+    async def get_beer(self, beer_id):
+        return create_beer(beer_id)
+
+
+@pytest.mark.units
+def test_low_quota_routes_to_scraper(runner):
+    quota = FakeQuota(granted=False)
+    client = UntappdClient(api=FailingAPI(), scraper=FakeScraper(), cache=None, runner=runner, quota=quota)
+
+    assert client.perform_action("get_beer", None, 1, background=True) == create_beer(1)
+    assert quota.calls == [(1, True)]
+
+
+@pytest.mark.units
+def test_api_errors_fall_back_to_scraper(runner):
+    client = UntappdClient(api=FailingAPI(), scraper=FakeScraper(), cache=None, runner=runner)
+
+    assert client.perform_action("get_beer", None, 1) == create_beer(1)
+
+
+class NotFoundAPI:
+    async def get_beer(self, beer_id):
+        return None
+
+
+class FailingScraper:
+    async def get_beer(self, beer_id):
+        raise ClientResponseError(None, (), status=503)
+
+
+@pytest.mark.units
+def test_failed_fetch_is_not_cached_as_not_found(runner):
+    redis = fakeredis.FakeRedis()
+    client = UntappdClient(api=FailingAPI(), scraper=FailingScraper(), cache=RedisCache(redis), runner=runner)
+
+    assert client.get_item(1, "beer") is None
+    assert redis.get("beer_1") is None
+
+
+@pytest.mark.units
+def test_not_found_item_is_cached(runner):
+    redis = fakeredis.FakeRedis()
+    client = UntappdClient(api=NotFoundAPI(), scraper=NotFoundAPI(), cache=RedisCache(redis), runner=runner)
+
+    assert client.get_item(1, "beer") is None
+    assert redis.get("beer_1") == b"null"
@@ -0,0 +1,88 @@
+import pytest
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from app.untappd.api import UntappdAPI
+from benchmarks.upstreams import UntappdStub, TelegramStub
+from tests.units.helpers import run
+
+
+@pytest.mark.units
+class TestUntappdStub:
+    def test_api_serves_catalog_beer(self):
+        stub = UntappdStub(latency=0, breweries=10)
+
+        async def get_beer():
+            async with TestServer(stub.make_app()) as server:
+                api = UntappdAPI(base_url=str(server.make_url("/v4")))
+                return await api.get_beer(42)
+
+        beer = run(get_beer())
+
+        assert beer.id == 42
+        assert beer.name == "Lost In Spice 42"
+        assert beer.brewery.id == 3
+        assert [similar.id for similar in beer.similar] == [44, 45, 46]
+
+    def test_search_is_stable(self):
+        stub = UntappdStub(beers=100, search_results=3)
+
+        assert stub.search_ids("Stout", 100) == stub.search_ids("stout", 100)
+        assert len(set(stub.search_ids("Stout", 100))) == 3
+        assert all(0 < beer_id <= 100 for beer_id in stub.search_ids("Porter", 100))
+
+    def test_rate_limit_and_errors(self):
+        stub = UntappdStub(latency=0, rate_limit=2, error_rate=0)
+
+        async def requests():
+            async with TestClient(TestServer(stub.make_app())) as client:
+                responses = [await client.get("/v4/brewery/info/1") for _ in range(3)]
+                page = await client.get("/beer/1")
+                stub.error_rate = 1
+                failed = await client.get("/brewery/1")
+                return [(r.status, r.headers.get("X-Ratelimit-Remaining")) for r in responses], page, failed.status
+
+        api_responses, page, failed = run(requests())
+
+        assert api_responses == [(200, "1"), (200, "0"), (429, "0")]
+        assert page.status == 200 and "X-Ratelimit-Remaining" not in page.headers
+        assert failed == 500
+        assert stub.stats == {"api_requests": 3, "page_requests": 2, "throttled": 1, "errors": 1}
+
+
+@pytest.mark.units
+class TestTelegramStub:
+    def test_messages_are_recorded_by_chat(self):
+        stub = TelegramStub()
+        markup = '{"inline_keyboard": [[{"text": "Brewery", "callback_data": "info_1_brewery"}]]}'
+
+        async def send():
+            async with TestClient(TestServer(stub.make_app())) as client:
+                response = await client.post(
+                    "/bot123:abc/sendMessage", json={"chat_id": 7, "text": "Beer", "reply_markup": markup}
+                )
+                await client.post("/bot123:abc/sendChatAction", json={"chat_id": 7, "action": "typing"})
+                return await response.json()
+
+        response = run(send())
+        reply = stub.replies(7).get_nowait()
+
+        assert response["result"]["chat"]["id"] == 7
+        assert response["result"]["text"] == "Beer"
+        assert reply["method"] == "sendMessage"
+        assert reply["reply_markup"]["inline_keyboard"][0][0]["callback_data"] == "info_1_brewery"
+        assert stub.replies(7).empty()
+
+    def test_updates_are_served_from_offset(self):
+        stub = TelegramStub()
+
+        async def poll():
+            async with TestClient(TestServer(stub.make_app())) as client:
+                for update_id in (1, 2):
+                    stub._push_update({"update_id": update_id})
+                first = await (await client.post("/bot123:abc/getUpdates", json={"offset": 0})).json()
+                second = await (await client.post("/bot123:abc/getUpdates", json={"offset": 2})).json()
+                empty = await (await client.post("/bot123:abc/getUpdates", json={"offset": 3, "timeout": 0.01})).json()
+                return first["result"], second["result"], empty["result"]
+
+        assert run(poll()) == ([{"update_id": 1}, {"update_id": 2}], [{"update_id": 2}], [])
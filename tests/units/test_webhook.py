@@ -0,0 +1,67 @@
+import pytest
+import json
+from pathlib import Path
+from queue import Queue
+
+from telegram import Bot
+
+from app.bot.webhook import WebhookServer
+from tests.units.helpers import SECRET, post
+
+FIXTURES = Path(__file__).parent.parent / "fixtures" / "telegram"
+
+
+@pytest.fixture
+def update_json():
+    return (FIXTURES / "search_update.json").read_text()
+
+
+@pytest.fixture
+def queue():
+    return Queue()
+
+
+@pytest.fixture
+def server(queue):
+    return WebhookServer(Bot("123:abc"), queue, path="/telegram", secret="secret", max_queue=2)
+
+
+@pytest.mark.units
+def test_recorded_update_is_queued(server, queue, update_json):
+    assert post(server, update_json, SECRET) == 200
+
+    update = queue.get_nowait()
+    assert update.update_id == 10000
+    assert update.message.text == "/search Lost In Spice"
+    assert update.effective_chat.id == 1111111
+
+
+@pytest.mark.units
+def test_wrong_secret_is_rejected(server, queue, update_json):
+    assert post(server, update_json) == 403
+    assert post(server, update_json, {"X-Telegram-Bot-Api-Secret-Token": "wrong"}) == 403
+    assert queue.empty()
+
+
+@pytest.mark.units
+def test_missing_secret_is_warned(queue, caplog):
+    server = WebhookServer(Bot("123:abc"), queue, path="/telegram", secret=None, host="127.0.0.1", port=0)
+    server.start()
+    server.stop()
+
+    assert "WEBHOOK_SECRET is not set" in caplog.text
+
+
+@pytest.mark.units
+def test_invalid_update_is_rejected(server, queue):
+    assert post(server, "not json", SECRET) == 400
+    assert post(server, json.dumps(None), SECRET) == 400
+    assert queue.empty()
+
+
+@pytest.mark.units
+def test_full_queue_refuses_updates(server, queue, update_json):
+    assert post(server, update_json, SECRET) == 200
+    assert post(server, update_json, SECRET) == 200
+    assert post(server, update_json, SECRET) == 503
+    assert queue.qsize() == 2